@@ -4,6 +4,7 @@ from distutils.command.config import config
 import subprocess
 import sys 
 import os
+import atexit
 from pathlib import Path
 import time 
 import argparse
@@ -12,6 +13,7 @@ import uuid
 import glob
 from datetime import datetime
 import json
+import re
 from rich.progress import Progress
 from pipeline_tools.submitSteps import submitMergingBW
 
@@ -25,12 +27,18 @@ sys.path.append(utils_tools_path)
 sys.path.append(scripts_path)
 from writeEmail import writeEmail
 from configParser import getConfigDict, dict2File
-from fastqTools import getFastqPrefix
+from sampleManifest import buildManifest, writeSampleManifest, listFiles, getProcessedSamples
 from slurmTools import *
 from dirCheck import * 
 from submitSteps import *
 from verbose import verbose as vrb
 from groupCheck import *
+from preflight import runPreflight
+from runDatabase import printStats, recordRun, getRunInfo
+from jobCheck import read_jobSummary
+from runMonitor import monitorRun
+from retrySupervisor import writeRetryJobs
+from submissionJournal import getJournal, getJournalFile
 
 # ===========================================================================================================
 DESC_COMMENT = "BraunLabPipeline"
@@ -71,6 +79,35 @@ if len(sys.argv) > 1:
     if sys.argv[1] == '-v':
         print('Pipeline version 1.00\n### BETA VERSION. USE IT WITH CAUTION!!!')
         sys.exit(0)
+    #If user is asking for the statistics of the previous runs
+    if sys.argv[1] == 'stats':
+        statsParser = argparse.ArgumentParser(prog="braunLP.py stats", description="Percentiles of the time, memory, cpu and I/O used by the jobs of each step and their trend across the runs recorded in the run database (run_db in the configuration file).")
+        statsParser.add_argument('-db', '--run-db', dest='runDB', type=str, help='Run database. Default: run_db of the configuration file')
+        statsParser.add_argument('-cf','--configuration-file', dest='config_file_path', type=str, help='Configuration file with the run_db key')
+        statsParser.add_argument('-step', '--step', dest='step', type=str, help='Only the steps whose name contains this string, i.e MAP_WAIT or bowtie2')
+        statsParser.add_argument('-runs', '--runs', dest='nRuns', type=int, default=10, help='Number of runs in the trends. Default: 10')
+        statsParser.add_argument('-th', '--threshold', dest='threshold', type=float, default=0.2, help='A step is flagged when its last run is this much slower than the previous ones. Default: 0.2, i.e 20%%')
+        statsArgs = statsParser.parse_args(sys.argv[2:])
+        runDB = statsArgs.runDB or (getConfigDict(statsArgs.config_file_path).get('run_db', "").strip() if statsArgs.config_file_path else "")
+        if not runDB:
+            statsParser.error("Give the run database with -db or a configuration file with the run_db key with -cf")
+        sys.exit(printStats(runDB, statsArgs.step, statsArgs.nRuns, statsArgs.threshold))
+    #If user is following the jobs of a run
+    if sys.argv[1] == 'monitor':
+        monitorParser = argparse.ArgumentParser(prog="braunLP.py monitor", description="Live table of the state of the jobs of a run per step and per sample, with the ETA of each step from the durations of the previous runs. The jobs are polled with a single sacct query.")
+        monitorParser.add_argument('uid', type=str, help='Unique ID of the run')
+        monitorParser.add_argument('-raw', '--raw-dir', dest='raw_dir', type=str, default=".", help='Raw directory of the run, or its output directory if one was given. Default: current directory')
+        monitorParser.add_argument('-cf','--configuration-file', dest='config_file_path', type=str, help='Configuration file of the run, for the step durations recorded in run_db or resource_history')
+        monitorParser.add_argument('-i', '--interval', dest='interval', type=int, default=60, help='Seconds between two polls. Default: 60')
+        monitorParser.add_argument('-a', '--all', dest='showAll', action="store_true", default=False, help='Show all the jobs of the samples, not only the running and failed ones')
+        monitorParser.add_argument('-1', '--once', dest='once', action="store_true", default=False, help='Print the state of the run once and exit')
+        monitorArgs = monitorParser.parse_args(sys.argv[2:])
+        try:
+            sys.exit(monitorRun(monitorArgs.uid, monitorArgs.raw_dir, getConfigDict(monitorArgs.config_file_path) if monitorArgs.config_file_path else {}, max(monitorArgs.interval, 10), monitorArgs.showAll, monitorArgs.once))
+        except FileNotFoundError as e:
+            monitorParser.error(str(e))
+        except KeyboardInterrupt:
+            sys.exit(0)
 
 parser.add_argument('-raw', '--raw-dir', dest='raw_dir',required=True, type=str, help='Absolute path to the raw directory')
 parser.add_argument('-fastq', '--fastq-dir', dest='fastq_dir', type=str, help='Absolut path fastq to diretor(y)ies. If multiple directories, separate eache path with space')
@@ -88,7 +125,13 @@ parser.add_argument('-cf','--configuration-file', dest='config_file_path', requi
 #parser.add_argument('-tb_dir', '--tb-dir', dest='backup_bam_dir', type=str, help='Path to backup bam diretory. This option in required if you want to perform a backup of bam files.')
 parser.add_argument('-t','--task', dest='task', type=str, required=True, nargs='+', help='')
 parser.add_argument('-rp', '--report',dest='reportTask',action="store_true", required=False, default=False, help="Whether to generate html report at the end of the run. Default: False")
-parser.add_argument('-n', '--dry-run', dest="dryRun", action="store_true", required=False, default=False, help="Runs pipeline without launching any jobs. Jobs are outputed, not executed. NOT IMPLEMENTED YET")
+parser.add_argument('-c', '--use-cache', dest="cache", action="store_true", required=False, default=False, help="Reuses the existing output directories and skips the jobs whose inputs, command and tools did not change since they last completed successfully. Default: False")
+parser.add_argument('-inc', '--incremental', dest="incremental", action="store_true", required=False, default=False, help="Adds new samples to an existing project. Implies --use-cache: only the new samples go through the per-sample steps (the samples whose filtered BAM and narrowPeak files already exist are skipped, whether or not the previous runs used the cache), and the peak counts of the existing samples are only recomputed for the peaks that changed in the consensus peak set. Default: False")
+parser.add_argument('-n', '--dry-run', dest="dryRun", action="store_true", required=False, default=False, help="Runs pipeline without launching any jobs. Jobs are outputed, not executed, and the execution plan of the run is written in json.")
+parser.add_argument('-plan', '--plan-file', dest="planFile", type=str, required=False, help="Json file where the dry run writes the execution plan. Default: {uid}_plan.json in the current directory")
+parser.add_argument('-sp', '--skip-preflight', dest="skipPreflight", action="store_true", required=False, default=False, help="Skips the checks of the input files, reference files and tools done before any job is submitted. Default: False")
+parser.add_argument('-resume', '--resume-submission', dest="resumeSubmission", type=str, required=False, help="Unique ID of a run whose submission stopped halfway (i.e lost SSH connection or sbatch failure). Run the pipeline again with the same arguments and this option: the jobs already queued according to the submission journal of the run are not submitted again and the other jobs wait for them")
+parser.add_argument('-dot', '--plan-dot', dest="planDot", type=str, required=False, help="Graphviz DOT file where the dry run writes the dependency graph of the jobs. Optional")
 
 ####################
 #    CHECK ARGS    #
@@ -116,23 +159,33 @@ else:
 configFileDict['pipeline_path'] = pipeline_path
 configFileDict['mail_script'] = f"{pipeline_tools_path}/sendEmail.py"
 configFileDict['jobCheck'] = f"{pipeline_tools_path}/jobCheck.py"
+configFileDict['arrayTaskScript'] = f"{pipeline_tools_path}/runArrayTask.py"
+configFileDict['cacheScript'] = f"{pipeline_tools_path}/resultCache.py"
+configFileDict['stageScript'] = f"{pipeline_tools_path}/scratchStaging.py"
+configFileDict['packScript'] = f"{pipeline_tools_path}/runPackedTasks.py"
+configFileDict['retrySupervisor'] = f"{pipeline_tools_path}/retrySupervisor.py"
 configFileDict['report'] = f"{pipeline_tools_path}/reportCreatorHTML.py"
-configFileDict['junctionMerge_script'] = f"{scripts_path}/merge_junctions.pl"
+configFileDict['junctionMerge_script'] = f"{pipeline_path}/mapping/run_STAR_2pass.py"
 configFileDict['extendReadsScript'] = f"{scripts_path}/extendBedReads.sh"
 configFileDict['ATACseqQC'] = f"{scripts_path}/fragmentSizeDist.R"
 configFileDict['ATACbamQC'] = f"{scripts_path}/atacQC_stats.R"
 configFileDict['bam2bed_script'] = f"{scripts_path}/bam2bed.sh"
 configFileDict['zipDirectoryScript'] = f"{pipeline_tools_path}/zipDirectory.py"
 configFileDict['combineCountScript'] = f"{scripts_path}/combinePeakCounts.py"
+configFileDict['updatePeakCountsScript'] = f"{scripts_path}/updatePeakCounts.py"
 configFileDict['combineQuanScript'] = f"{scripts_path}/featureCountsTObed.py"
 configFileDict['combineBamStatScript'] = f"{scripts_path}/createSamtoolsStatsTable.py"
 configFileDict['counts2GTF'] = f"{scripts_path}/counts2gtf.sh"
 configFileDict['signal_atac_script'] = f"{scripts_path}/signal_track_atac.py"
+configFileDict['splitFastqScript'] = f"{scripts_path}/splitFastq.py"
 # Python3 softwares. This assumes that the libraries were installed using pip3 install <software> --user 
 configFileDict['cutadapt'] = f"{str(Path.home())}/.local/bin/cutadapt"
 configFileDict['multiQC'] = f"{str(Path.home())}/.local/bin/multiqc"
 configFileDict['macs2'] = f"{str(Path.home())}/.local/bin/macs2"
 configFileDict['bamCoverage'] = f"{str(Path.home())}/.local/bin/bamCoverage"
+# The local executor runs the wsbatch commands itself, wsbatch does not need to be installed
+if configFileDict.get('executor', "slurm").strip() == "local":
+    configFileDict.setdefault('wsbatch', "wsbatch")
 
 #get list of tasks
 if not args.task:
@@ -177,12 +230,46 @@ if args.raw_dir == args.output_dir:
 
 #Create unique ID for the run
 configFileDict["uid"] = (str(uuid.uuid1())[:8])
+if args.resumeSubmission:
+    # The jobs of the run are found in its submission journal, written while its jobs were submitted
+    configFileDict["uid"] = args.resumeSubmission
+    configFileDict['resume_submission'] = "1"
+    if args.dryRun or not os.path.exists(getJournalFile(configFileDict)):
+        vrb.error(f"ERROR. Cannot resume the submission of the run {args.resumeSubmission}: {getJournalFile(configFileDict)} does not exist (or this is a dry run). Give the raw and output directories of the run.")
 
 # Add extra information to the dictionary
 configFileDict["pipeline_path"] = pipeline_path
 
 ### WHICH STEPS ARE GOING TO BE RAN AND CHECK WHETHER ALL DIRECTORIES WERE GIVEN 
 configFileDict['task_list'] = task_list 
+if args.incremental:
+    args.cache = True
+configFileDict['use_cache'] = "1" if args.cache else "0"
+configFileDict['dry_run'] = "1" if args.dryRun else "0"
+configFileDict['incremental'] = "1" if args.incremental else "0"
+# A resumed submission writes in the directories created by the run it resumes
+reuseDirs = args.cache or bool(args.resumeSubmission)
+reuseMessage = "Directory already exists. Cached results will be reused." if args.cache else "Directory already exists. The submission of the run is resumed."
+
+# Mapping, duplicate marking and filtering can be run as a single streamed job per sample
+fused = configFileDict.get('fused_mapping', "0").strip() == "1"
+if fused and not (configFileDict['mapper'] == "bowtie2" and all(task in task_list for task in ['2', '3', '4'])):
+    vrb.warning("WARNING! fused_mapping is only used with bowtie2 when steps 2, 3 and 4 are all run. The steps will be submitted separately.")
+    fused = False
+
+
+# STAR cannot insert junctions in a genome shared between jobs
+if configFileDict.get('star_shared_genome', "0").strip() == "1" and re.search(r"--twopassMode\s+Basic", configFileDict.get('STARoptions', "")):
+    vrb.warning("WARNING! star_shared_genome cannot be used with --twopassMode Basic in STARoptions. Each sample will be mapped by its own job.")
+    configFileDict['star_shared_genome'] = "0"
+if configFileDict.get('star_shared_genome', "0").strip() == "1" and configFileDict.get('star_two_pass', "0").strip() == "1":
+    vrb.warning("WARNING! star_shared_genome cannot be used with star_two_pass. Each sample will be mapped by its own job.")
+    configFileDict['star_shared_genome'] = "0"
+
+# The trimmed reads can only be streamed into bowtie2 when the mapping job of a sample reads all its fastq files
+if configFileDict.get('stream_trimming', "0").strip() == "1" and not (configFileDict['mapper'] == "bowtie2" and all(task in task_list for task in ['1', '2']) and int(configFileDict.get('map_chunks', "1").strip() or 1) <= 1):
+    vrb.warning("WARNING! stream_trimming is only used with bowtie2 when steps 1 and 2 are both run and the samples are not mapped in chunks. The trimmed fastq files will be written.")
+    configFileDict['stream_trimming'] = "0"
 
 
 ###### OUTPUTING PARAMETERS USED AND TASKS SELECTED TO RUN ########
@@ -191,6 +278,8 @@ print(f"//=========================={bcolors.BOLD} Pipeline Settings {bcolors.EN
 print("||")
 if args.dryRun: 
     print(f"||    * {bcolors.WARNING}Dry run ON{bcolors.ENDC}. Jobs are outputed on stdout and not run")
+    # The plan is also written if a step stops the run with an error
+    atexit.register(getExecutor(configFileDict).writePartialPlan, args.planFile or f"{configFileDict['uid']}_plan.json", args.planDot)
     
 print(f"||    * Processing {bcolors.OKCYAN}{bcolors.BOLD}{configFileDict['technology']}{bcolors.ENDC} data")
 if args.task == "all":
@@ -224,17 +313,38 @@ if args.bigwig_dir:
 if args.eq_dir: 
     print(f"||    * {bcolors.BOLD}quantification dir{bcolors.ENDC}: [{args.eq_dir}]")
 print("||")
+if args.fastq_dir:
+    # Single scan of the fastq directory: sample -> lanes -> R1/R2 files -> groups, used by all the steps of the run
+    buildManifest(configFileDict, args.fastq_dir)
 if configFileDict.get("groups") != None:
     groups = configFileDict.get("groups").split("|")
     groupsOK = True
     print(f"||    * {bcolors.BOLD}Groups for merged bigwig{bcolors.ENDC}: {groups}")
     print("f||    * Checking that groups exists...")
-    groupCheck(groups, args.fastq_dir)
+    if configFileDict.get('sample_manifest'):
+        for group, samples in configFileDict['sample_manifest']['groups'].items():
+            print(f"||      {group}: {len(samples)} samples")
 else:
     groupCheck = False
 
 print(f"//========================================================================\\\\")
 
+# ===========================================================================================================
+STEP0 = "PREFLIGHT CHECKS OF THE INPUTS BEFORE ANY DIRECTORY IS CREATED OR JOB SUBMITTED"
+# ===========================================================================================================
+
+if not args.skipPreflight:
+    print(f"\n  {bcolors.BOLD}* Preflight checks of the inputs{bcolors.ENDC}\n")
+    start = time.time()
+    nChecks, errors, warnings = runPreflight(configFileDict, task_list, args.fastq_dir, args.bam_dir, args.bed_dir, args.peaks_dir)
+    for warning in warnings:
+        vrb.warning(f"    WARNING: {warning}")
+    for error in errors:
+        print(f"    {bcolors.FAIL}ERROR: {error}{bcolors.ENDC}")
+    if errors:
+        vrb.error(f"  * Preflight checks failed: {len(errors)} errors in {nChecks} checks. Nothing was submitted. Fix them or rerun with --skip-preflight.")
+    print(f" * {bcolors.OKGREEN}{nChecks} preflight checks passed in {time.time() - start:.1f}s{bcolors.ENDC}")
+
 # ===========================================================================================================
 STEP1 = "CHECKING STEPS AND ADDING DIRECTORIES IN DICTIONARY AND CREATING THEM"
 # ===========================================================================================================
@@ -267,7 +377,9 @@ with Progress() as progress:
                 configFileDict['trimmed_fastq_dir'] = f"{args.output_dir}/trimmed_fastq_dir"
             else: 
                 configFileDict['trimmed_fastq_dir'] = f"{args.raw_dir}/trimmed_fastq"
-            if checkDir(configFileDict['trimmed_fastq_dir']):
+            if checkDir(configFileDict['trimmed_fastq_dir']) and reuseDirs:
+                vrb.bullet(reuseMessage)
+            elif checkDir(configFileDict['trimmed_fastq_dir']):
                 vrb.error("Directory already exists. We refuse to write in already existing directories to avoid ovewriting or erasing files by mistake.")
             else: 
                 createDir(configFileDict['trimmed_fastq_dir'], args.dryRun)
@@ -281,7 +393,9 @@ with Progress() as progress:
             if not args.fastq_dir:
                 vrb.error("ERROR. you need to specify a fastq directory.")
             else: 
-                if '1' in task_list: 
+                if '1' in task_list and configFileDict.get('stream_trimming', "0").strip() == "1":
+                    vrb.warning("WARNING! The trimmed reads are streamed into the mapping jobs (stream_trimming) and no trimmed fastq file is written. FastQC will only run on the raw fastq files.")
+                elif '1' in task_list: 
                     print("Will run FastQC on raw and trimmed fastq files")
                 else: 
                     configFileDict['fastq_dir'] = args.fastq_dir
@@ -292,7 +406,9 @@ with Progress() as progress:
             else: 
                 configFileDict['fastQC_dir'] = f"{args.raw_dir}/fastQC"
                 #print(configFileDict['fastQC_dir'])
-            if checkDir(configFileDict['fastQC_dir']): 
+            if checkDir(configFileDict['fastQC_dir']) and reuseDirs:
+                vrb.bullet(reuseMessage)
+            elif checkDir(configFileDict['fastQC_dir']):
                 vrb.error("Directory already exists. We refuse to write in already existing directories to avoid ovewriting or erasing files by mistake.")
             else: 
                 createDir(configFileDict['fastQC_dir'], args.dryRun)
@@ -318,7 +434,9 @@ with Progress() as progress:
                     configFileDict['bam_dir'] = f"{args.output_dir}/bam"
                 else: 
                     configFileDict['bam_dir'] = f"{args.raw_dir}/bam"
-                if checkDir(configFileDict['bam_dir']): 
+                if checkDir(configFileDict['bam_dir']) and reuseDirs:
+                    vrb.bullet(reuseMessage)
+                elif checkDir(configFileDict['bam_dir']):
                     vrb.error("Directory already exists. We refuse to write in already existing directories to avoid ovewriting or erasing files by mistake.")
                 else: 
                     createDir(configFileDict['bam_dir'], args.dryRun)
@@ -335,7 +453,9 @@ with Progress() as progress:
                     configFileDict['bam_dir'] = f"{args.output_dir}/bam"
                 else: 
                     configFileDict['bam_dir'] = f"{args.raw_dir}/bam"
-                if checkDir(configFileDict['bam_dir']): 
+                if checkDir(configFileDict['bam_dir']) and reuseDirs:
+                    vrb.bullet(reuseMessage)
+                elif checkDir(configFileDict['bam_dir']):
                     vrb.error("Directory already exists. We refuse to write in already existing directories to avoid ovewriting or erasing files by mistake.")
                 else: 
                     createDir(configFileDict['bam_dir'], args.dryRun)
@@ -359,7 +479,9 @@ with Progress() as progress:
                 configFileDict['marked_bam_dir'] = f"{args.output_dir}/marked_bam"
             else: 
                 configFileDict['marked_bam_dir'] = f"{args.raw_dir}/marked_bam"
-            if checkDir(configFileDict['marked_bam_dir']): 
+            if checkDir(configFileDict['marked_bam_dir']) and reuseDirs:
+                vrb.bullet(reuseMessage)
+            elif checkDir(configFileDict['marked_bam_dir']):
                 vrb.error("Directory already exists. We refuse to write in already existing directories to avoid ovewriting or erasing files by mistake.")
             else: 
                 createDir(configFileDict['marked_bam_dir'], args.dryRun)
@@ -381,7 +503,9 @@ with Progress() as progress:
                 configFileDict['filtered_bam_dir'] = f"{args.output_dir}/filtered_bam"
             else: 
                 configFileDict['filtered_bam_dir'] = f"{args.raw_dir}/filtered_bam"
-            if checkDir(configFileDict['filtered_bam_dir']): 
+            if checkDir(configFileDict['filtered_bam_dir']) and reuseDirs:
+                vrb.bullet(reuseMessage)
+            elif checkDir(configFileDict['filtered_bam_dir']):
                 vrb.error("Directory already exists. We refuse to write in already existing directories to avoid ovewriting or erasing files by mistake.")
             else: 
                 createDir(configFileDict['filtered_bam_dir'], args.dryRun)
@@ -401,7 +525,9 @@ with Progress() as progress:
                 configFileDict['bamQC_dir'] = f"{args.output_dir}/bamQC"
             else: 
                 configFileDict['bamQC_dir'] = f"{args.raw_dir}/bamQC"
-            if checkDir(configFileDict['bamQC_dir']): 
+            if checkDir(configFileDict['bamQC_dir']) and reuseDirs:
+                vrb.bullet(reuseMessage)
+            elif checkDir(configFileDict['bamQC_dir']):
                 vrb.error("Directory already exists. We refuse to write in already existing directories to avoid ovewriting or erasing files by mistake.")
             else: 
                 createDir(configFileDict['bamQC_dir'], args.dryRun)
@@ -422,7 +548,9 @@ with Progress() as progress:
                 configFileDict['bw_dir'] = f"{args.output_dir}/bigwig"
             else: 
                 configFileDict['bw_dir'] = f"{args.raw_dir}/bigwig"
-            if checkDir(configFileDict['bw_dir']): 
+            if checkDir(configFileDict['bw_dir']) and reuseDirs:
+                vrb.bullet(reuseMessage)
+            elif checkDir(configFileDict['bw_dir']):
                 vrb.error("Directory already exists. We refuse to write in already existing directories to avoid ovewriting or erasing files by mistake.")
             else: 
                 createDir(configFileDict['bw_dir'], args.dryRun)
@@ -443,7 +571,9 @@ with Progress() as progress:
                 configFileDict['bed_dir'] = f"{args.output_dir}/bed"
             else: 
                 configFileDict['bed_dir'] = f"{args.raw_dir}/bed"
-            if checkDir(configFileDict['bed_dir']): 
+            if checkDir(configFileDict['bed_dir']) and reuseDirs:
+                vrb.bullet(reuseMessage)
+            elif checkDir(configFileDict['bed_dir']):
                 vrb.error("Directory already exists. We refuse to write in already existing directories to avoid ovewriting or erasing files by mistake.")
             else: 
                 createDir(configFileDict['bed_dir'], args.dryRun)
@@ -464,7 +594,9 @@ with Progress() as progress:
                 configFileDict['extended_bed_dir'] = f"{args.output_dir}/extended_bed"
             else: 
                 configFileDict['extended_bed_dir'] = f"{args.raw_dir}/extended_bed"
-            if checkDir(configFileDict['extended_bed_dir']): 
+            if checkDir(configFileDict['extended_bed_dir']) and reuseDirs:
+                vrb.bullet(reuseMessage)
+            elif checkDir(configFileDict['extended_bed_dir']):
                 vrb.error("Directory already exists. We refuse to write in already existing directories to avoid ovewriting or erasing files by mistake.")
             else: 
                 createDir(configFileDict['extended_bed_dir'], args.dryRun)
@@ -485,7 +617,9 @@ with Progress() as progress:
                     configFileDict['peaks_dir'] = f"{args.output_dir}/peaks"
                 else: 
                     configFileDict['peaks_dir'] = f"{args.raw_dir}/peaks"
-                if checkDir(configFileDict['peaks_dir']): 
+                if checkDir(configFileDict['peaks_dir']) and reuseDirs:
+                    vrb.bullet(reuseMessage)
+                elif checkDir(configFileDict['peaks_dir']):
                     vrb.error("Directory already exists. We refuse to write in already existing directories to avoid ovewriting or erasing files by mistake.")
                 else: 
                     createDir(configFileDict['peaks_dir'], args.dryRun)
@@ -514,7 +648,9 @@ with Progress() as progress:
                     configFileDict['peakCounts_dir'] = f"{args.output_dir}/peakCounts"
                 else: 
                     configFileDict['peakCounts_dir'] = f"{args.raw_dir}/peakCounts"
-                if checkDir(configFileDict['peakCounts_dir']): 
+                if checkDir(configFileDict['peakCounts_dir']) and reuseDirs:
+                    vrb.bullet(reuseMessage)
+                elif checkDir(configFileDict['peakCounts_dir']):
                     vrb.error("Directory already exists. We refuse to write in already existing directories to avoid ovewriting or erasing files by mistake.")
                 else: 
                     createDir(configFileDict['peakCounts_dir'], args.dryRun)
@@ -539,7 +675,9 @@ with Progress() as progress:
                 configFileDict['quantification_dir'] = f"{args.output_dir}/quantification"
             else: 
                 configFileDict['quantification_dir'] = f"{args.raw_dir}/quantification"
-            if checkDir(configFileDict['quantification_dir']): 
+            if checkDir(configFileDict['quantification_dir']) and reuseDirs:
+                vrb.bullet(reuseMessage)
+            elif checkDir(configFileDict['quantification_dir']):
                 print("fuck")
                 vrb.error("Directory already exists. We refuse to write in already existing directories to avoid ovewriting or erasing files by mistake.")
             else: 
@@ -557,7 +695,9 @@ with Progress() as progress:
                 configFileDict['report_dir'] = f"{args.output_dir}/report"
             else: 
                 configFileDict['report_dir'] = f"{args.raw_dir}/report"
-            if checkDir(configFileDict['report_dir']):
+            if checkDir(configFileDict['report_dir']) and reuseDirs:
+                vrb.bullet(reuseMessage)
+            elif checkDir(configFileDict['report_dir']):
                 vrb.error("ERROR. The report directory already exist. We refuse to write in already existing directories to avoid ovewriting or erasing files by mistake.")
             else:
                 createDir(configFileDict['report_dir'], args.dryRun)
@@ -573,6 +713,12 @@ with Progress() as progress:
 
 vrb.boldBullet("Starting\n")
 print(bcolors.BOLD + "  * Unique ID of this run: " + bcolors.ENDC + bcolors.OKBLUE + str(configFileDict['uid']) + bcolors.ENDC + "\n")
+if configFileDict.get('sample_manifest') and not args.dryRun:
+    print(bcolors.BOLD + "  * Sample manifest: " + bcolors.ENDC + writeSampleManifest(configFileDict, configFileDict['raw_log']) + "\n")
+if args.incremental:
+    # The samples processed by the previous runs are skipped by the per-sample steps, whether or not these runs used the cache
+    configFileDict['processed_samples'] = getProcessedSamples(configFileDict)
+    print(bcolors.BOLD + "  * Samples already processed: " + bcolors.ENDC + (", ".join(configFileDict['processed_samples']) or "none") + "\n")
 #vrb.bullet(task_list)
 task_dico = {} ### Dictionary containing for each task the wait_key so that I can automatically find out which is the last run task and get the wait_key instead of checking all of them one by one with if statements.
 task_log_dico = {}
@@ -590,14 +736,15 @@ with Progress() as progress:
             vrb.boldBullet("Submitting trimming of reads.\n")   
             progress.update(task1, advance=1)
             
-            fastq_dir = configFileDict['fastq_dir']
-            FASTQ_FILES = getFastqPrefix(fastq_dir)
+            FASTQ_FILES = configFileDict['sample_prefix']
             #print(FASTQ_FILES)
             configFileDict['trim_log_files'] = [] 
-            configFileDict['sample_prefix'] = FASTQ_FILES
-            TRIM_WAIT = submitTrimming(configFileDict, FASTQ_FILES, args.dryRun)
+            if configFileDict.get('stream_trimming', "0").strip() == "1":
+                vrb.bullet("The reads are trimmed by the mapping jobs (stream_trimming).\n")
+                TRIM_WAIT = ""
+            else:
+                TRIM_WAIT = submitTrimming(configFileDict, FASTQ_FILES, args.dryRun)
             configFileDict['TRIM_WAIT'] = TRIM_WAIT
-            #submitJobCheck(configFileDict,'trim_log_files',TRIM_WAIT)
             task_dico['1'] = "TRIM_WAIT"
             
             task_log_dico['1'] = 'trim_log_files'
@@ -612,13 +759,11 @@ with Progress() as progress:
             configFileDict['fastqQC_log_files'] = []
             FASTQC_WAIT = submitFastQC(configFileDict, args.dryRun)
             configFileDict['FASTQC_WAIT'] = FASTQC_WAIT
-            #submitJobCheck(configFileDict, "fastqQC_log_files", FASTQC_WAIT)
             task_dico['1.1'] = "FASTQC_WAIT"
             
             vrb.boldBullet("Submitting multiqc to get all FastQC in a single report\n")
             configFileDict['multiqc_log_files'] = []
             FASTQC_WAIT = submitMultiQC(configFileDict, args.dryRun)
-            #submitJobCheck(configFileDict, "multiqc_log_files", MFASTQC_WAIT)    
             task_log_dico['1.1'] = 'fastqQC_log_files'
             
 
@@ -631,20 +776,22 @@ with Progress() as progress:
             progress.update(task1, advance=1)
             configFileDict['mapping_log_files'] = []
             if '1' not in task_list:
-                FASTQ_PREFIX=getFastqPrefix(configFileDict['fastq_dir'])
-                FASTQ_PATH=configFileDict['fastq_dir']
-                configFileDict['sample_prefix'] = FASTQ_PREFIX # What if For trimming and mapping steps I created a list with all sample IDs in configFileDict so that I can just read it from there instead of creating variables all the time?? an just 
+                FASTQ_PREFIX=configFileDict['sample_prefix']
+                FASTQ_PATH=configFileDict['sample_manifest']['fastq_dir'] # What if For trimming and mapping steps I created a list with all sample IDs in configFileDict so that I can just read it from there instead of creating variables all the time?? an just 
             else:
-                FASTQ_PREFIX=getFastqPrefix(configFileDict['fastq_dir'])
-                configFileDict['sample_prefix'] = FASTQ_PREFIX
-                if configFileDict['technology'] == "ChIPseq" or configFileDict['technology'] == "ATACseq":
+                FASTQ_PREFIX=configFileDict['sample_prefix']
+                if configFileDict.get('stream_trimming', "0").strip() == "1":
+                    FASTQ_PATH=configFileDict['sample_manifest']['fastq_dir']
+                elif configFileDict['technology'] == "ChIPseq" or configFileDict['technology'] == "ATACseq":
                     FASTQ_PATH=configFileDict['trimmed_fastq_dir']                    
                 elif configFileDict['technology'] == "RNAseq" and configFileDict['RNAkit'] == "Colibri":
                     FASTQ_PATH=configFileDict['trimmed_fastq_dir']
                 else: 
                     FASTQ_PATH=configFileDict['fastq_dir']
                     
-            if configFileDict["mapper"] == "bowtie2":
+            if fused:
+                MAP_WAIT = submitFusedMappingBowtie(configFileDict, FASTQ_PREFIX, FASTQ_PATH, args.dryRun)
+            elif configFileDict["mapper"] == "bowtie2":
                 MAP_WAIT = submitMappingBowtie(configFileDict, FASTQ_PREFIX, FASTQ_PATH, args.dryRun)
             elif configFileDict['mapper'] == "STAR":
                 MAP_WAIT = submitMappingSTAR(configFileDict, FASTQ_PREFIX, FASTQ_PATH,args.dryRun)    
@@ -652,7 +799,6 @@ with Progress() as progress:
                 vrb.error("You need to specify a mapper")
             
             configFileDict['MAP_WAIT'] = MAP_WAIT                
-            #submitJobCheck(configFileDict,'mapping_log_files',MAP_WAIT)
             task_dico['2'] = "MAP_WAIT"
             
             task_log_dico['2'] = 'mapping_log_files'
@@ -665,15 +811,17 @@ with Progress() as progress:
             vrb.boldBullet("Submitting PCR duplication detection using PICARD\n")
             progress.update(task1, advance=1)
             configFileDict['pcr_log_files'] = []
-            if '2' in task_list:
+            if fused:
+                vrb.bullet("Duplicates are marked by the fused mapping job\n")
+                configFileDict['PCR_DUPLICATION_WAIT'] = configFileDict['MAP_WAIT']
+            elif '2' in task_list:
                 BAM_FILES = ["{}/{}.Aligned.sortedByCoord.bam".format(configFileDict['bam_dir'],i) for i in configFileDict['sample_prefix']]
                 PCR_DUPLICATION_WAIT = submitPCRduplication(configFileDict,BAM_FILES, args.dryRun)
                 configFileDict['PCR_DUPLICATION_WAIT'] = PCR_DUPLICATION_WAIT
             else:        
-                BAM_FILES = glob.glob("{}/*.bam".format(configFileDict['bam_dir']))
+                BAM_FILES = listFiles(configFileDict['bam_dir'], ".bam")
                 PCR_DUPLICATION_WAIT = submitPCRduplication(configFileDict,BAM_FILES, args.dryRun)
                 configFileDict['PCR_DUPLICATION_WAIT'] = PCR_DUPLICATION_WAIT
-            #submitJobCheck(configFileDict,'pcr_log_files',PCR_DUPLICATION_WAIT)
             task_dico['3'] = "PCR_DUPLICATION_WAIT" 
             
             task_log_dico['3'] = 'pcr_log_files'
@@ -686,15 +834,17 @@ with Progress() as progress:
             vrb.boldBullet("Submitting filtering and sorting of BAM files\n")
             progress.update(task1, advance=1)
             configFileDict['filtering_log_files'] = []
-            if '3' not in task_list:    
-                BAM_FILES = glob.glob("{}/*.bam".format(configFileDict['marked_bam_dir']))
+            if fused:
+                vrb.bullet("Reads are filtered by the fused mapping job\n")
+                configFileDict['FILTER_BAM_WAIT'] = configFileDict['MAP_WAIT']
+            elif '3' not in task_list:    
+                BAM_FILES = listFiles(configFileDict['marked_bam_dir'], ".bam")
                 FILTER_BAM_WAIT = submitFilteringBAM(configFileDict, BAM_FILES, args.dryRun)
                 configFileDict['FILTER_BAM_WAIT'] = FILTER_BAM_WAIT
             else:
                 BAM_FILES = ["{}/{}.sortedByCoord.Picard.bam".format(configFileDict['marked_bam_dir'], i) for i in configFileDict['sample_prefix']]
                 FILTER_BAM_WAIT = submitFilteringBAM(configFileDict, BAM_FILES, args.dryRun)
                 configFileDict['FILTER_BAM_WAIT'] = FILTER_BAM_WAIT
-            #submitJobCheck(configFileDict,'filtering_log_files',FILTER_BAM_WAIT)
             task_dico['4'] = "FILTER_BAM_WAIT"
             
             task_log_dico['4'] = 'filtering_log_files'
@@ -708,7 +858,7 @@ with Progress() as progress:
             progress.update(task1, advance=1)
             configFileDict['atacQC_log_files'] = []
             if '4' not in task_list:
-                BAM_FILES = glob.glob("{}/*.bam".format(configFileDict['filtered_bam_dir']))
+                BAM_FILES = listFiles(configFileDict['filtered_bam_dir'], ".bam")
                 ATACQC_WAIT = submitATACseqQC(configFileDict, BAM_FILES, args.dryRun)
                 configFileDict['ATACQC_WAIT'] = ATACQC_WAIT
             else: 
@@ -729,7 +879,7 @@ with Progress() as progress:
             configFileDict['bamQC_log_files'] = []
             
             if '4' not in task_list and configFileDict['technology'] != "RNAseq":
-                BAM_FILES = glob.glob("{}/*.bam".format(configFileDict['filtered_bam_dir']))
+                BAM_FILES = listFiles(configFileDict['filtered_bam_dir'], ".bam")
                 if configFileDict['technology'] == "ATACseq" or configFileDict['technology'] == "ChIPseq":
                     BAMQC_WAIT = submitBamQC(configFileDict, BAM_FILES, args.dryRun)
                     BAMQC_WAIT2 = submitSamtoolsBamQC(configFileDict, BAM_FILES, args.dryRun)
@@ -740,7 +890,15 @@ with Progress() as progress:
                 else:
                     vrb.error("You need to specify a proper technology.")
             else:
-                if configFileDict['technology'] == "ATACseq" or configFileDict['technology'] == "ChIPseq":
+                if fused and configFileDict['technology'] in ["ATACseq", "ChIPseq"]:
+                    # The fused job only writes the filtered BAM files, and the sorted and marked ones with keep_intermediate_bam
+                    BAM_FILES = ["{}/{}.QualTrim_NoDup_NochrM_SortedByCoord.bam".format(configFileDict['filtered_bam_dir'], i) for i in configFileDict['sample_prefix']]
+                    if configFileDict.get('keep_intermediate_bam', "0").strip() == "1":
+                        BAM_FILES += ["{}/{}.sortedByCoord.markdup.bam".format(configFileDict['marked_bam_dir'], i) for i in configFileDict['sample_prefix']] + ["{}/{}.Aligned.sortedByCoord.bam".format(configFileDict['bam_dir'], i) for i in configFileDict['sample_prefix']]
+                    BAMQC_WAIT = submitBamQC(configFileDict, BAM_FILES, args.dryRun)
+                    BAMQC_WAIT2 = submitSamtoolsBamQC(configFileDict, BAM_FILES, args.dryRun)
+                    configFileDict['BAMQC_WAIT'] = BAMQC_WAIT + ',' + BAMQC_WAIT2
+                elif configFileDict['technology'] == "ATACseq" or configFileDict['technology'] == "ChIPseq":
                     BAM_FILES = ["{}/{}.QualTrim_NoDup_NochrM_SortedByCoord.bam".format(configFileDict['filtered_bam_dir'], i) for i in configFileDict['sample_prefix']] + ["{}/{}.sortedByCoord.Picard.bam".format(configFileDict['marked_bam_dir'], i) for i in configFileDict['sample_prefix']] + ["{}/{}.sortedByCoord.bam".format(configFileDict['bam_dir'], i) for i in configFileDict['sample_prefix']]
                 
                 
@@ -769,7 +927,7 @@ with Progress() as progress:
             progress.update(task1, advance=1)
             configFileDict['bw_log_files'] = []
             if '4' not in task_list and configFileDict['technology'] != "RNAseq":
-                BAM_FILES = glob.glob("{}/*.bam".format(configFileDict['filtered_bam_dir']))
+                BAM_FILES = listFiles(configFileDict['filtered_bam_dir'], ".bam")
                 BAM2BW_WAIT = submitBAM2BW(configFileDict, BAM_FILES, args.dryRun)
                 configFileDict['BAM2BW_WAIT'] = BAM2BW_WAIT
             else: 
@@ -787,7 +945,6 @@ with Progress() as progress:
                     configFileDict['BAM2BW_WAIT'] = BAM2BW_WAIT
                     
             
-            #submitJobCheck(configFileDict,'bw_log_files',BAM2BW_WAIT)
             task_dico['5'] = "BAM2BW_WAIT"
             task_log_dico['5'] = 'bw_log_files'
             
@@ -801,14 +958,13 @@ with Progress() as progress:
             progress.update(task1, advance=1)
             configFileDict['bam2bed_log_files'] = []
             if '4' not in task_list:
-                BAM_FILES = glob.glob("{}/*.bam".format(configFileDict['filtered_bam_dir']))
+                BAM_FILES = listFiles(configFileDict['filtered_bam_dir'], ".bam")
                 BAM2BED_WAIT = submitBAM2BED(configFileDict, BAM_FILES, args.dryRun)
                 configFileDict['BAM2BED_WAIT'] = BAM2BED_WAIT
             else: 
                 BAM_FILES = ["{}/{}.QualTrim_NoDup_NochrM_SortedByCoord.bam".format(configFileDict['filtered_bam_dir'], i) for i in configFileDict['sample_prefix']]
                 BAM2BED_WAIT = submitBAM2BED(configFileDict, BAM_FILES, args.dryRun)
                 configFileDict['BAM2BED_WAIT'] = BAM2BED_WAIT
-            #submitJobCheck(configFileDict,'bam2bed_log_files',BAM2BED_WAIT)
             task_dico['6'] = "BAM2BED_WAIT"
             
             task_log_dico['6'] = 'bam2bed_log_files'
@@ -823,14 +979,13 @@ with Progress() as progress:
             progress.update(task1, advance=1)
             configFileDict['extend_log_files'] = []
             if '4' not in task_list:
-                BED_FILES = glob.glob("{}/*.bed".format(configFileDict['bed_dir']))
+                BED_FILES = listFiles(configFileDict['bed_dir'], ".bed")
                 EXT_BED_WAIT = submitExtendReads(configFileDict, BED_FILES, args.dryRun)
                 configFileDict['EXT_BED_WAIT'] = EXT_BED_WAIT
             else: 
                 BED_FILES = ["{}/{}.bed".format(configFileDict['bed_dir'], i) for i in configFileDict['sample_prefix']]
                 EXT_BED_WAIT = submitExtendReads(configFileDict, BED_FILES, args.dryRun)
                 configFileDict['EXT_BED_WAIT'] = EXT_BED_WAIT
-            #submitJobCheck(configFileDict,'extend_log_files',EXT_BED_WAIT)   
             
             task_dico["7"] = "EXT_BED_WAIT"
             task_log_dico['7'] = 'extend_log_files'
@@ -845,7 +1000,7 @@ with Progress() as progress:
             configFileDict['peak_log_files'] = []
             if configFileDict['technology'] == "ATACseq":
                 if '4' not in task_list or '1' not in task_list: 
-                    BAM_FILES = glob.glob("{}/*.bam".format(configFileDict['filtered_bam_dir']))
+                    BAM_FILES = listFiles(configFileDict['filtered_bam_dir'], ".bam")
                     print(BAM_FILES)
                     PEAK_CALLING_WAIT = submitPeakCalling(configFileDict, BAM_FILES, args.dryRun)
                     configFileDict['PEAK_CALLING_WAIT'] = PEAK_CALLING_WAIT
@@ -857,10 +1012,9 @@ with Progress() as progress:
                     
                     PEAK_CALLING_WAIT = submitPeakCalling(configFileDict, BAM_FILES, args.dryRun)
                     configFileDict['PEAK_CALLING_WAIT'] = PEAK_CALLING_WAIT
-            #submitJobCheck(configFileDict,'peak_log_files',PEAK_CALLING_WAIT)
             elif configFileDict['technology'] == "ChIPseq":
                 if '4' not in task_list or '1' not in task_list: 
-                    FILES = glob.glob("{}/*.bam".format(configFileDict['filtered_bam_dir']))
+                    FILES = listFiles(configFileDict['filtered_bam_dir'], ".bam")
                     INPUTS= sorted([i for i in FILES if os.path.basename(i).split("_")[0] == "Input"])
                     SAMPLE_BAM = sorted([i for i in FILES if os.path.basename(i).split("_")[0] != "Input"])
                     BAM_FILES = [(i,j) for i,j in zip(SAMPLE_BAM,INPUTS) if os.path.basename(i).split(".")[0] == os.path.basename(j).split(".")[0].split("_")[1]]
@@ -916,14 +1070,18 @@ with Progress() as progress:
                     NARROWPEAK_FILES = ["{outputDir}/{samples}.MACS/{samples}_peaks.narrowPeak".format(outputDir = configFileDict['peaks_dir'], samples = i) for i in configFileDict['sample_prefix'] if i.split("_")[0] != "Input"]
             
             if '4' not in task_list or '1' not in task_list:
-                BAM_FILES = glob.glob("{}/*.bam".format(configFileDict['filtered_bam_dir']))
+                BAM_FILES = listFiles(configFileDict['filtered_bam_dir'], ".bam")
             else:
                 BAM_FILES = ["{}/{}.QualTrim_NoDup_NochrM_SortedByCoord.bam".format(configFileDict['filtered_bam_dir'], i) for i in configFileDict['sample_prefix']]
+            
+            if args.incremental:
+                # The samples of the previous runs are part of the consensus peak set even if their fastq files are not in the fastq directory anymore
+                NARROWPEAK_FILES += [i for i in glob.glob("{}/*.MACS/*.narrowPeak".format(configFileDict['peaks_dir'])) if i not in NARROWPEAK_FILES]
+                BAM_FILES += [i for i in listFiles(configFileDict['filtered_bam_dir'], ".bam") if i not in BAM_FILES]
                 
             
             PEAK2COUNT_CALLING_WAIT = submitPeak2Counts(configFileDict, NARROWPEAK_FILES,BAM_FILES, args.dryRun)
             configFileDict['PEAK2COUNT_CALLING_WAIT'] = PEAK2COUNT_CALLING_WAIT
-            #submitJobCheck(configFileDict,'peak2Count_log_files',PEAK2COUNT_CALLING_WAIT)
             
             task_dico["8.1"] = "PEAK2COUNT_CALLING_WAIT"
             task_log_dico['8.1'] = 'peak2Count_log_files'
@@ -938,7 +1096,7 @@ with Progress() as progress:
             progress.update(task1, advance=1)
             configFileDict['quant_log_files'] = []
             if '2' not in task_list:
-                BAM_FILES = glob.glob("{}/*.bam".format(configFileDict['bam_dir']))
+                BAM_FILES = listFiles(configFileDict['bam_dir'], ".bam")
                 QUANT_WAIT = submitExonQuantification(configFileDict, BAM_FILES, args.dryRun)
                 configFileDict['QUANT_WAIT'] = QUANT_WAIT
                 
@@ -993,8 +1151,9 @@ with Progress() as progress:
             outputDir = configFileDict['output_dir'] if args.output_dir else configFileDict['raw_dir']    
             reportDir = configFileDict['report_dir']
             
-            dict2File(configFileDict,f"{reportDir}/configFileDict.json")
-            dict2File(task_log_dico,f"{reportDir}/task_log_dico.json")
+            if not args.dryRun:
+                dict2File(configFileDict,f"{reportDir}/configFileDict.json")
+                dict2File(task_log_dico,f"{reportDir}/task_log_dico.json")
             
             configFileDict['report_log_file'] = []
             
@@ -1023,13 +1182,10 @@ with Progress() as progress:
             
             SLURM = "{wsbatch} --dependency=afterok:{JID} -o {output_dir}/slurm-%j.out --wrap=\"{cmd}\"".format(wsbatch=configFileDict['wsbatch'], JID = wait_condition, cmd=CMD, output_dir = f"{reportDir}/log")
         
-            if args.dryRun:
-                print(SLURM)
-            else:
-                out = subprocess.check_output(SLURM, shell=True, universal_newlines=True,stderr=subprocess.STDOUT)
-                REPORT_WAIT = "".join(catchJID(out))
-                configFileDict['REPORT_WAIT'] = REPORT_WAIT
-                configFileDict['report_log_file'].append(getSlurmLog("{}/log".format(configFileDict["report_dir"]),configFileDict['uid'],out))
+            out = submitJob(configFileDict, SLURM)
+            REPORT_WAIT = "".join(catchJID(out))
+            configFileDict['REPORT_WAIT'] = REPORT_WAIT
+            configFileDict['report_log_file'].append(getSlurmLog("{}/log".format(configFileDict["report_dir"]),configFileDict['uid'],out))
             
             task_dico['report'] = "REPORT_WAIT"
             task_log_dico['report'] = 'report_log_file'
@@ -1073,10 +1229,25 @@ DONE_CMD = "python3 {mail} -add {addresses} -subject {subject} -msg '{msg}' -joi
 
 
 SLURM_CMD = "{wsbatch} -o {raw_log}/{uid}_slurm-%j.out --dependency=afterok:{JID} --wrap=\"{cmd}\"".format(wsbatch = configFileDict['wsbatch'], raw_log = configFileDict['raw_log'], uid = configFileDict['uid'],JID = wait_condition, cmd = DONE_CMD)
+out = submitJob(configFileDict, SLURM_CMD)
 if args.dryRun:
-    print(SLURM_CMD)
+    # The dry run only wrote the execution plan of the run
+    plan = getExecutor(configFileDict).writePlan(args.planFile or f"{configFileDict['uid']}_plan.json", args.planDot)
+    print("Execution plan: {jobs} jobs ({tasks} tasks), {core_hours} core-hours requested, critical path of {critical_path_hours} hours".format(**plan['summary']))
 else:
-    out = subprocess.check_output(SLURM_CMD, shell=True, universal_newlines=True, stderr=subprocess.STDOUT)
+    if args.resumeSubmission and getJournal(configFileDict):
+        journal = getJournal(configFileDict)
+        if journal.unconfirmed:
+            vrb.warning("WARNING! {} job(s) were being submitted when the submission stopped and were submitted again. Check with squeue that they are not queued twice.".format(len(journal.unconfirmed)))
+        print("Submission of the run {} resumed: {} job(s) already queued, {} job(s) submitted".format(configFileDict['uid'], journal.replayed, journal.submitted))
+    if configFileDict.get('retry_files'):
+        # The supervisor also moves the report and the mail onto the resubmitted jobs
+        writeRetryJobs(configFileDict, configFileDict['retry_files'])
+    # With the local executor the jobs run in this process, wait for them to finish
+    getExecutor(configFileDict).wait()
+    if getExecutor(configFileDict).writesJobSummary and configFileDict.get('run_db', "").strip():
+        # The jobs did not go through the jobCheck.py job, their summaries are read from their log files
+        recordRun(configFileDict['run_db'].strip(), getRunInfo(configFileDict), {logFile: read_jobSummary(logFile) for logFile in logFiles}, configFileDict.get('job_telemetry', {}))
 
 ## ALL DONE :) 
 
@@ -1,90 +1,113 @@
-#!/usr/bin/env python3 
-import subprocess
-import sys 
-import glob
-import os
-import math
+#!/usr/bin/env python3
+
 import argparse
-from pipeline_tools.slurmTools import catchJID
-import json
-
-pipeline_path = sys.path[0]
-pipeline_tools_path = os.path.abspath(pipeline_path + "/pipeline_tools")
-sys.path.append(pipeline_tools_path)
-from slurmTools import *
-from submitSteps import submitJobCheck
-
-
-def STAR_1pass(configFileDict):
-    FIRST_PASS_JID_LST = []
-    
-    for sample in configFileDict['sample_prefix']:
-        
-        outputFilePrefix = f"{sample}.1pass"
-        
-        MAP_CMD ="{STAR} {parameters} --outFileNamePrefix {outputFilePrefix} --genomeDir {referenceGenome}  --readFilesIn {smp}*_R1_001.fastq.gz {smp}*_R2_001.fastq.gz --readFilesCommand zcat --runThreadN 8 --outSAMtype BAM Unsorted --outSJfilterReads Unique".format(STAR = configFileDict['STAR'], parameters = configFileDict['1pass'], referenceGenome = configFileDict['reference_genome'], smp=sample, outputFilePrefix=outputFilePrefix)
-        
-        if '1' in configFileDict['task_list']: 
-            SLURM_CMD = "{wsbatch} {slurm} -o {log_dir}/{uid}_slurm-%j.out --dependency=afterany:{JID} --wrap=\"{cmd}\"".format(wsbatch = configFileDict["wsbatch"], slurm = configFileDict["slurm_mapping"], log_dir = "{}/log".format(configFileDict['bam_dir']), uid = configFileDict["uid"], cmd = MAP_CMD, JID=configFileDict["TRIM_WAIT"])
-            print(SLURM_CMD)
-        else: 
-            SLURM_CMD = "{wsbatch} {slurm} -o {log_dir}/{uid}_slurm-%j.out --wrap=\"{cmd}\"".format(wsbatch = configFileDict["wsbatch"], slurm = configFileDict["slurm_mapping"], log_dir = f"{configFileDict['bam_dir']}/log", uid = configFileDict["uid"], cmd = MAP_CMD)
-            print(SLURM_CMD)
-        
-        
-        out = subprocess.check_output(SLURM_CMD, shell=True, universal_newlines= True, stderr=subprocess.STDOUT)
-        FIRST_PASS_JID_LST.append(catchJID(out))
-        
-    FIRST_PASS_WAIT = ",".join(FIRST_PASS_JID_LST)
-    return FIRST_PASS_WAIT
-
-
-def STAR_createTABfile(configFileDict):
-    #run the perl script to merge junctions and save in raw file, then filter junctions and sort and create new junctions file that is going to be used later on. 
-    
-    first_pass_bam = [f"{sample}.1pass.SJ.out.tab" for sample in configFileDict['sample_prefix']]
-    print(first_pass_bam)
-    
-    TABfile_CMD = "{perl_script} {files} > merged_junctions.txt && awk '{{if(\$6==0 && \$7 >=3) print \$0}}' | tr ' ' '\t' | sort -V -k1,1 -k2,2n > merged_junctions.unannotated.filtered3unique.txt".format(perl_script = configFileDict['junctionMerge_script'], files = " ".join(first_pass_bam))
-    
-    SLURM_CMD = "{wsbatch} {slurm} -o {log_dir}/{uid}_slurm-%j.out --dependency=afterany:{JID} --wrap=\"{cmd}\"".format(wsbatch = configFileDict["wsbatch"], slurm = configFileDict["slurm_general"], log_dir = "{}/log".format(configFileDict['bam_dir']), uid = configFileDict["uid"], cmd = TABfile_CMD, JID=configFileDict["FIRST_PASS_WAIT"])
-    out = subprocess.check_output(SLURM_CMD, shell=True, universal_newlines= True, stderr=subprocess.STDOUT)
-    
-    TABFILE_WAIT = catchJID(out)
-    
-    return TABFILE_WAIT
-
-
-read_limitSjdbInsertNsj_json(configFileDict):
-    fileName = "{bam_path}/limitSjdbInsertNsj.txt".format(bam_path = configFileDict['bam_dir'])
-    f = open(fileName, "rt")
-    line = f.readline().rstrip().split()    
-    return int(line)
-
-def increase_limitSjdbInsertNsj(value):
-    value = str(value)
-    len_val = len(value)
-    new_number = []
-    if len_val > 1:
-        new_number.append(value[0])
-        new_number.append(str(int(value[1])+1))
-        for i in range(2,len_val):
-            new_number.append(str(0))
-    else:
-        new_number.append(str(int(value)+1))
-    return new_number
-
-def STAR_2pass(configFileDict):
-    limitSjdbInsertNsj = read_limitSjdbInsertNsj_json(configFileDict)
-    sjdbFile = configFileDict['sjdbFile']
-    
-    output_prefix = None 
-    fastq1 = None 
-    fastq2 = None 
-    
-    cmd = "{star} --outFileNamePrefix {outputFilePrefix} --genomeDir {STAR_genome_dir} --readFilesIn {fastq1} {fastq2}  --readFilesCommand zcat --runThreadN 8 --outSAMtype BAM SortedByCoordinate --sjdbFileChrStartEnd  {sjdbFileChrStartEnd} --outSAMunmapped Within --outSAMattributes All --outFilterMultimapNmax 20 --outSAMstrandField intronMotif --limitSjdbInsertNsj {limitSjdbInsertNsj}".format(configFileDict['STAR'], outputFilePrefix=output_prefix, STAR_genome_dir = configFileDict['reference_genome'], fastq1= fastq1, fastq2=fastq2,sjdbFileChrStartEnd=sjdbFile, limitSjdbInsertNsj=limitSjdbInsertNsj)
-    return None
+import heapq
+import itertools
+import os
+import sys
+
+# Default of STAR, the limit is never set below it
+STAR_LIMIT_SJDB_INSERT_NSJ = 1000000
+
+
+def readChromosomes(genomeDir):
+    """[Returns the position of each chromosome in the STAR genome. The SJ.out.tab files of STAR are sorted in this order]"""
+    with open(os.path.join(genomeDir, "chrName.txt"), "rt") as f:
+        return {line.rstrip("\n"): i for i, line in enumerate(f)}
+
+def readJunctions(fileName, chromosomes):
+    """[Streams the junctions of a SJ.out.tab file with their sort key (chromosome position, start, end). The file is read line by line and its order checked, so that the files can be merged without loading them]
+
+    Args:
+        fileName ([str]): [SJ.out.tab file of a first pass]
+        chromosomes ([dict]): [Position of each chromosome in the genome, see readChromosomes]
+
+    Returns:
+        [generator]: [(key, fields) of each junction]
+    """
+    previous = None
+    with open(fileName, "rt") as f:
+        for line in f:
+            fields = line.rstrip("\n").split("\t")
+            key = (chromosomes[fields[0]], int(fields[1]), int(fields[2]))
+            if previous is not None and key < previous:
+                raise ValueError(f"{fileName} is not sorted by coordinate at {fields[0]}:{fields[1]}-{fields[2]}")
+            previous = key
+            yield key, fields
+
+def mergeJunctions(files, chromosomes):
+    """[Merges the junctions of several SJ.out.tab files with a k-way merge of the sorted files: only the current junction of each file is held in memory]
+
+    The reads of a junction found in several samples are summed (unique and multi-mapping reads) and its maximum overhang is the largest of the samples.
+
+    Args:
+        files ([lst]): [SJ.out.tab files of the first pass]
+        chromosomes ([dict]): [Position of each chromosome in the genome, see readChromosomes]
+
+    Returns:
+        [generator]: [Merged junctions in the SJ.out.tab format: chromosome, start, end, strand, motif, annotated, unique reads, multi-mapping reads, maximum overhang]
+    """
+    streams = [readJunctions(fileName, chromosomes) for fileName in files]
+    for key, group in itertools.groupby(heapq.merge(*streams, key=lambda junction: junction[0]), key=lambda junction: junction[0]):
+        rows = [fields for key, fields in group]
+        first = rows[0]
+        yield first[:5] + [max(row[5] for row in rows), str(sum(int(row[6]) for row in rows)), str(sum(int(row[7]) for row in rows)), str(max(int(row[8]) for row in rows))]
+
+def countLines(fileName):
+    with open(fileName, "rt") as f:
+        return sum(1 for line in f)
+
+def getLimitSjdbInsertNsj(nJunctions):
+    """[Returns the limitSjdbInsertNsj of the second pass: the number of junctions inserted, rounded up on its first two digits (i.e 1234567 -> 1300000), and at least the default of STAR]"""
+    step = 10 ** max(len(str(nJunctions)) - 2, 0)
+    return max((nJunctions // step + 1) * step, STAR_LIMIT_SJDB_INSERT_NSJ)
+
+def runJunctionMerge(files, genomeDir, prefix, minUnique=3, sjdbLists=[]):
+    """[Merges the junctions of the first pass of all the samples and writes the files of the second pass]
+
+    Writes {prefix}merged.tab (all the junctions), {prefix}filtered.tab (the junctions inserted in the genome by the second pass: not annotated and supported by at least minUnique uniquely mapped reads over all the samples) and {prefix}parameters.txt, the STAR parameters file of the second pass with --sjdbFileChrStartEnd and --limitSjdbInsertNsj. The annotated junctions are inserted again from the annotation by the second pass, their number is read from the sjdbList.out.tab files of the genome and of the first pass.
+
+    Args:
+        files ([lst]): [SJ.out.tab files of the first pass]
+        genomeDir ([str]): [STAR genome directory]
+        prefix ([str]): [Prefix of the output files]
+        minUnique ([int]): [Minimum number of uniquely mapped reads of a new junction]
+        sjdbLists ([lst]): [sjdbList.out.tab files listing the annotated junctions. The ones that do not exist are skipped]
+
+    Returns:
+        [dict]: [Number of junctions merged and filtered, and limitSjdbInsertNsj]
+    """
+    chromosomes = readChromosomes(genomeDir)
+    nMerged = nFiltered = 0
+    with open(f"{prefix}merged.tab", "wt") as merged, open(f"{prefix}filtered.tab", "wt") as filtered:
+        for junction in mergeJunctions(files, chromosomes):
+            line = "\t".join(junction) + "\n"
+            merged.write(line)
+            nMerged += 1
+            if junction[5] == "0" and int(junction[6]) >= minUnique:
+                filtered.write(line)
+                nFiltered += 1
 
+    annotated = max([countLines(fileName) for fileName in sjdbLists if os.path.exists(fileName)], default=0)
+    limit = getLimitSjdbInsertNsj(annotated + nFiltered)
+    with open(f"{prefix}parameters.txt", "wt") as g:
+        g.write(f"sjdbFileChrStartEnd {os.path.abspath(prefix)}filtered.tab\n")
+        g.write(f"limitSjdbInsertNsj {limit}\n")
+    return {'merged': nMerged, 'filtered': nFiltered, 'annotated': annotated, 'limitSjdbInsertNsj': limit}
 
 
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Merges the splice junctions of the first pass of STAR for the second pass")
+    parser.add_argument('files', type=str, nargs="+", help='SJ.out.tab files of the first pass')
+    parser.add_argument('-genome', dest='genome', type=str, required=True, help='STAR genome directory')
+    parser.add_argument('-o', '--prefix', dest='prefix', type=str, required=True, help='Prefix of the output files')
+    parser.add_argument('-min_unique', dest='minUnique', type=int, default=3, help='Minimum number of uniquely mapped reads of a new junction over all the samples. Default: 3')
+    parser.add_argument('-sjdb', dest='sjdbLists', type=str, action="append", default=[], help='sjdbList.out.tab file listing the annotated junctions. Can be given several times')
+    args = parser.parse_args()
 
+    missing = [fileName for fileName in args.files if not os.path.exists(fileName)]
+    if missing:
+        print("First pass junctions missing: {}".format(" ".join(missing)))
+        sys.exit(1)
+    counts = runJunctionMerge(args.files, args.genome, args.prefix, args.minUnique, args.sjdbLists)
+    print("{merged} junctions merged from {files} samples, {filtered} new junctions inserted with {annotated} annotated junctions, limitSjdbInsertNsj {limitSjdbInsertNsj}".format(files = len(args.files), **counts))
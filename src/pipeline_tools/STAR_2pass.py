@@ -1,99 +1,57 @@
-#!/usr/bin/env python3 
+#!/usr/bin/env python3
 
-
-import subprocess
-import sys 
-import glob
 import os
-import math
-import argparse
-from pipeline_tools.slurmTools import catchJID
-
-pipeline_path = sys.path[0]
-pipeline_tools_path = os.path.abspath(pipeline_path + "/pipeline_tools")
-sys.path.append(pipeline_tools_path)
-from slurmTools import *
-
-
-def submitJobCheck(configFileDict, log_key, wait_key):
-    log_files = configFileDict[log_key]
-    for file in log_files: 
-        cmd = "python3 {jobCheck} -w -log {file}".format(jobCheck=configFileDict['jobCheck'], file=file)
-        SLURM_CMD = "{wsbatch} --dependency=afterany:{JID} -o {raw_log}/slurm-%j.out --wrap=\"{cmd}\"".format(wsbatch=configFileDict['wsbatch'], cmd=cmd, JID=wait_key, raw_log = configFileDict['raw_log'])
-        out = subprocess.check_output(SLURM_CMD, shell=True, universal_newlines=True, stderr=subprocess.STDOUT)
-
-def STAR_1pass(configFileDict):
-    FIRST_PASS_JID_LST = []
-    
-    for sample in configFileDict['sample_prefix']:
-        
-        outputFilePrefix = f"{sample}.1pass"
-        
-        MAP_CMD ="{STAR} {parameters} --outFileNamePrefix {outputFilePrefix} --genomeDir {referenceGenome}  --readFilesIn {smp}*_R1_001.fastq.gz {smp}*_R2_001.fastq.gz --readFilesCommand zcat --runThreadN 8 --outSAMtype BAM Unsorted --outSJfilterReads Unique".format(STAR = configFileDict['STAR'], parameters = configFileDict['1pass'], referenceGenome = configFileDict['reference_genome'], smp=sample, outputFilePrefix=outputFilePrefix)
-        
-        if '1' in configFileDict['task_list']: 
-            SLURM_CMD = "{wsbatch} {slurm} -o {log_dir}/{uid}_slurm-%j.out --dependency=afterany:{JID} --wrap=\"{cmd}\"".format(wsbatch = configFileDict["wsbatch"], slurm = configFileDict["slurm_mapping"], log_dir = "{}/log".format(configFileDict['bam_dir']), uid = configFileDict["uid"], cmd = MAP_CMD, JID=configFileDict["TRIM_WAIT"])
-            print(SLURM_CMD)
-        else: 
-            SLURM_CMD = "{wsbatch} {slurm} -o {log_dir}/{uid}_slurm-%j.out --wrap=\"{cmd}\"".format(wsbatch = configFileDict["wsbatch"], slurm = configFileDict["slurm_mapping"], log_dir = f"{configFileDict['bam_dir']}/log", uid = configFileDict["uid"], cmd = MAP_CMD)
-            print(SLURM_CMD)
-        
-        
-        out = subprocess.check_output(SLURM_CMD, shell=True, universal_newlines= True, stderr=subprocess.STDOUT)
-        FIRST_PASS_JID_LST.append(catchJID(out))
-        
-    FIRST_PASS_WAIT = ",".join(FIRST_PASS_JID_LST)
-    return FIRST_PASS_WAIT
-
-
-def STAR_createTABfile(configFileDict):
-    #run the perl script to merge junctions and save in raw file, then filter junctions and sort and create new junctions file that is going to be used later on. 
-    
-    first_pass_bam = [f"{sample}.1pass.SJ.out.tab" for sample in configFileDict['sample_prefix']]
-    print(first_pass_bam)
-    
-    TABfile_CMD = "{perl_script} {files} > merged_junctions.txt && awk '{{if(\$6==0 && \$7 >=3) print \$0}}' | tr ' ' '\t' | sort -V -k1,1 -k2,2n > merged_junctions.unannotated.filtered3unique.txt".format(perl_script = configFileDict['junctionMerge_script'], files = " ".join(first_pass_bam))
-    
-    SLURM_CMD = "{wsbatch} {slurm} -o {log_dir}/{uid}_slurm-%j.out --dependency=afterany:{JID} --wrap=\"{cmd}\"".format(wsbatch = configFileDict["wsbatch"], slurm = configFileDict["slurm_general"], log_dir = "{}/log".format(configFileDict['bam_dir']), uid = configFileDict["uid"], cmd = TABfile_CMD, JID=configFileDict["FIRST_PASS_WAIT"])
-    out = subprocess.check_output(SLURM_CMD, shell=True, universal_newlines= True, stderr=subprocess.STDOUT)
-    
-    TABFILE_WAIT = catchJID(out)
-    
-    return TABFILE_WAIT
- 
-def get_limitSjdbInsertNsj(configFileDict):
-    cmd = "wc -l {file}/merged_junctions.txt".format(configFileDict['bam_dir'])
-    out = int(subprocess.check_output(cmd, shell=True, universal_newlines=True, stderr= subprocess.STDOUT).split()[0])
-    return out
-
-def increase_limitSjdbInsertNsj(value):
-    value = str(value)
-    len_val = len(value)
-    new_number = []
-    if len_val > 1:
-        new_number.append(value[0])
-        new_number.append(str(int(value[1])+1))
-        for i in range(2,len_val):
-            new_number.append(str(0))
-    else:
-        new_number.append(str(int(value)+1))
-    return new_number
-
-def STAR_2pass(configFileDict,limitSjdbInsertNsj):
-    #limitSjdbInsertNsj = increase_limitSjdbInsertNsj(get_limitSjdbInsertNsj(configFileDict))
-    sjdbFile = configFileDict['sjdbFile']
-    
-    output_prefix = None 
-    fastq1 = None 
-    fastq2 = None 
-    
-    cmd = "{star} --outFileNamePrefix {outputFilePrefix} --genomeDir {STAR_genome_dir} --readFilesIn {fastq1} {fastq2}  --readFilesCommand zcat --runThreadN 8 --outSAMtype BAM SortedByCoordinate --sjdbFileChrStartEnd  {sjdbFileChrStartEnd} --outSAMunmapped Within --outSAMattributes All --outFilterMultimapNmax 20 --outSAMstrandField intronMotif --limitSjdbInsertNsj {limitSjdbInsertNsj}".format(configFileDict['STAR'], outputFilePrefix=output_prefix, STAR_genome_dir = configFileDict['reference_genome'], fastq1= fastq1, fastq2=fastq2,sjdbFileChrStartEnd=sjdbFile, limitSjdbInsertNsj=limitSjdbInsertNsj)
-    return None
-
-if __name__ == "__main__":
-    print(increase_limitSjdbInsertNsj(get_limitSjdbInsertNsj(*sys.argv[1:])))
-
-
-
-
-
+import re
+
+
+def removeSTARoptions(parameters, options):
+    """[Removes options and their values from STAR parameters, i.e --outSAMtype BAM SortedByCoordinate. STAR refuses a parameter given twice]
+
+    Args:
+        parameters ([str]): [STAR parameters, i.e configFileDict['STARoptions']]
+        options ([lst]): [Option names without the leading dashes]
+
+    Returns:
+        [str]: [STAR parameters without the options]
+    """
+    return " ".join(re.sub(r"--({})(?!\S)(\s+(?!--)\S+)*".format("|".join(options)), "", parameters).split())
+
+def getJunctionPrefix(configFileDict):
+    """[Returns the prefix of the junction files of the two-pass mapping, written by the junction merge in the bam directory]"""
+    return "{bamDir}/SJ.1pass.".format(bamDir = configFileDict['bam_dir'])
+
+def getFirstPassCMD(configFileDict, sample, parameters, reads, sjdb):
+    """[Creates the first pass STAR command of a sample. It only collects the splice junctions of the sample, no BAM file is written]
+
+    Args:
+        configFileDict ([dict]): [configuration file dictionary]
+        sample ([str]): [Sample ID]
+        parameters ([str]): [STAR parameters of the mapping]
+        reads ([str]): [Value of --readFilesIn]
+        sjdb ([str]): [Annotation options of the mapping]
+
+    Returns:
+        [str]: [First pass command, writing {bam_dir}/{sample}.1pass.SJ.out.tab]
+    """
+    parameters = removeSTARoptions(parameters, ["twopassMode", "outSAMtype", "outSJfilterReads", "quantMode"])
+    return "{STAR} {parameters} --outSAMtype None --outSJfilterReads Unique --outFileNamePrefix {bamDir}/{sample}.1pass. --genomeDir {STARgenomeDir} --readFilesIn {reads} {sjdb}".format(STAR = configFileDict['star'], parameters = parameters, bamDir = configFileDict['bam_dir'], sample = sample, STARgenomeDir = configFileDict['reference_genome'], reads = reads, sjdb = sjdb)
+
+def getJunctionMergeCMD(configFileDict, samples):
+    """[Creates the command merging the junctions of the first pass of all the samples, see mapping/run_STAR_2pass.py]
+
+    Args:
+        configFileDict ([dict]): [configuration file dictionary]
+        samples ([lst]): [Sample IDs]
+
+    Returns:
+        [str]: [Junction merge command]
+    """
+    bamDir = configFileDict['bam_dir']
+    # The annotated junctions are listed in the genome when it was generated with the annotation, or else by the first pass that inserted them
+    sjdbLists = ["{}/sjdbList.out.tab".format(configFileDict['reference_genome'])] + ([f"{bamDir}/{samples[0]}.1pass._STARgenome/sjdbList.out.tab"] if samples else [])
+    return "python3 {script} -genome {STARgenomeDir} -o {prefix} -min_unique {minUnique} {sjdb} {files}".format(script = configFileDict['junctionMerge_script'], STARgenomeDir = configFileDict['reference_genome'], prefix = getJunctionPrefix(configFileDict), minUnique = configFileDict.get('star_sj_min_unique', "3").strip(), sjdb = " ".join(f"-sjdb {fileName}" for fileName in sjdbLists), files = " ".join(f"{bamDir}/{sample}.1pass.SJ.out.tab" for sample in samples))
+
+def getSecondPassParameters(configFileDict, parameters):
+    """[Returns the STAR parameters of the second pass: the new junctions of the first pass and limitSjdbInsertNsj are read from the parameters file written by the junction merge, as they are only known once the first pass is done]"""
+    parameters = removeSTARoptions(parameters, ["twopassMode", "sjdbFileChrStartEnd", "limitSjdbInsertNsj", "parametersFiles"])
+    return "{parameters} --parametersFiles {prefix}parameters.txt".format(parameters = parameters, prefix = os.path.abspath(getJunctionPrefix(configFileDict)))
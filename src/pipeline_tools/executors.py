@@ -0,0 +1,366 @@
+#!/usr/bin/env python3
+
+import glob
+import json
+import math
+import os
+import random
+import re
+import shlex
+import socket
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from resultCache import getPaths
+
+TRANSIENT_ERRORS = ("Socket timed out", "Unable to contact slurm controller", "Resource temporarily unavailable")
+
+
+def parseSlurmCMD(SLURM_CMD):
+    """[Splits a wsbatch command into its sbatch options and its command]
+
+    Args:
+        SLURM_CMD ([str]): [wsbatch command]
+
+    Returns:
+        [dict]: [command, log file pattern, dependency conditions (see parseDependency) and all the job IDs they wait for, number of cpus and memory in MB]
+    """
+    options, cmd = SLURM_CMD.split(" --wrap=\"", 1)
+    job = {'cmd': cmd[:-1] if cmd.endswith("\"") else cmd, 'log': None, 'conditions': [], 'dependency': [], 'cpus': 1, 'mem': 0, 'time': 0, 'array': ""}
+    options = shlex.split(options)[1:]
+    for i, option in enumerate(options):
+        value = options[i + 1] if i + 1 < len(options) else ""
+        if option == "-o":
+            job['log'] = value
+        elif option.startswith("--output="):
+            job['log'] = option.split("=", 1)[1]
+        elif option.startswith("--dependency="):
+            # Each condition keeps its own type, i.e afterok:1,afterany:2 for the lanes of a step run with auto_retry
+            job['conditions'] = [[condition, JIDs] for condition, JIDs in parseDependency(option) if JIDs]
+            job['dependency'] = list(dict.fromkeys(jid for condition, JIDs in job['conditions'] for jid in JIDs))
+        elif option == "-c":
+            job['cpus'] = int(value)
+        elif option.startswith("--cpus-per-task="):
+            job['cpus'] = int(option.split("=", 1)[1])
+        elif option.startswith("--mem="):
+            job['mem'] = getMemoryMB(option.split("=", 1)[1])
+        elif option == "-t":
+            job['time'] = getTimeLimit(value)
+        elif option.startswith("--time="):
+            job['time'] = getTimeLimit(option.split("=", 1)[1])
+        elif option.startswith("--array="):
+            job['array'] = option.split("=", 1)[1]
+    return job
+
+def parseDependency(SLURM_CMD):
+    """[Reads the dependency conditions of a wsbatch command]"""
+    match = re.search(r"--dependency=([^\s]*)", SLURM_CMD)
+    conditions = []
+    for item in (match.group(1).split(",") if match else []):
+        if item == "singleton":
+            conditions.append(["singleton", None])
+        elif ":" in item:
+            conditions.append([item.split(":")[0], [jid for jid in item.split(":")[1:] if jid]])
+        elif item and conditions and conditions[-1][1] is not None:
+            conditions[-1][1].append(item)
+    return conditions
+
+def formatDependency(conditions, separator=","):
+    """[Writes the dependency conditions read with parseDependency]"""
+    return ",".join(condition if JIDs is None else "{}:{}".format(condition, separator.join(JIDs)) for condition, JIDs in conditions if JIDs is None or JIDs)
+
+def getMemoryMB(mem):
+    """[Converts a slurm memory request (i.e 20G) to MB]"""
+    units = {'K': 1 / 1024, 'M': 1, 'G': 1024, 'T': 1024 * 1024}
+    mem = mem.strip().upper()
+    if mem[-1] in units:
+        return int(float(mem[:-1]) * units[mem[-1]])
+    return int(mem)
+
+def getTimeLimit(time):
+    """[Converts a slurm time limit (minutes, MM:SS, HH:MM:SS, D-HH, D-HH:MM or D-HH:MM:SS) to seconds]"""
+    days = 0
+    if "-" in time:
+        days, time = time.split("-")
+        parts = [int(part) for part in time.split(":")]
+        parts += [0] * (3 - len(parts))
+    else:
+        parts = [int(part) for part in time.split(":")]
+        parts = [0] * (3 - len(parts)) + parts if len(parts) > 1 else [0, parts[0], 0]
+    return int(days) * 86400 + parts[0] * 3600 + parts[1] * 60 + parts[2]
+
+
+class SlurmExecutor:
+    """[Submits the jobs to slurm using wsbatch]"""
+    arrays = True
+    writesJobSummary = False
+    concurrentSubmission = True
+
+    def __init__(self, retries=5, backoff=2):
+        self.retries = retries
+        self.backoff = backoff
+
+    def submit(self, SLURM_CMD):
+        for attempt in range(self.retries + 1):
+            try:
+                return subprocess.check_output(SLURM_CMD, shell=True, universal_newlines=True, stderr=subprocess.STDOUT)
+            except subprocess.CalledProcessError as e:
+                if attempt == self.retries or not any(error in e.output for error in TRANSIENT_ERRORS):
+                    raise
+                delay = self.backoff * 2 ** attempt * random.uniform(1, 1.5)
+                print("Submission failed: {}. Retrying in {:.1f} seconds.".format(e.output.strip(), delay), flush=True)
+                time.sleep(delay)
+
+    def wait(self):
+        pass
+
+
+def writeJobSummary(logFile, jid, state, returncode, start=None):
+    """[Appends the job summary lines read by the report to a log file]
+
+    Args:
+        logFile ([str]): [Log file of the job]
+        jid ([str]): [Job ID]
+        state ([str]): [Final state of the job, COMPLETED, FAILED or CANCELLED]
+        returncode ([int]): [Exit code of the job]
+        start ([datetime]): [Start time of the job. None if it never started]
+    """
+    end = datetime.now()
+    start = start or end
+    elapsed = str(end - start).split(".")[0]
+    with open(logFile, "a") as log:
+        log.write("__JOB_SUMMARY_INFO|JobID|State|ExitCode|MaxRSS|Start|End|Elapsed|NNodes|NodeList\n")
+        log.write("__JOB_SUMMARY_INFO|{jid}|{state}|{exitcode}:0||{start}|{end}|{elapsed}|1|{node}\n".format(jid = jid, state = state, exitcode = max(returncode, 0), start = start.strftime("%Y-%m-%dT%H:%M:%S"), end = end.strftime("%Y-%m-%dT%H:%M:%S"), elapsed = elapsed, node = socket.gethostname()))
+        if state == "COMPLETED":
+            log.write("__JOB_SUMMARY_INFO|COMPLETED|Successfuly completed\n")
+        else:
+            log.write("__JOB_SUMMARY_INFO|FAILED|Failed\n")
+
+
+class LocalExecutor:
+    """[Runs the jobs on the local machine in a bounded pool, without slurm]"""
+    arrays = False
+    writesJobSummary = True
+    concurrentSubmission = False
+
+    def __init__(self, cpus, mem):
+        self.cpus = cpus
+        self.mem = mem
+        self.used_cpus = 0
+        self.used_mem = 0
+        self.jobs = {}
+        self.pending = []
+        self.jid = 0
+        self.condition = threading.Condition()
+        self.pool = ThreadPoolExecutor(max_workers=cpus)
+
+    def submit(self, SLURM_CMD):
+        job = parseSlurmCMD(SLURM_CMD)
+        job['cpus'] = min(job['cpus'], self.cpus)
+        job['mem'] = min(job['mem'], self.mem)
+        with self.condition:
+            self.jid += 1
+            job['jid'] = str(self.jid)
+            job['state'] = "PENDING"
+            if job['log']:
+                job['log'] = job['log'].replace("%j", job['jid'])
+            self.jobs[job['jid']] = job
+            self.pending.append(job)
+            self.schedule()
+        return "Submitted batch job {}".format(job['jid'])
+
+    def schedule(self):
+        """[Starts the pending jobs that are ready and fit in the budget. Must be called holding the lock]"""
+        for job in list(self.pending):
+            dependencies = [self.jobs[jid] for jid in job['dependency'] if jid in self.jobs]
+            if any(dependency['state'] in ("PENDING", "RUNNING") for dependency in dependencies):
+                continue
+            if any(condition == "afterok" and any(self.jobs[jid]['state'] != "COMPLETED" for jid in JIDs if jid in self.jobs) for condition, JIDs in job['conditions']):
+                self.pending.remove(job)
+                self.finish(job, "CANCELLED", -1, None)
+                return self.schedule()
+            if self.used_cpus + job['cpus'] > self.cpus or self.used_mem + job['mem'] > self.mem:
+                continue
+            self.pending.remove(job)
+            job['state'] = "RUNNING"
+            self.used_cpus += job['cpus']
+            self.used_mem += job['mem']
+            self.pool.submit(self.run, job)
+
+    def run(self, job):
+        start = datetime.now()
+        # The slurm variables used by the jobs themselves, i.e runPackedTasks.py
+        env = dict(os.environ, SLURM_JOB_ID=job['jid'], SLURM_CPUS_PER_TASK=str(job['cpus']))
+        try:
+            if job['log']:
+                with open(job['log'], "w") as log:
+                    returncode = subprocess.call(job['cmd'], shell=True, executable="/bin/bash", stdout=log, stderr=subprocess.STDOUT, env=env)
+            else:
+                returncode = subprocess.call(job['cmd'], shell=True, executable="/bin/bash", stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT, env=env)
+        except OSError:
+            returncode = -1
+        with self.condition:
+            self.used_cpus -= job['cpus']
+            self.used_mem -= job['mem']
+            self.finish(job, "COMPLETED" if returncode == 0 else "FAILED", returncode, start)
+            self.schedule()
+
+    def finish(self, job, state, returncode, start):
+        """[Sets the final state of a job and writes its job summary. Must be called holding the lock]"""
+        job['state'] = state
+        self.condition.notify_all()
+        if not job['log'] or not os.path.isdir(os.path.dirname(job['log'])):
+            return
+        writeJobSummary(job['log'], job['jid'], state, returncode, start)
+
+    def wait(self):
+        """[Blocks until all the submitted jobs are done]"""
+        with self.condition:
+            while any(job['state'] in ("PENDING", "RUNNING") for job in self.jobs.values()):
+                self.condition.wait()
+        self.pool.shutdown()
+
+
+class PlanExecutor:
+    """[Records the jobs of a dry run to write the execution plan of the run]"""
+    arrays = True
+    writesJobSummary = False
+    concurrentSubmission = False
+
+    def __init__(self, configFileDict):
+        self.configFileDict = configFileDict
+        self.jobs = {}
+        self.planWritten = False
+
+    def submit(self, SLURM_CMD):
+        print(SLURM_CMD)
+        job = parseSlurmCMD(SLURM_CMD)
+        job['jid'] = str(len(self.jobs) + 1)
+        job['tasks'] = {}
+        self.jobs[job['jid']] = job
+        return "Submitted batch job {}".format(job['jid'])
+
+    def describe(self, jid, **info):
+        """[Adds the sample, step and input size of a job or an array task (jid_task)]"""
+        jid, _, task = jid.partition("_")
+        if task:
+            self.jobs[jid]['tasks'].setdefault(task, {}).update(info)
+        else:
+            self.jobs[jid].update(info)
+
+    def wait(self):
+        pass
+
+    def getPlan(self):
+        """[Returns the execution plan: the jobs and a summary of the run]"""
+        configPaths = set(value.strip().rstrip("/") for value in self.configFileDict.values() if isinstance(value, str))
+        jobs = []
+        produced = set()
+        finish = {}
+        for jid, job in self.jobs.items():
+            tasks = [dict(task, task = int(index)) for index, task in sorted(job['tasks'].items(), key=lambda item: int(item[0]))]
+            inputs, outputs = [], []
+            for cmd in [task['cmd'] for task in tasks if 'cmd' in task] or [job['cmd']]:
+                for path in getPaths(cmd):
+                    # A path is an input if it exists, is written by an earlier job or is a wildcard, otherwise an output. Tools, reference files and directories are left out
+                    if path.rstrip("/") in configPaths or os.path.isdir(path) or (os.path.isfile(path) and os.access(path, os.X_OK)) or path in inputs or path in outputs:
+                        continue
+                    if path in produced or os.path.exists(path) or glob.has_magic(path):
+                        inputs.append(path)
+                    else:
+                        outputs.append(path)
+            produced.update(outputs)
+
+            nTasks = len(tasks) or 1
+            limit = int(job['array'].split("%")[1]) if "%" in job['array'] else nTasks
+            duration = job['time'] * math.ceil(nTasks / limit)
+            dependencies = list(dict.fromkeys(dependency.split("_")[0] for dependency in job['dependency']))
+            finish[jid] = max([finish[dependency] for dependency in dependencies if dependency in finish] + [0]) + duration
+            jobs.append({
+                'jid': jid,
+                'step': job.get('step', os.path.basename(os.path.dirname(os.path.dirname(job['log']))) if job['log'] else ""),
+                'sample': job.get('sample', ""),
+                'cmd': job['cmd'],
+                'log': job['log'],
+                'conditions': job['conditions'],
+                'dependencies': job['dependency'],
+                'cpus': job['cpus'],
+                'mem_mb': job['mem'],
+                'time_s': job['time'],
+                'array': job['array'],
+                'tasks': tasks,
+                'core_hours': round(job['cpus'] * job['time'] * (nTasks if job['array'] else 1) / 3600, 2),
+                'input_bytes': job.get('input_bytes', sum(task.get('input_bytes', 0) for task in tasks)),
+                'inputs': inputs,
+                'outputs': outputs,
+            })
+
+        criticalPath = []
+        jid = max(finish, key=finish.get) if finish else None
+        while jid:
+            criticalPath.insert(0, jid)
+            dependencies = [dependency.split("_")[0] for dependency in self.jobs[jid]['dependency'] if dependency.split("_")[0] in finish]
+            jid = max(dependencies, key=finish.get) if dependencies else None
+        summary = {
+            'jobs': len(jobs),
+            'tasks': sum(len(job['tasks']) or 1 for job in jobs),
+            'core_hours': round(sum(job['core_hours'] for job in jobs), 2),
+            'input_bytes': sum(job['input_bytes'] for job in jobs),
+            'critical_path_hours': round(max(finish.values(), default=0) / 3600, 2),
+            'critical_path': criticalPath,
+        }
+        return {'summary': summary, 'jobs': jobs}
+
+    def writePlan(self, jsonFile, dotFile=None):
+        """[Writes the execution plan as json and, optionally, as a Graphviz DOT graph]"""
+        plan = self.getPlan()
+        with open(jsonFile, "w") as g:
+            json.dump(plan, g, indent=1)
+        if dotFile:
+            critical = set(plan['summary']['critical_path'])
+            with open(dotFile, "w") as g:
+                g.write("digraph plan {\n    node [shape=box];\n")
+                for job in plan['jobs']:
+                    label = "\\n".join(value for value in [job['jid'], job['step'], job['sample'], "{} tasks".format(len(job['tasks'])) if job['tasks'] else ""] if value)
+                    g.write("    \"{}\" [label=\"{}\"{}];\n".format(job['jid'], label, ", color=red" if job['jid'] in critical else ""))
+                    for dependency in dict.fromkeys(dependency.split("_")[0] for dependency in job['dependencies']):
+                        g.write("    \"{}\" -> \"{}\";\n".format(dependency, job['jid']))
+                g.write("}\n")
+        self.planWritten = True
+        return plan
+
+    def writePartialPlan(self, jsonFile, dotFile=None):
+        """[Writes the plan of the jobs submitted so far when the run stopped before writing it]"""
+        if self.jobs and not self.planWritten:
+            self.writePlan(jsonFile, dotFile)
+            print("The dry run stopped before its end. The execution plan of the {} job(s) submitted so far was written in {}".format(len(self.jobs), jsonFile))
+
+
+EXECUTOR = None
+
+def getExecutor(configFileDict):
+    """[Returns the executor selected with the executor key of the configuration file]
+
+    Args:
+        configFileDict ([dict]): [configuration file dictionary]
+
+    Returns:
+        [object]: [SlurmExecutor or LocalExecutor shared by all the steps of the run, PlanExecutor for a dry run]
+    """
+    global EXECUTOR
+    if EXECUTOR is None:
+        executor = configFileDict.get('executor', "slurm").strip()
+        if configFileDict.get('dry_run') == "1":
+            EXECUTOR = PlanExecutor(configFileDict)
+        elif executor == "slurm":
+            EXECUTOR = SlurmExecutor(int(configFileDict.get('submit_retries', "5")), float(configFileDict.get('submit_backoff', "2")))
+        elif executor == "local":
+            cpus = int(configFileDict['local_cpus']) if configFileDict.get('local_cpus') else os.cpu_count()
+            mem = int(float(configFileDict['local_mem']) * 1024) if configFileDict.get('local_mem') else os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') // (1024 * 1024)
+            EXECUTOR = LocalExecutor(cpus, mem)
+        else:
+            raise Exception(f"Unknown executor {executor}. Use slurm or local")
+    return EXECUTOR
@@ -4,16 +4,22 @@ import glob
 import os.path
 import re 
 
+from sampleManifest import scanDir, getSampleID
+
 def getFastqPrefix(fastq_path): 
     #regex = "_R[12]_*.fastq.gz"
-    FILES = glob.glob(f"{fastq_path}/*fastq.gz")
-    FILES = set([re.sub("_S.*_L.*_R[12]_.*.fastq.gz","",os.path.basename(i)) for i in FILES])
+    FILES = [i for i in scanDir(fastq_path) if i.endswith("fastq.gz")]
+    FILES = set([getSampleID(i) for i in FILES])
     return list(FILES)
 
 
+def getFastqSample(fastq_file):
+    # Works for raw (SampleID_S1_L001_R1_001.fastq.gz) and trimmed (SampleID.trimmed_S1_L001_R1_001.fastq.gz) fastq files
+    return re.sub("_S.*_L.*_R[12]_.*.fastq.gz","",os.path.basename(fastq_file)).split(".")[0]
+
+
 def getFastqFiles(fastq_path): 
     #regex = "_R[12]_*.fastq.gz"
-    FILES = glob.glob(f"{fastq_path}/*fastq.gz")
+    FILES = [i for i in scanDir(fastq_path) if i.endswith("fastq.gz")]
     #FILES = set([re.sub("_S.*_L.*_R[12]_.*.fastq.gz","",os.path.basename(i)) for i in FILES])
-    FILES = [os.path.basename(i) for i in FILES]
     return FILES
\ No newline at end of file
@@ -5,9 +5,11 @@ import glob
 import re
 import os
 
+from sampleManifest import listFiles
+
 def groupCheck(groups, dir):
     test =[]
-    FILES = glob.glob(f"{dir}/*.fastq.gz")
+    FILES = listFiles(dir, ".fastq.gz")
     for i in groups:
         r = re.compile("{}".format(i))
         f = list(filter(r.search,FILES))
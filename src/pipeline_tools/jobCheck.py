@@ -4,7 +4,9 @@ from collections import defaultdict
 from sys import argv, exit
 import subprocess 
 import argparse
+import json
 import os 
+import re
 
 
 def get_sacct(logFile):
@@ -42,20 +44,108 @@ def write_sacct(logFile):
 
 
 
-def check_exitCodes(logFile):
+SACCT_FIELDS = ["JobID", "State", "ExitCode", "MaxRSS", "Start", "End", "Elapsed", "TotalCPU", "MaxDiskRead", "MaxDiskWrite", "NNodes", "NodeList"]
+
+def get_logJobID(logFile):
+    """[Returns the slurm job ID of a log file from its name: {uid}_slurm-{jobID}.out, {uid}_slurm-{arrayID}_{taskID}.out for a job array task or {uid}_slurm-{jobID}.task{index}.out for a task of a packed job]"""
+    match = re.search(r"slurm-(\d+(?:_\d+)?)(?:\.task\d+)?\.out$", logFile)
+    if not match:
+        raise Exception(f"Impossible to retrieve the job ID of {logFile}")
+    return match.group(1)
+
+def get_bulk_sacct(jobIDs):
+    """[Retrieves the accounting information of all the jobs with a single sacct query]
+
+    Args:
+        jobIDs ([lst]): [slurm job IDs]
+
+    Returns:
+        [dict]: [sacct fields of each job. MaxRSS, MaxDiskRead and MaxDiskWrite are the largest ones of the job steps]
+    """
+    cmd = "sacct -j {jobIDs} -o{fields} -P -n".format(jobIDs = ",".join(jobIDs), fields = ",".join(SACCT_FIELDS))
+    out = subprocess.check_output(cmd, shell=True, universal_newlines=True, stderr=subprocess.STDOUT)
+    status = {}
+    steps = defaultdict(lambda: defaultdict(int))
+    for line in out.splitlines():
+        info = dict(zip(SACCT_FIELDS, line.split("|")))
+        if len(info) != len(SACCT_FIELDS):
+            continue
+        jobID = info['JobID'].split(".")[0]
+        if info['JobID'] == jobID:
+            status[jobID] = info
+            continue
+        # The memory and disk usage are only reported for the job steps
+        for field in ["MaxRSS", "MaxDiskRead", "MaxDiskWrite"]:
+            if info[field]:
+                steps[jobID][field] = max(steps[jobID][field], get_memoryKB(info[field]))
+    for jobID, info in status.items():
+        for field, value in steps[jobID].items():
+            if not info[field]:
+                info[field] = "{}K".format(value)
+    return status
+
+def get_memoryKB(mem):
+    units = {'K': 1, 'M': 1024, 'G': 1024 ** 2, 'T': 1024 ** 3}
+    if mem[-1] in units:
+        return int(float(mem[:-1]) * units[mem[-1]])
+    return int(mem) // 1024
+
+def read_jobSummary(logFile):
+    """[Reads the job summary lines appended to a log file by the jobs not run by slurm, see executors.writeJobSummary]
+
+    Returns:
+        [dict]: [JobID, State, ExitCode, MaxRSS, Start, End, Elapsed, NNodes and NodeList. Empty if the log file has no job summary]
+    """
+    if not os.path.exists(logFile):
+        return {}
+    with open(logFile, "rt", errors="replace") as f:
+        lines = [line.rstrip("\n").split("|")[1:] for line in f if line.startswith("__JOB_SUMMARY_INFO|")]
+    if len(lines) < 2:
+        return {}
+    return dict(zip(lines[0], lines[1]))
+
+def write_status(logFiles, statusFile):
+    """[Writes the state, exit code, MaxRSS, elapsed time and node of the jobs of all the log files in a single json file]
+
+    Args:
+        logFiles ([lst]): [slurm log files of the run]
+        statusFile ([str]): [Output json file, with one entry per log file]
+    """
+    jobIDs = {logFile: get_logJobID(logFile) for logFile in logFiles}
+    sacct = get_bulk_sacct(sorted(set(jobIDs.values())))
+    status = {}
+    for logFile, jobID in jobIDs.items():
+        info = dict(sacct.get(jobID, {'JobID': jobID, 'State': "UNKNOWN", 'ExitCode': ""}))
+        if re.search(r"\.task\d+\.out$", logFile):
+            # The task of a packed job has its own exit code and times in its log file. Without them, the pack was killed before the task finished
+            task = read_jobSummary(logFile)
+            info.update({field: task[field] for field in ["JobID", "State", "ExitCode", "Start", "End", "Elapsed"] if field in task})
+        info['Success'] = info['State'] == "COMPLETED" and info['ExitCode'] == "0:0"
+        status[logFile] = info
+    with open(statusFile, "w") as g:
+        json.dump(status, g, indent=1)
+    return status
+
+def read_status(statusFile):
+    """[Reads the json file written by write_status. Returns an empty dictionary if it does not exist]"""
+    if not statusFile or not os.path.exists(statusFile):
+        return {}
+    with open(statusFile, "rt") as f:
+        return json.load(f)
+
+def check_exitCodes(logFile, status=None):
+    """[Checks whether the job of a log file succeeded, from the json status file of the run (see write_status) or else from the job summary at the end of the log file]"""
+    if status and logFile in status:
+        return status[logFile]['Success']
+    if not os.path.exists(logFile) or os.path.getsize(logFile) < 2:
+        return False
     f = open(logFile, "rb")
     f.seek(-2, os.SEEK_END)
-    while f.read(1) != b'\n':
+    while f.tell() > 0 and f.read(1) != b'\n':
         f.seek(-2, os.SEEK_CUR)
-    last_line = f.readline().decode()
+    last_line = f.readline().decode(errors="replace")
     line = last_line.rstrip().split("|")
-    print(line)
-    if line[0] == "__JOB_SUMMARY_INFO":
-        if line[-1] == "Successfuly completed":
-            return True 
-        else:
-            return False
-        
+    return line[0] == "__JOB_SUMMARY_INFO" and line[-1] == "Successfuly completed"
     
 
 if __name__ == "__main__":
@@ -71,9 +161,27 @@ if __name__ == "__main__":
     parser.add_argument('-w', '--write', dest='write_info',required=False,action="store_true", help='Write JOB ID info in log files')
     parser.add_argument('-c', '--check', dest='check_info',required=False,action="store_true", help='Check ExitCode of log files')
     parser.add_argument('-log', '--log-file', dest='logFile', type=str, help='Absolute path to logFile')
+    parser.add_argument('-s', '--status-file', dest='statusFile', type=str, help='Json status file of the run. Written with --log-list using a single sacct query, read with --check')
+    parser.add_argument('-ll', '--log-list', dest='logList', type=str, help='File with the absolute path of one log file per line')
+    parser.add_argument('-hist', '--resource-history', dest='historyFile', type=str, help='Append the resources used by the successful jobs to this history file')
+    parser.add_argument('-jr', '--job-resources', dest='jobResources', type=str, help='Json file with the step and input size of each log file, written when the jobs were submitted')
+    parser.add_argument('-db', '--run-db', dest='runDB', type=str, help='Record the jobs of the run in this SQLite run database')
+    parser.add_argument('-jt', '--job-telemetry', dest='jobTelemetry', type=str, help='Json file with the run information and the step, sample, command hash and submit time of each log file, written when the jobs were submitted')
     args = parser.parse_args()
     
-    if args.write_info:
+    if args.statusFile and args.logList:
+        with open(args.logList, "rt") as f:
+            status = write_status([line.rstrip() for line in f if line.strip()], args.statusFile)
+        if args.historyFile and args.jobResources:
+            from resourceModel import recordHistory
+            with open(args.jobResources, "rt") as f:
+                recordHistory(args.historyFile, status, json.load(f))
+        if args.runDB and args.jobTelemetry:
+            from runDatabase import recordRun
+            with open(args.jobTelemetry, "rt") as f:
+                telemetry = json.load(f)
+            recordRun(args.runDB, telemetry['run'], status, telemetry['jobs'])
+    elif args.write_info:
         write_sacct(args.logFile)
     elif args.check_info:
-        check_exitCodes(args.logFile)
\ No newline at end of file
+        print(check_exitCodes(args.logFile, read_status(args.statusFile)))
\ No newline at end of file
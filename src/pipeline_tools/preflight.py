@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+
+import glob
+import gzip
+import os
+import random
+import re
+import shutil
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from sampleManifest import buildManifest, listFiles, getLaneKey
+
+BGZF_EOF = bytes.fromhex("1f8b08040000000000ff0600424302001b0003000000000000000000")
+BOWTIE2_INDEX = [".1.bt2", ".2.bt2", ".3.bt2", ".4.bt2", ".rev.1.bt2", ".rev.2.bt2"]
+STAR_INDEX = ["Genome", "SA", "SAindex", "chrNameLength.txt"]
+SCRIPT_EXTENSIONS = (".R", ".py", ".sh", ".pl", ".jar")
+HEAD_BYTES = 64 * 1024
+ANNOTATION_LINES = 1000
+
+# Tools of the configuration file used by each task, and commands expected in the PATH
+TASK_TOOLS = {
+    '1': ['cutadapt'],
+    '1.1': ['FastQC', 'multiQC'],
+    '3': ['picard', 'samtools'],
+    '4': ['samtools'],
+    '4.1': ['ATACseqQC'],
+    '4.2': ['samtools', 'ATACbamQC', 'combineBamStatScript'],
+    '5': ['bamCoverage'],
+    '6': ['bedtools', 'bam2bed_script'],
+    '7': ['bedClip', 'extendReadsScript'],
+    '8': ['macs2', 'bedtools', 'bedClip', 'bedGraphToBigWig', 'python', 'signal_atac_script'],
+    '8.1': ['bedtools', 'featureCounts', 'counts2GTF', 'combineCountScript'],
+}
+TASK_COMMANDS = {
+    '4.1': ['Rscript'],
+    '4.2': ['Rscript'],
+}
+
+
+def checkFastqPairs(manifest, pairend):
+    """[Checks that every lane of every sample of the sample manifest has its R1 file and, for paired-end data, its R2 mate. The files are grouped by sample, sample number and lane as the pipeline names them: SampleID_S1_L001_R1_001.fastq.gz]
+
+    Args:
+        manifest ([dict]): [Sample manifest of the fastq directory, see sampleManifest.buildManifest]
+        pairend ([bool]): [True for paired-end data]
+
+    Returns:
+        [lst]: [(level, message) of each problem found. level is ERROR or WARNING]
+    """
+    fastqDir = manifest['fastq_dir']
+    problems = [("ERROR", f"{fastqDir}/{name} is not named SampleID_S1_L001_R1_001.fastq.gz. Impossible to tell its sample and read") for name in manifest['unmatched']]
+    if not manifest['samples'] and not problems:
+        return [("ERROR", f"No fastq.gz files found in {fastqDir}")]
+    for sample, info in sorted(manifest['samples'].items()):
+        for lane, reads in sorted(info['lanes'].items(), key=lambda item: getLaneKey(item[0])):
+            for read in (["R1", "R2"] if pairend else ["R1"]):
+                if not reads.get(read):
+                    problems.append(("ERROR", f"{sample}: no {read} fastq file for lane {lane} in {fastqDir}"))
+                elif len(reads[read]) > 1:
+                    problems.append(("ERROR", "{}: several {} fastq files for lane {}: {}".format(sample, read, lane, ", ".join(os.path.basename(path) for path in reads[read]))))
+    for group, samples in manifest['groups'].items():
+        if not samples:
+            problems.append(("WARNING", f"No sample of {fastqDir} belongs to the group {group}"))
+    return problems
+
+def checkGzip(path, full=False):
+    """[Checks that a fastq.gz file can be decompressed and starts with a valid fastq record. With full, the whole file is decompressed, which also checks the CRC of every gzip member]
+
+    Returns:
+        [lst]: [(level, message) of each problem found]
+    """
+    if os.path.getsize(path) == 0:
+        return [("ERROR", f"{path} is empty")]
+    try:
+        with gzip.open(path, "rb") as f:
+            head = f.read(HEAD_BYTES)
+            if full:
+                while f.read(16 * 1024 * 1024):
+                    pass
+    except (OSError, EOFError, zlib.error) as e:
+        return [("ERROR", f"{path} is not a valid gzip file or is truncated: {e}")]
+    lines = head.split(b"\n")
+    if len(lines) < 4 and len(head) == HEAD_BYTES:
+        return [("ERROR", f"{path} does not look like a fastq file")]
+    if len(lines) >= 4 and (not lines[0].startswith(b"@") or not lines[2].startswith(b"+") or len(lines[1]) != len(lines[3])):
+        return [("ERROR", f"{path} does not start with a valid fastq record")]
+    return []
+
+def checkBam(path, needIndex):
+    """[Checks that a BAM file ends with the BGZF end-of-file block (i.e it was not truncated) and that its index exists and is newer than the BAM file]
+
+    Args:
+        path ([str]): [BAM file]
+        needIndex ([bool]): [True if a step reading the BAM file needs its index. A missing or stale index is then an error, otherwise a warning]
+
+    Returns:
+        [lst]: [(level, message) of each problem found]
+    """
+    size = os.path.getsize(path)
+    if size < len(BGZF_EOF):
+        return [("ERROR", f"{path} is empty or truncated")]
+    with open(path, "rb") as f:
+        f.seek(size - len(BGZF_EOF))
+        if f.read() != BGZF_EOF:
+            return [("ERROR", f"{path} has no BGZF end-of-file block. The file is truncated")]
+    level = "ERROR" if needIndex else "WARNING"
+    indexes = [index for index in [path + ".bai", re.sub(r"\.bam$", ".bai", path), path + ".csi"] if os.path.exists(index)]
+    if not indexes:
+        return [(level, f"{path} has no index (.bai or .csi)")]
+    if all(os.path.getmtime(index) < os.path.getmtime(path) for index in indexes):
+        return [(level, f"The index of {path} is older than the BAM file")]
+    return []
+
+def checkBowtie2Index(prefix):
+    """[Checks that all the files of a bowtie2 index exist, small (.bt2) or large (.bt2l) index]"""
+    if not prefix:
+        return [("ERROR", "reference_genome is missing from the configuration file")]
+    missing = [prefix + extension for extension in BOWTIE2_INDEX if not os.path.exists(prefix + extension) and not os.path.exists(prefix + extension + "l")]
+    if len(missing) == len(BOWTIE2_INDEX):
+        return [("ERROR", f"No bowtie2 index found with the prefix {prefix} (reference_genome)")]
+    return [("ERROR", f"Missing bowtie2 index file {path}") for path in missing]
+
+def checkSTARIndex(genomeDir):
+    """[Checks that the STAR genome directory contains a genome index]"""
+    if not genomeDir:
+        return [("ERROR", "reference_genome is missing from the configuration file")]
+    if not os.path.isdir(genomeDir):
+        return [("ERROR", f"STAR genome directory {genomeDir} (reference_genome) does not exist")]
+    return [("ERROR", f"Missing STAR index file {genomeDir}/{name}") for name in STAR_INDEX if not os.path.exists(f"{genomeDir}/{name}")]
+
+def checkGenomeSize(path):
+    """[Checks that the chromosome size file (genomeFileSize) has a chromosome name and an integer size on each line]"""
+    if not path:
+        return [("ERROR", "genomeFileSize is missing from the configuration file")]
+    if not os.path.isfile(path):
+        return [("ERROR", f"Chromosome size file {path} (genomeFileSize) does not exist")]
+    with open(path, "rt", errors="replace") as f:
+        for n, line in enumerate(f, 1):
+            fields = line.rstrip("\n").split("\t")
+            if len(fields) < 2 or not fields[1].isdigit():
+                return [("ERROR", f"{path} line {n} is not <chromosome>\\t<size>")]
+    return []
+
+def checkAnnotation(path):
+    """[Checks that the first lines of the gtf annotation have 9 tab separated columns with valid coordinates]"""
+    if not path:
+        return [("ERROR", "annotation is missing from the configuration file")]
+    if not os.path.isfile(path):
+        return [("ERROR", f"Annotation {path} does not exist")]
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", errors="replace") as f:
+        n = 0
+        for line in f:
+            if line.startswith("#") or not line.strip():
+                continue
+            n += 1
+            fields = line.rstrip("\n").split("\t")
+            if len(fields) != 9 or not fields[3].isdigit() or not fields[4].isdigit() or int(fields[3]) > int(fields[4]):
+                return [("ERROR", f"Annotation {path} is not a valid gtf file: {line.strip()[:100]}")]
+            if n == ANNOTATION_LINES:
+                break
+    if n == 0:
+        return [("ERROR", f"Annotation {path} is empty")]
+    return []
+
+def checkTool(configFileDict, key):
+    """[Checks that a tool of the configuration file exists and is executable. Scripts run through an interpreter (i.e java -jar picard.jar) only need to exist]"""
+    if not configFileDict.get(key, "").strip():
+        return [("ERROR", f"{key} is missing from the configuration file")]
+    tokens = configFileDict[key].split()
+    problems = []
+    if not tokens[0].startswith("/"):
+        if not shutil.which(tokens[0]):
+            problems.append(("ERROR", f"{key}: {tokens[0]} was not found in the PATH"))
+    elif not os.path.isfile(tokens[0]):
+        problems.append(("ERROR", f"{key}: {tokens[0]} does not exist"))
+    elif not tokens[0].endswith(SCRIPT_EXTENSIONS) and not os.access(tokens[0], os.X_OK):
+        problems.append(("ERROR", f"{key}: {tokens[0]} is not executable"))
+    for token in tokens[1:]:
+        if token.startswith("/") and not os.path.exists(token):
+            problems.append(("ERROR", f"{key}: {token} does not exist"))
+    return problems
+
+def checkCommand(command):
+    return [] if shutil.which(command) else [("ERROR", f"{command} was not found in the PATH")]
+
+def checkFiles(pattern, what):
+    return [] if glob.glob(pattern) else [("ERROR", f"No {what} found: {pattern}")]
+
+def getChecks(configFileDict, task_list, fastqDir=None, bamDir=None, bedDir=None, peaksDir=None):
+    """[Lists the checks of the inputs of the tasks to run. The input directories are the ones given on the command line, the outputs of the previous tasks of the run do not exist yet]
+
+    Returns:
+        [lst]: [(function, arguments) of each check]
+    """
+    technology = configFileDict.get('technology', "")
+    pairend = configFileDict.get('pairend', "0").strip() == "1"
+    checks = []
+
+    # FASTQ files
+    if fastqDir and ('1' in task_list or '1.1' in task_list or '2' in task_list):
+        manifest = configFileDict.get('sample_manifest') or buildManifest(configFileDict, fastqDir)
+        checks.append((checkFastqPairs, (manifest, pairend)))
+        files = [path for info in manifest['samples'].values() for reads in info['lanes'].values() for paths in reads.values() for path in paths]
+        full = set(random.sample(files, min(len(files), int(configFileDict.get('preflight_full_gzip', "2")))))
+        checks += [(checkGzip, (path, path in full)) for path in files]
+
+    # BAM, bed and peak files of the previous runs
+    bamTasks = []
+    if '3' in task_list and '2' not in task_list:
+        bamTasks.append('3')
+    if '4' in task_list and '3' not in task_list:
+        bamTasks.append('4')
+    if '4' not in task_list:
+        bamTasks += [task for task in ['4.1', '4.2', '5', '6', '8', '8.1'] if task in task_list]
+    if '9' in task_list and '2' not in task_list:
+        bamTasks.append('9')
+    if bamTasks and bamDir:
+        BAM_FILES = listFiles(bamDir, ".bam")
+        checks.append((checkFiles, (f"{bamDir}/*.bam", "BAM files")))
+        checks += [(checkBam, (path, '5' in bamTasks)) for path in BAM_FILES]
+    if '7' in task_list and '6' not in task_list and bedDir:
+        checks.append((checkFiles, (f"{bedDir}/*.bed", "bed files")))
+    if '8.1' in task_list and '8' not in task_list and peaksDir:
+        checks.append((checkFiles, (f"{peaksDir}/*.MACS/*.narrowPeak", "MACS2 narrowPeak files")))
+
+    # Reference files
+    if '2' in task_list:
+        if configFileDict.get('mapper', "").strip() == "STAR":
+            checks.append((checkSTARIndex, (configFileDict.get('reference_genome', "").strip(),)))
+            checks.append((checkAnnotation, (configFileDict.get('annotation', "").strip(),)))
+        else:
+            checks.append((checkBowtie2Index, (configFileDict.get('reference_genome', "").strip(),)))
+    if '7' in task_list or '8' in task_list or ('5' in task_list and configFileDict.get('groups') != None):
+        checks.append((checkGenomeSize, (configFileDict.get('genomeFileSize', "").strip(),)))
+    if '9' in task_list:
+        checks.append((checkAnnotation, (configFileDict.get('annotation', "").strip(),)))
+
+    # Tools
+    tools = set()
+    commands = set()
+    for task in task_list:
+        tools.update(TASK_TOOLS.get(task, []))
+        commands.update(TASK_COMMANDS.get(task, []))
+    if '2' in task_list:
+        tools.update(['star', 'samtools'] if configFileDict.get('mapper', "").strip() == "STAR" else ['bowtie2', 'samtools'])
+    if '5' in task_list and configFileDict.get('groups') != None:
+        tools.update(['bigWigMerge', 'bedGraphToBigWig'])
+    if '9' in task_list:
+        tools.add(configFileDict.get('quantificationSoftware', "featureCounts").strip())
+    if configFileDict.get('executor', "slurm").strip() == "slurm" and configFileDict.get('dry_run') != "1":
+        tools.add('wsbatch')
+    checks += [(checkTool, (configFileDict, key)) for key in sorted(tools)]
+    checks += [(checkCommand, (command,)) for command in sorted(commands)]
+    return checks
+
+def runPreflight(configFileDict, task_list, fastqDir=None, bamDir=None, bedDir=None, peaksDir=None):
+    """[Checks all the inputs of the run in parallel before anything is submitted: fastq pairing and gzip integrity, BAM files and their indexes, reference index files, chromosome sizes, annotation and tools]
+
+    Every fastq.gz file is decompressed from its start, preflight_full_gzip of them (default 2), picked at random, are decompressed entirely. The checks run in preflight_threads threads (default 16).
+
+    Args:
+        configFileDict ([dict]): [configuration file dictionary]
+        task_list ([lst]): [Tasks to run]
+        fastqDir ([str]): [fastq directory given on the command line]
+        bamDir ([str]): [bam directory given on the command line]
+        bedDir ([str]): [bed directory given on the command line]
+        peaksDir ([str]): [peak directory given on the command line]
+
+    Returns:
+        [tuple]: [number of checks, list of error messages and list of warning messages]
+    """
+    checks = getChecks(configFileDict, task_list, fastqDir, bamDir, bedDir, peaksDir)
+
+    def run(check):
+        function, arguments = check
+        try:
+            return function(*arguments)
+        except OSError as e:
+            return [("ERROR", f"{function.__name__}: {e}")]
+
+    with ThreadPoolExecutor(max_workers=int(configFileDict.get('preflight_threads', "16"))) as pool:
+        problems = [problem for result in pool.map(run, checks) for problem in result]
+    errors = [message for level, message in problems if level == "ERROR"]
+    warnings = [message for level, message in problems if level == "WARNING"]
+    return len(checks), errors, warnings
@@ -4,6 +4,7 @@ import json
 
 from reportCreator import HtmlReport
 from ColorBamQC import *
+from jobCheck import read_status, check_exitCodes
 from collections import defaultdict 
 import os 
 import sys
@@ -17,6 +18,7 @@ def readDictFromFile(dico):
 
 def getAllExitCodesPerTask(configFileDict,task_dico):
     dico = defaultdict(dict)
+    status = read_status(configFileDict.get('job_status_file'))
     for task in configFileDict['task_list']:
         #vrb.bullet(task)
         if task == "report":
@@ -28,23 +30,10 @@ def getAllExitCodesPerTask(configFileDict,task_dico):
             #print(logFiles)
             for file in logFiles:
  
-                dico[task][file] = check_exitCodes(file)
+                dico[task][file] = check_exitCodes(file, status)
     return dico
 
 
-def check_exitCodes(logFile):
-    f = open(logFile, "rb")
-    f.seek(-2, os.SEEK_END)
-    while f.read(1) != b'\n':
-        f.seek(-2, os.SEEK_CUR)
-    last_line = f.readline().decode()
-    line = last_line.rstrip().split("|")
-    if line[0] == "__JOB_SUMMARY_INFO":
-        if line[-1] == "Successfuly completed":
-            return True 
-        else:
-            return False
-
 def createLogListForReport(dico,task):
     lst = []
     logFiles = dico[task]
@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+
+import math
+import os
+import re
+from datetime import datetime
+
+from executors import getMemoryMB, getTimeLimit
+from resultCache import getPaths
+from sampleManifest import getSampleFastq
+
+HISTORY_COLUMNS = ["step", "size", "maxrss_mb", "elapsed_s", "cpus_used", "date"]
+DATA_FILES = re.compile(r"\.(fastq|fq)(\.gz)?$|\.(bam|bed|narrowPeak|bdg|bw)$")
+MAX_HISTORY = 200
+MIN_MEM_MB = 1024
+MIN_TIME_S = 600
+
+
+def getStepName(waitKey, cmd):
+    """[Returns the name under which the resources of a job are recorded: the step wait key and the tool it runs, i.e MAP_WAIT:bowtie2. The set -o pipefail of the piped commands is skipped]"""
+    return "{}:{}".format(waitKey, os.path.basename(re.sub(r"^set -o pipefail;\s*", "", cmd).split(" ")[0]))
+
+def getInputSize(configFileDict, sample, cmd):
+    """[Returns the size in bytes of the input of a job when it is submitted]
+
+    The input is the data files of the command that already exist. When they are still to be created by the previous steps, the fastq files of the sample are used instead. The same size is used to record and to predict the resources so both always match.
+
+    Args:
+        configFileDict ([dict]): [configuration file dictionary]
+        sample ([str]): [Sample ID]
+        cmd ([str]): [Command of the job]
+
+    Returns:
+        [int]: [Input size in bytes]
+    """
+    files = [path for path in getPaths(cmd) if DATA_FILES.search(path) and os.path.isfile(path)]
+    if not files and sample in configFileDict.get('sample_manifest', {}).get('samples', {}):
+        files = [path for read in ["R1", "R2"] for path in getSampleFastq(configFileDict, sample, read)]
+    return sum(os.path.getsize(path) for path in files)
+
+def getSeconds(time):
+    """[Converts a sacct time ([D-]HH:MM:SS or MM:SS.mmm) to seconds]"""
+    days = 0
+    if "-" in time:
+        days, time = time.split("-")
+    parts = [float(part) for part in time.split(":")]
+    while len(parts) < 3:
+        parts.insert(0, 0)
+    return int(days) * 86400 + parts[0] * 3600 + parts[1] * 60 + parts[2]
+
+def formatTime(seconds):
+    minutes = math.ceil(seconds / 60)
+    days, minutes = divmod(minutes, 1440)
+    if days:
+        return "{}-{:02d}:{:02d}:00".format(days, minutes // 60, minutes % 60)
+    return "{:02d}:{:02d}:00".format(minutes // 60, minutes % 60)
+
+def readHistory(historyFile):
+    """[Reads the resources used by the previous jobs]
+
+    Returns:
+        [lst]: [One dictionary per job with the HISTORY_COLUMNS]
+    """
+    if not historyFile or not os.path.exists(historyFile):
+        return []
+    history = []
+    with open(historyFile, "rt") as f:
+        for line in f:
+            if line.startswith("step\t"):
+                continue
+            row = dict(zip(HISTORY_COLUMNS, line.rstrip("\n").split("\t")))
+            for column in ["size", "maxrss_mb", "elapsed_s", "cpus_used"]:
+                row[column] = float(row[column])
+            history.append(row)
+    return history
+
+def recordHistory(historyFile, status, jobResources):
+    """[Appends the resources used by the successful jobs of a run to the history file]
+
+    Args:
+        historyFile ([str]): [History file, created if it does not exist]
+        status ([dict]): [Status of each log file, as written by jobCheck.write_status]
+        jobResources ([dict]): [Step and input size of each log file, recorded when the jobs were submitted]
+    """
+    rows = []
+    date = datetime.now().strftime("%Y-%m-%d")
+    for logFile, info in status.items():
+        if not info['Success'] or logFile not in jobResources or isCachedLog(logFile):
+            continue
+        elapsed = getSeconds(info['Elapsed'])
+        if elapsed == 0:
+            continue
+        maxRSS = getMemoryMB(info['MaxRSS']) if info['MaxRSS'] else 0
+        cpusUsed = getSeconds(info['TotalCPU']) / elapsed
+        rows.append([jobResources[logFile]['step'], jobResources[logFile]['size'], maxRSS, int(elapsed), round(cpusUsed, 2), date])
+    if not rows:
+        return
+    os.makedirs(os.path.dirname(os.path.abspath(historyFile)), exist_ok=True)
+    newFile = not os.path.exists(historyFile)
+    with open(historyFile, "a") as g:
+        if newFile:
+            g.write("\t".join(HISTORY_COLUMNS) + "\n")
+        for row in rows:
+            g.write("\t".join(str(value) for value in row) + "\n")
+
+def isCachedLog(logFile):
+    """[Checks whether a job found its result in the cache when it started, in which case its resources say nothing about the step]"""
+    if not os.path.exists(logFile):
+        return False
+    with open(logFile, "rt", errors="replace") as f:
+        return "Result found in cache." in f.read(4096)
+
+def predict(points, size):
+    """[Predicts a resource from the input size with a least squares line shifted up by its largest underestimation in the history]
+
+    Args:
+        points ([lst]): [(input size, resource used) of the previous jobs of the step]
+        size ([int]): [Input size of the job]
+
+    Returns:
+        [float]: [Predicted resource]
+    """
+    n = len(points)
+    meanX = sum(x for x, y in points) / n
+    meanY = sum(y for x, y in points) / n
+    variance = sum((x - meanX) ** 2 for x, y in points)
+    slope = max(sum((x - meanX) * (y - meanY) for x, y in points) / variance, 0) if variance else 0
+    intercept = meanY - slope * meanX
+    residual = max(y - (intercept + slope * x) for x, y in points)
+    return intercept + slope * size + residual
+
+def getSortResources(configFileDict, slurm):
+    """[Returns the threads and the memory per thread of a samtools sort running in the same job as the mapper, from the slurm resources of the job]
+
+    The sort gets one thread per cpu of the job and the memory left by the mapper (sort_mapper_memory, default 4G for the bowtie2 index of a mammalian genome), less a 20% margin for the compression buffers.
+
+    Args:
+        configFileDict ([dict]): [configuration file dictionary]
+        slurm ([str]): [slurm resources of the job, i.e configFileDict['slurm_mapping']]
+
+    Returns:
+        [tuple]: [Number of sort threads and memory per thread, i.e (8, "3686M")]
+    """
+    cpus = re.search(r"(--cpus-per-task=|-c )(\d+)", slurm)
+    threads = int(cpus.group(2)) if cpus else 1
+    mem = re.search(r"--mem=(\S+)", slurm)
+    if not mem:
+        # samtools default
+        return threads, "768M"
+    available = getMemoryMB(mem.group(1)) - getMemoryMB(configFileDict.get('sort_mapper_memory', "4G").strip())
+    return threads, "{}M".format(max(int(available * 0.8 / threads), 256))
+
+def getSortTmp(configFileDict, name):
+    """[Returns the prefix of the temporary files of a samtools sort: in sort_tmp_dir when it is set (i.e a node-local directory such as /tmp), in the bam directory otherwise]"""
+    return "{}/{}.tmp".format(configFileDict.get('sort_tmp_dir', "").strip().rstrip("/") or configFileDict['bam_dir'], name)
+
+def getJobCpus(slurm):
+    """[Returns the cpus requested by slurm resources, 1 if -c is not set]"""
+    cpus = re.search(r"(--cpus-per-task=|-c )(\d+)", slurm)
+    return int(cpus.group(2)) if cpus else 1
+
+def setJobCpus(slurm, cpus):
+    """[Sets the cpus requested by slurm resources, replacing -c if it is set]"""
+    if re.search(r"(--cpus-per-task=|-c )(\d+)", slurm):
+        return re.sub(r"(--cpus-per-task=|-c )(\d+)", lambda match: match.group(1) + str(cpus), slurm)
+    return f"{slurm} -c {cpus}"
+
+def getTrimCores(configFileDict, size=None):
+    """[Returns the cores of cutadapt (-j) and of its job: trim_cores (default 1). With trim_size_per_core (i.e 2G), a job gets one core per trim_size_per_core of fastq files, up to trim_cores]
+
+    Args:
+        configFileDict ([dict]): [configuration file dictionary]
+        size ([int], optional): [Size in bytes of the fastq files trimmed by the job. None to get trim_cores]
+
+    Returns:
+        [int]: [Number of cores]
+    """
+    cores = max(int(configFileDict.get('trim_cores', "1").strip() or 1), 1)
+    sizePerCore = configFileDict.get('trim_size_per_core', "").strip()
+    if size is None or not sizePerCore:
+        return cores
+    return min(max(math.ceil(size / (max(getMemoryMB(sizePerCore), 1) * 1024 ** 2)), 1), cores)
+
+def getMappingChunks(configFileDict, sample):
+    """[Returns the number of chunks the reads of a sample are split into to be mapped by independent jobs: map_chunks (default 1, not split) for the samples whose fastq files are at least map_chunk_min_size (default 0)]"""
+    nChunks = int(configFileDict.get('map_chunks', "1").strip() or 1)
+    if nChunks <= 1:
+        return 1
+    minSize = configFileDict.get('map_chunk_min_size', "").strip()
+    # The size of the raw fastq files, the trimmed ones may not exist yet
+    if minSize and getInputSize(configFileDict, sample, "") < getMemoryMB(minSize) * 1024 ** 2:
+        return 1
+    return nChunks
+
+def getGroupResources(configFileDict, slurm):
+    """[Returns how the samples of a STAR group share the allocation of slurm_mapping once the genome is loaded in shared memory]
+
+    The genome takes star_genome_memory (default 32G) once and each STAR process star_sample_memory (default 10G), 60% of which is used to sort its BAM file. The number of STAR processes running at the same time is the number of processes fitting in the memory left by the genome, and the cpus of the allocation are split between them. A group maps star_group_size samples (default: one round of processes).
+
+    Args:
+        configFileDict ([dict]): [configuration file dictionary]
+        slurm ([str]): [slurm resources of the groups, i.e configFileDict['slurm_mapping']]
+
+    Returns:
+        [dict]: [size (samples per group), workers (STAR processes at the same time), threads (per process) and sort_ram (bytes, per process)]
+    """
+    mem = re.search(r"--mem=(\S+)", slurm)
+    cpus = re.search(r"(--cpus-per-task=|-c )(\d+)", slurm)
+    sampleMemory = getMemoryMB(configFileDict.get('star_sample_memory', "10G").strip())
+    available = (getMemoryMB(mem.group(1)) if mem else 0) - getMemoryMB(configFileDict.get('star_genome_memory', "32G").strip())
+    workers = max(available // sampleMemory, 1)
+    threads = max((int(cpus.group(2)) if cpus else 1) // workers, 1)
+    size = int(configFileDict.get('star_group_size', "").strip() or workers)
+    return {'size': size, 'workers': workers, 'threads': threads, 'sort_ram': int(sampleMemory * 0.6) * 1024 ** 2}
+
+def tuneResources(configFileDict, step, slurm, size):
+    """[Sets --mem, --time and -c of the slurm resources of a job from the resources used by the previous jobs of the same step]
+
+    The requests are only lowered, never raised above the resources of the configuration file, and only once resource_min_jobs (default 5) jobs of the step were recorded in resource_history.
+
+    Args:
+        configFileDict ([dict]): [configuration file dictionary]
+        step ([str]): [Step name, see getStepName]
+        slurm ([str]): [slurm resources of the step, i.e configFileDict['slurm_mapping']]
+        size ([int]): [Input size of the job, see getInputSize]
+
+    Returns:
+        [str]: [slurm resources of the job]
+    """
+    history = [row for row in readHistory(configFileDict.get('resource_history', "").strip()) if row['step'] == step][-MAX_HISTORY:]
+    if len(history) < int(configFileDict.get('resource_min_jobs', "5")):
+        return slurm
+    margin = 1 + float(configFileDict.get('resource_margin', "0.2"))
+
+    mem = max(predict([(row['size'], row['maxrss_mb']) for row in history], size) * margin, MIN_MEM_MB)
+    time = max(predict([(row['size'], row['elapsed_s']) for row in history], size) * margin, MIN_TIME_S)
+    cpus = max(math.ceil(max(row['cpus_used'] for row in history) * margin), 1)
+
+    def setMem(match):
+        return "--mem={}G".format(math.ceil(mem / 1024)) if mem < getMemoryMB(match.group(1)) else match.group(0)
+    def setTime(match):
+        return match.group(1) + formatTime(time) if time < getTimeLimit(match.group(2)) else match.group(0)
+    def setCpus(match):
+        return match.group(1) + str(cpus) if cpus < int(match.group(2)) else match.group(0)
+
+    slurm = re.sub(r"--mem=(\S+)", setMem, slurm)
+    slurm = re.sub(r"(--time=|-t )(\S+)", setTime, slurm)
+    slurm = re.sub(r"(--cpus-per-task=|-c )(\d+)", setCpus, slurm)
+    return slurm
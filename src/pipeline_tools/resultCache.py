@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+
+import glob
+import json
+import os
+import re
+import subprocess
+from sys import argv, exit
+
+from scratchStaging import PATH_PATTERN, getConfigPaths, getStageInfo, runStaged
+
+
+def getPaths(cmd):
+    """[Returns all the absolute paths written in a command, with the wildcards expanded. A wildcard matching no file is kept as it is]
+
+    Args:
+        cmd ([str]): [Command to run]
+
+    Returns:
+        [lst]: [Paths of the files and directories used or created by the command]
+    """
+    paths = []
+    for token in re.findall(PATH_PATTERN, cmd):
+        for path in (glob.glob(token) or [token] if glob.has_magic(token) else [token]):
+            if path not in paths:
+                paths.append(path)
+    return paths
+
+def fingerprint(paths):
+    """[Returns the size and modification time of the existing files and the existing directories among paths]"""
+    fp = {}
+    for path in paths:
+        if os.path.isfile(path):
+            stat = os.stat(path)
+            fp[path] = [stat.st_size, stat.st_mtime_ns]
+        elif os.path.isdir(path):
+            fp[path] = "directory"
+    return fp
+
+def readRecord(recordFile):
+    if not os.path.exists(recordFile):
+        return {}
+    with open(recordFile, "rt") as f:
+        return json.load(f)
+
+def writeRecord(recordFile, record):
+    with open(recordFile, "w") as g:
+        json.dump(record, g, indent=1)
+
+def isCached(record, cmd):
+    """[Checks whether a command already ran successfully with the same inputs and whether its outputs were not changed since then]
+
+    Args:
+        record ([dict]): [Cache record of the job]
+        cmd ([str]): [Command to run]
+
+    Returns:
+        [bool]: [True if the command does not need to be run again]
+    """
+    done = record.get('done')
+    if not done or done['cmd'] != cmd or not done['outputs']:
+        return False
+    files = dict(done['inputs'], **done['outputs'])
+    return fingerprint(files.keys()) == files
+
+def runCached(recordFile):
+    """[Runs the command of a cache record unless its result is cached and records its inputs and outputs if it succeeds]
+
+    The inputs are the files used by the command that existed before it ran and were left untouched, the outputs are the files and directories it created or modified. The tools are part of the inputs, so a new version of a tool invalidates the cache.
+
+    Args:
+        recordFile ([str]): [Cache record written by the pipeline when submitting the job]
+
+    Returns:
+        [int]: [Exit code of the command]
+    """
+    record = readRecord(recordFile)
+    cmd = record['cmd']
+    if isCached(record, cmd):
+        print("Result found in cache. Nothing to do.", flush=True)
+        return 0
+
+    paths = getPaths(cmd)
+    before = fingerprint(paths)
+    if 'scratch' in record:
+        returncode = runStaged(cmd, record['scratch'], record['exclude'])
+    else:
+        returncode = subprocess.call(cmd, shell=True, executable="/bin/bash")
+    if returncode != 0:
+        return returncode
+
+    after = fingerprint(getPaths(cmd))
+    inputs = {path: fp for path, fp in before.items() if fp != "directory" and after.get(path) == fp}
+    outputs = {path: fp for path, fp in after.items() if path not in before or (fp != "directory" and before[path] != fp)}
+    record['done'] = {'cmd': cmd, 'inputs': inputs, 'outputs': outputs}
+    writeRecord(recordFile, record)
+    return 0
+
+def isProcessedJob(configFileDict, sample):
+    """[Checks whether a job belongs to a sample processed by a previous run: the job of the sample or of one of its lanes or chunks (SampleID.*). The sample IDs can contain dots, the job belongs to the longest sample ID of the run it starts with]"""
+    samples = [sampleID for sampleID in configFileDict.get('sample_prefix', []) if sample == sampleID or sample.startswith(f"{sampleID}.")]
+    return max(samples, key=len, default=sample) in configFileDict.get('processed_samples', [])
+
+def getUncachedJobs(configFileDict, waitKey, JOBS, log_dir, dryRun=False, stage=False):
+    """[Removes the jobs whose result is cached from the jobs of a step and wraps the other ones so that they record their result]
+
+    A job that waits for other jobs is always submitted as its inputs may still change. It checks the cache again when it starts. In incremental mode, the jobs of the samples processed by the previous runs (configFileDict['processed_samples'], see sampleManifest.getProcessedSamples) are removed as well, including the jobs of their lanes or chunks (SampleID.*).
+
+    Args:
+        configFileDict ([dict]): [configuration file dictionary]
+        waitKey ([str]): [Key of the step wait condition, i.e TRIM_WAIT]
+        JOBS ([lst]): [List of (sample, cmd, dependency) tuples]
+        log_dir ([str]): [Directory where the slurm logs and cache records of the step are written]
+        stage ([bool]): [Run the jobs in the node-local scratch directory, see scratchStaging.runStaged]
+
+    Returns:
+        [lst]: [List of (sample, cmd, dependency) tuples to submit]
+    """
+    configPaths = getConfigPaths(configFileDict) if stage else set()
+    UNCACHED_JOBS = []
+    for sample, cmd, dependency in JOBS:
+        recordFile = f"{log_dir}/{sample}.{waitKey}.cache.json"
+        record = readRecord(recordFile)
+        if isProcessedJob(configFileDict, sample):
+            print(f"{sample} was processed by a previous run. Skipping it.")
+            configFileDict.setdefault(f"{waitKey}_DICT", {})[sample] = ""
+            continue
+        if not dependency and isCached(record, cmd):
+            print(f"Result of {sample} found in cache. Skipping it.")
+            configFileDict.setdefault(f"{waitKey}_DICT", {})[sample] = ""
+            continue
+        if dryRun:
+            UNCACHED_JOBS.append((sample, cmd, dependency))
+            continue
+        record['cmd'] = cmd
+        record.pop('scratch', None)
+        record.pop('exclude', None)
+        if stage:
+            record.update(getStageInfo(configFileDict, cmd, configPaths))
+        writeRecord(recordFile, record)
+        UNCACHED_JOBS.append((sample, "python3 {cacheScript} {record}".format(cacheScript = configFileDict['cacheScript'], record = recordFile), dependency))
+    return UNCACHED_JOBS
+
+
+if __name__ == "__main__":
+    if len(argv) != 2:
+        print("Usage: resultCache.py <cache record>")
+        exit(1)
+    exit(runCached(argv[1]))
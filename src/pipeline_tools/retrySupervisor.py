@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import re
+import subprocess
+import time
+from datetime import datetime
+from sys import argv, exit
+
+from executors import getMemoryMB, getTimeLimit, parseDependency, formatDependency
+from resourceModel import formatTime
+from runMonitor import FINISHED, pollJobs
+
+RETRY_STATES = ("OUT_OF_MEMORY", "TIMEOUT")
+
+
+def useRetry(configFileDict):
+    """[Checks whether the jobs killed for their memory or time limit are resubmitted with more resources: auto_retry is set and the jobs are run with slurm]"""
+    if configFileDict.get('auto_retry', "0").strip() != "1" or configFileDict.get('dry_run') == "1":
+        return False
+    return configFileDict.get('executor', "slurm").strip() == "slurm"
+
+def isRetryStep(configFileDict, waitKey):
+    """[Checks whether the jobs of a step are resubmitted when they run out of memory or time: the step is listed in retry_steps]"""
+    if not useRetry(configFileDict):
+        return False
+    steps = configFileDict.get('retry_steps', "map pcr_duplication filter_bam").split()
+    return waitKey[:-len("_WAIT")].lower() in steps
+
+def getDependencyType(configFileDict):
+    """[Returns the dependency type of the per-sample jobs. With auto_retry, a job only starts once the jobs it waits for succeeded, so that it can wait for their resubmission]"""
+    return "afterok" if useRetry(configFileDict) else "afterany"
+
+def recordJob(configFileDict, SLURM_CMD, jid):
+    """[Records a submitted job for the retry supervisor]"""
+    configFileDict.setdefault('retry_jobs', {})[jid] = {'cmd': SLURM_CMD, 'managed': False, 'retry': False, 'shared': False, 'attempt': 1}
+
+def markJobs(configFileDict, waitKey, JID, shared=False):
+    """[Marks the per-sample jobs of a step, which wait with afterok for their own samples. The jobs of the steps listed in retry_steps are resubmitted when they run out of memory or time]
+
+    Args:
+        configFileDict ([dict]): [configuration file dictionary]
+        waitKey ([str]): [Key of the step wait condition, i.e MAP_WAIT]
+        JID ([str]): [comma separated slurm job IDs of the step]
+        shared ([bool]): [The jobs run several samples (job array or packs)]
+    """
+    for jid in JID.split(","):
+        if jid in configFileDict.get('retry_jobs', {}):
+            configFileDict['retry_jobs'][jid].update({'managed': True, 'retry': isRetryStep(configFileDict, waitKey) and not shared, 'shared': shared})
+
+def getRetryFile(configFileDict):
+    return "{raw_log}/{uid}_retry_jobs.json".format(raw_log = configFileDict['raw_log'], uid = configFileDict['uid'])
+
+def writeRetryJobs(configFileDict, files):
+    """[Writes the jobs of the run and the retry settings read by the retry supervisor. It is written again once the last jobs of the run are submitted]
+
+    Args:
+        configFileDict ([dict]): [configuration file dictionary]
+        files ([lst]): [Files listing the log files of the jobs, updated with the log files of the resubmitted jobs]
+    """
+    settings = {key: configFileDict.get(key, default).strip() for key, default in [('retry_max_attempts', "2"), ('retry_mem_factor', "2"), ('retry_time_factor', "2"), ('retry_max_mem', ""), ('retry_max_time', ""), ('retry_interval', "120")]}
+    retryFile = getRetryFile(configFileDict)
+    with open(retryFile + ".tmp", "w") as g:
+        json.dump({'uid': configFileDict['uid'], 'settings': settings, 'files': files, 'jobs': configFileDict.get('retry_jobs', {})}, g, indent=1)
+    os.replace(retryFile + ".tmp", retryFile)
+    return retryFile
+
+def submitRetrySupervisor(configFileDict, submitJob):
+    """[Submits the retry supervisor of the run. It runs alongside the jobs of the run until all the per-sample jobs are done]
+
+    Args:
+        configFileDict ([dict]): [configuration file dictionary]
+        submitJob ([function]): [slurmTools.submitJob]
+
+    Returns:
+        [str]: [slurm job ID of the supervisor]
+    """
+    cmd = "python3 {supervisor} {retryFile} {raw_log}/{uid}_retries.tsv".format(supervisor = configFileDict['retrySupervisor'], retryFile = getRetryFile(configFileDict), raw_log = configFileDict['raw_log'], uid = configFileDict['uid'])
+    SLURM_CMD = "{wsbatch} {slurm} -o {raw_log}/slurm-%j.out --wrap=\"{cmd}\"".format(wsbatch = configFileDict['wsbatch'], slurm = configFileDict.get('slurm_retry_supervisor', configFileDict['slurm_general']), raw_log = configFileDict['raw_log'], cmd = cmd)
+    out = submitJob(configFileDict, SLURM_CMD)
+    return out.rstrip().split(" ")[-1]
+
+def escalate(SLURM_CMD, state, settings):
+    """[Raises the memory (OUT_OF_MEMORY) or the time limit (TIMEOUT) of a wsbatch command by the retry factors of the configuration file, up to retry_max_mem and retry_max_time]
+
+    Returns:
+        [str]: [wsbatch command with the new resources. None if the resources are already at their maximum]
+    """
+    def setMem(match):
+        mem = getMemoryMB(match.group(2))
+        new = mem * float(settings['retry_mem_factor'])
+        if settings['retry_max_mem']:
+            new = min(new, getMemoryMB(settings['retry_max_mem']))
+        return match.group(1) + "{}G".format(int(-(-new // 1024))) if new > mem else match.group(0)
+
+    def setTime(match):
+        limit = getTimeLimit(match.group(2))
+        new = limit * float(settings['retry_time_factor'])
+        if settings['retry_max_time']:
+            new = min(new, getTimeLimit(settings['retry_max_time']))
+        return match.group(1) + formatTime(new) if new > limit else match.group(0)
+
+    # Only the slurm options are changed, not the command of the job
+    options, wrap, cmd = SLURM_CMD.partition("--wrap=")
+    if state == "OUT_OF_MEMORY":
+        escalated = re.sub(r"(--mem=)(\S+)", setMem, options, count=1)
+    else:
+        escalated = re.sub(r"(--time=|-t )(\S+)", setTime, options, count=1)
+    return escalated + wrap + cmd if escalated != options else None
+
+def getResources(SLURM_CMD):
+    """[Returns the memory and time limit of a wsbatch command, i.e --mem=40G --time=12:00:00]"""
+    return " ".join(match.group(0) for match in re.finditer(r"(--mem=|--time=|-t )\S+", SLURM_CMD.partition("--wrap=")[0]))
+
+def isFinished(jid, states):
+    """[Returns the final state of a job, None while it is pending or running. A job array is done once all its tasks are, it failed if any task failed]"""
+    if jid in states:
+        return states[jid][0] if states[jid][0] in FINISHED else None
+    tasks = [state for job, (state, elapsed) in states.items() if job.startswith(f"{jid}_")]
+    if not tasks or any(state not in FINISHED for state in tasks):
+        return None
+    return "COMPLETED" if all(state == "COMPLETED" for state in tasks) else next(state for state in tasks if state != "COMPLETED")
+
+def replaceJID(SLURM_CMD, old, new):
+    """[Replaces a job ID in all the conditions of the dependency of a wsbatch command, i.e afterok:1,afterany:1 when a job waits for the same job for its sample and its lane]"""
+    return re.sub(r"--dependency=\S*", lambda match: re.sub(r"(?<=[:,]){}(?=[:,]|$)".format(re.escape(old)), new, match.group(0)), SLURM_CMD)
+
+def updateDependency(jid, record, done):
+    """[Sets the dependency of a pending job from its record, leaving out the jobs already completed]"""
+    conditions = [[condition, None if JIDs is None else [job for job in JIDs if done.get(job) != "COMPLETED"]] for condition, JIDs in parseDependency(record['cmd'])]
+    subprocess.run("scontrol update JobId={jid} Dependency={dependency}".format(jid = jid, dependency = formatDependency(conditions, ":") or "''"), shell=True)
+
+def replaceLogs(files, old, new):
+    """[Replaces the log file of a resubmitted job by the log file of its new job in the lists of log files of the run]"""
+    for path in files:
+        if not os.path.exists(path):
+            continue
+        with open(path, "rt") as f:
+            text = f.read()
+        with open(path + ".tmp", "w") as g:
+            g.write(text.replace(f"_slurm-{old}.", f"_slurm-{new}."))
+        os.replace(path + ".tmp", path)
+
+def resubmit(jobs, jid, state, settings, files, retryLog):
+    """[Resubmits a job killed for its memory or time limit with more resources and moves the jobs waiting for it onto the new job]
+
+    Returns:
+        [str]: [slurm job ID of the new job. None if the job cannot be resubmitted]
+    """
+    record = jobs[jid]
+    SLURM_CMD = escalate(record['cmd'], state, settings)
+    if record['attempt'] > int(settings['retry_max_attempts']) or SLURM_CMD is None:
+        return None
+    # The jobs it waited for are done
+    SLURM_CMD = re.sub(r"--dependency=[^\s]*", "", SLURM_CMD)
+    try:
+        out = subprocess.check_output(SLURM_CMD, shell=True, universal_newlines=True, stderr=subprocess.STDOUT)
+    except subprocess.CalledProcessError as e:
+        print("Resubmission of {} failed: {}".format(jid, e.output.strip()), flush=True)
+        return None
+    new = out.rstrip().split(" ")[-1]
+    jobs[new] = dict(record, cmd = SLURM_CMD, attempt = record['attempt'] + 1)
+    record['replaced_by'] = new
+    with open(retryLog, "a") as g:
+        g.write("\t".join([datetime.now().strftime("%Y-%m-%dT%H:%M:%S"), jid, state, getResources(record['cmd']), new, getResources(SLURM_CMD), str(record['attempt'] + 1)]) + "\n")
+    print("{} ({}) resubmitted as {} with {}".format(jid, state, new, getResources(SLURM_CMD)), flush=True)
+    replaceLogs(files, jid, new)
+    return new
+
+def loadJobs(retryFile, jobs, replaced):
+    """[Adds the jobs submitted since the last read of the retry file. The new jobs waiting for a resubmitted job are moved onto the new job]
+
+    Returns:
+        [tuple]: [content of the retry file, job IDs of the new jobs moved onto a resubmitted job]
+    """
+    with open(retryFile, "rt") as f:
+        run = json.load(f)
+    moved = []
+    for jid, record in run['jobs'].items():
+        if jid in jobs:
+            continue
+        jobs[jid] = record
+        for old, new in replaced.items():
+            record['cmd'] = replaceJID(record['cmd'], old, new)
+        if record['cmd'] != run['jobs'][jid]['cmd']:
+            moved.append(jid)
+    return run, moved
+
+def formatCommand(SLURM_CMD, conditions):
+    """[Sets the dependency of a wsbatch command]"""
+    return re.sub(r"--dependency=[^\s]*", "--dependency=" + formatDependency(conditions), SLURM_CMD)
+
+def superviseRun(retryFile, retryLog):
+    """[Follows the jobs of a run with a single sacct query per poll. A job of retry_steps killed for its memory or time limit is resubmitted with more resources and the jobs waiting for it are moved onto the new job. The per-sample jobs waiting for a job that failed for good are cancelled (job arrays and packs stop waiting for it instead)]
+
+    Args:
+        retryFile ([str]): [Jobs of the run and retry settings, see writeRetryJobs]
+        retryLog ([str]): [Table of the resubmitted jobs]
+
+    Returns:
+        [int]: [Number of jobs resubmitted]
+    """
+    jobs = {}
+    replaced = {}
+    done = {}
+    if not os.path.exists(retryLog):
+        with open(retryLog, "w") as g:
+            g.write("\t".join(["time", "job_id", "state", "resources", "new_job_id", "new_resources", "attempt"]) + "\n")
+    while True:
+        run, moved = loadJobs(retryFile, jobs, replaced)
+        settings = run['settings']
+        try:
+            states = pollJobs([jid for jid in jobs if jid not in done])
+        except subprocess.CalledProcessError:
+            time.sleep(int(settings['retry_interval']))
+            continue
+        for jid in moved:
+            if isFinished(jid, states) is None:
+                updateDependency(jid, jobs[jid], done)
+
+        for jid in list(jobs):
+            state = isFinished(jid, states)
+            if jid in done or state is None:
+                continue
+            done[jid] = state
+            if state == "COMPLETED":
+                continue
+            new = resubmit(jobs, jid, state, settings, run['files'], retryLog) if jobs[jid]['retry'] and state in RETRY_STATES else None
+            if new:
+                replaced[jid] = new
+            for waiting, record in jobs.items():
+                # Only the pending jobs still wait for their dependency
+                if waiting in done or states.get(waiting, ("PENDING",))[0] != "PENDING" or isFinished(waiting, states) is not None:
+                    continue
+                conditions = parseDependency(record['cmd'])
+                if not any(JIDs and jid in JIDs for condition, JIDs in conditions):
+                    continue
+                if new:
+                    record['cmd'] = replaceJID(record['cmd'], jid, new)
+                    updateDependency(waiting, record, done)
+                elif record['managed'] and any(condition == "afterok" and jid in JIDs for condition, JIDs in conditions if JIDs):
+                    if record['shared']:
+                        record['cmd'] = formatCommand(record['cmd'], [[condition, JIDs if JIDs is None else [job for job in JIDs if job != jid]] for condition, JIDs in conditions])
+                        updateDependency(waiting, record, done)
+                    else:
+                        print("Cancelling {}: {} failed with {}".format(waiting, jid, state), flush=True)
+                        subprocess.run(f"scancel {waiting}", shell=True)
+
+        if all(jid in done for jid, record in jobs.items() if record['managed']):
+            return len(replaced)
+        time.sleep(int(settings['retry_interval']))
+
+
+if __name__ == "__main__":
+    if len(argv) != 3:
+        print("Usage: retrySupervisor.py <retry jobs json> <retries tsv>")
+        exit(1)
+    print("{} jobs resubmitted".format(superviseRun(argv[1], argv[2])))
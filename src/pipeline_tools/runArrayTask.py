@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+
+import os
+import subprocess
+from sys import argv, exit
+
+
+def getTask(manifest, taskID):
+    """[Reads the line of the job array manifest corresponding to the task ID]
+
+    Args:
+        manifest ([str]): [Manifest written by submitArray: task index, sample and command separated by tabs]
+        taskID ([str]): [SLURM_ARRAY_TASK_ID]
+
+    Returns:
+        [tuple]: [sample and command of the task]
+    """
+    with open(manifest, "rt") as f:
+        for line in f:
+            index, sample, cmd = line.rstrip("\n").split("\t", 2)
+            if index == taskID:
+                return sample, cmd
+    raise Exception(f"Task {taskID} was not found in {manifest}")
+
+
+if __name__ == "__main__":
+    if len(argv) != 2:
+        print("Usage: runArrayTask.py <manifest>")
+        exit(1)
+
+    sample, cmd = getTask(argv[1], os.environ['SLURM_ARRAY_TASK_ID'])
+    print(f"Sample: {sample}", flush=True)
+    exit(subprocess.call(cmd, shell=True, executable="/bin/bash"))
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+
+import hashlib
+import math
+import os
+import sqlite3
+import statistics
+from datetime import datetime
+
+from executors import getMemoryMB
+from resourceModel import getSeconds, isCachedLog
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    uid TEXT PRIMARY KEY,
+    date TEXT,
+    technology TEXT,
+    tasks TEXT,
+    raw_dir TEXT
+);
+CREATE TABLE IF NOT EXISTS jobs (
+    uid TEXT,
+    step TEXT,
+    sample TEXT,
+    cmd_hash TEXT,
+    log_file TEXT,
+    job_id TEXT,
+    submit TEXT,
+    start TEXT,
+    end TEXT,
+    elapsed_s REAL,
+    maxrss_mb REAL,
+    cpu_s REAL,
+    read_bytes INTEGER,
+    write_bytes INTEGER,
+    state TEXT,
+    exit_code TEXT,
+    cached INTEGER,
+    PRIMARY KEY (uid, log_file)
+);
+CREATE INDEX IF NOT EXISTS jobs_step ON jobs (step);
+"""
+STATS_COLUMNS = [("elapsed_s", "elapsed"), ("maxrss_mb", "MaxRSS"), ("cpu_s", "CPU"), ("read_bytes", "read"), ("write_bytes", "written")]
+
+
+def getCommandHash(cmd):
+    """[Returns the hash identifying a command across runs]"""
+    return hashlib.sha1(cmd.encode()).hexdigest()[:16]
+
+def openDatabase(dbFile):
+    """[Opens the run database, creating it and its tables if they do not exist. The database is shared by the runs and can be written by several runs at the same time]"""
+    os.makedirs(os.path.dirname(os.path.abspath(dbFile)), exist_ok=True)
+    db = sqlite3.connect(dbFile, timeout=60)
+    db.executescript(SCHEMA)
+    return db
+
+def getRunInfo(configFileDict):
+    """[Returns the run information saved in the run database]"""
+    return {'uid': configFileDict['uid'], 'date': datetime.now().strftime("%Y-%m-%dT%H:%M:%S"), 'technology': configFileDict.get('technology', ""), 'tasks': " ".join(configFileDict.get('task_list', [])), 'raw_dir': configFileDict.get('raw_dir', "")}
+
+def getBytes(size):
+    """[Converts a sacct disk size (i.e 1.50M) to bytes. None if it is empty]"""
+    if not size:
+        return None
+    units = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+    if size[-1] in units:
+        return int(float(size[:-1]) * units[size[-1]])
+    return int(float(size))
+
+def getStepFromLog(logFile):
+    """[Returns the step of a job that was not submitted per sample from its log directory: {output_dir}/{step}/log/{uid}_slurm-{jobID}.out]"""
+    return os.path.basename(os.path.dirname(os.path.dirname(logFile)))
+
+def recordRun(dbFile, run, status, telemetry):
+    """[Writes the jobs of a run in the run database. A run recorded again replaces its previous jobs]
+
+    Args:
+        dbFile ([str]): [Run database]
+        run ([dict]): [Run information, see getRunInfo]
+        status ([dict]): [Status of each log file, as written by jobCheck.write_status]
+        telemetry ([dict]): [Step, sample, command hash and submit time of each log file, recorded when the jobs were submitted]
+
+    Returns:
+        [int]: [Number of jobs recorded]
+    """
+    rows = []
+    for logFile, info in status.items():
+        job = telemetry.get(logFile, {})
+        elapsed = getSeconds(info['Elapsed']) if info.get('Elapsed') else None
+        rows.append((run['uid'], job.get('step', getStepFromLog(logFile)), job.get('sample', ""), job.get('cmd_hash', ""), logFile, info.get('JobID', ""), job.get('submit', ""), info.get('Start', ""), info.get('End', ""),
+                     elapsed, getMemoryMB(info['MaxRSS']) if info.get('MaxRSS') else None, getSeconds(info['TotalCPU']) if info.get('TotalCPU') else None,
+                     getBytes(info.get('MaxDiskRead')), getBytes(info.get('MaxDiskWrite')), info.get('State', ""), info.get('ExitCode', ""), int(isCachedLog(logFile))))
+    db = openDatabase(dbFile)
+    with db:
+        db.execute("INSERT OR REPLACE INTO runs VALUES (:uid, :date, :technology, :tasks, :raw_dir)", run)
+        db.executemany("INSERT OR REPLACE INTO jobs VALUES ({})".format(",".join("?" * 17)), rows)
+    db.close()
+    return len(rows)
+
+def percentile(values, q):
+    """[Returns the q percentile (0-100) of a list of values with the nearest rank method]"""
+    values = sorted(values)
+    return values[max(math.ceil(q / 100 * len(values)) - 1, 0)]
+
+def formatValue(column, value):
+    if value is None:
+        return "NA"
+    if column == "elapsed_s" or column == "cpu_s":
+        return "{}:{:02d}:{:02d}".format(int(value // 3600), int(value % 3600 // 60), int(value % 60))
+    if column == "maxrss_mb":
+        return "{:.1f}G".format(value / 1024)
+    return "{:.1f}G".format(value / 1024 ** 3)
+
+def getStepStats(db, step=None):
+    """[Returns the percentiles of the resources used by the successful jobs of each step, cached jobs excluded]
+
+    Returns:
+        [dict]: [step -> number of jobs, number of runs and (p50, p90, max) of each column of STATS_COLUMNS]
+    """
+    query = "SELECT step, uid, {} FROM jobs WHERE state = 'COMPLETED' AND cached = 0".format(", ".join(column for column, name in STATS_COLUMNS))
+    rows = db.execute(query + (" AND step LIKE ?" if step else ""), (f"%{step}%",) if step else ()).fetchall()
+    steps = {}
+    for row in rows:
+        steps.setdefault(row[0], []).append(row)
+    stats = {}
+    for name, jobs in sorted(steps.items()):
+        stats[name] = {'jobs': len(jobs), 'runs': len(set(job[1] for job in jobs))}
+        for i, (column, title) in enumerate(STATS_COLUMNS, 2):
+            values = [job[i] for job in jobs if job[i] is not None]
+            stats[name][column] = (percentile(values, 50), percentile(values, 90), max(values)) if values else None
+    return stats
+
+def getStepTrends(db, step=None, nRuns=10, threshold=0.2):
+    """[Returns the median elapsed time of the successful jobs of each step in its last runs. The last run is flagged when its median is more than threshold above the median of the previous runs]
+
+    Returns:
+        [dict]: [step -> ([(run uid, run date, median elapsed seconds)], regression flag)]
+    """
+    query = "SELECT jobs.step, jobs.uid, runs.date, jobs.elapsed_s FROM jobs JOIN runs ON jobs.uid = runs.uid WHERE jobs.state = 'COMPLETED' AND jobs.cached = 0 AND jobs.elapsed_s IS NOT NULL"
+    rows = db.execute(query + (" AND jobs.step LIKE ?" if step else ""), (f"%{step}%",) if step else ()).fetchall()
+    runs = {}
+    for name, uid, date, elapsed in rows:
+        runs.setdefault(name, {}).setdefault((date, uid), []).append(elapsed)
+    trends = {}
+    for name, byRun in sorted(runs.items()):
+        medians = [(uid, date, statistics.median(values)) for (date, uid), values in sorted(byRun.items())][-nRuns:]
+        previous = [median for uid, date, median in medians[:-1]]
+        regression = bool(previous) and medians[-1][2] > statistics.median(previous) * (1 + threshold)
+        trends[name] = (medians, regression)
+    return trends
+
+def printStats(dbFile, step=None, nRuns=10, threshold=0.2):
+    """[Prints the percentiles of the resources used by each step and their trend across the last runs]"""
+    if not os.path.exists(dbFile):
+        print(f"The run database {dbFile} does not exist")
+        return 1
+    db = openDatabase(dbFile)
+    stats = getStepStats(db, step)
+    trends = getStepTrends(db, step, nRuns, threshold)
+    db.close()
+    if not stats:
+        print("No successful job recorded" + (f" for the step {step}" if step else ""))
+        return 0
+
+    print("Resources of the successful jobs (p50 / p90 / max)\n")
+    header = ["step", "jobs", "runs"] + [title for column, title in STATS_COLUMNS]
+    table = [[name, str(info['jobs']), str(info['runs'])] + [" / ".join(formatValue(column, value) for value in info[column]) if info[column] else "NA" for column, title in STATS_COLUMNS] for name, info in stats.items()]
+    widths = [max(len(row[i]) for row in table + [header]) for i in range(len(header))]
+    for row in [header] + table:
+        print("  ".join(value.ljust(width) for value, width in zip(row, widths)))
+
+    print(f"\nMedian elapsed time per run (last {nRuns} runs, oldest first)\n")
+    for name, (medians, regression) in trends.items():
+        flag = "  <== REGRESSION: last run more than {:.0f}% slower than the previous ones".format(threshold * 100) if regression else ""
+        print("{}: {}{}".format(name, " ".join(formatValue("elapsed_s", median) for uid, date, median in medians), flag))
+    return 0
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import re
+import statistics
+import subprocess
+import time
+
+from rich.console import Group
+from rich.live import Live
+from rich.table import Table
+
+from jobCheck import get_logJobID, read_jobSummary
+from resourceModel import getSeconds, readHistory
+from runDatabase import getStepFromLog, openDatabase
+
+FINISHED = ("COMPLETED", "FAILED", "CANCELLED", "TIMEOUT", "OUT_OF_MEMORY", "NODE_FAIL", "PREEMPTED", "BOOT_FAIL", "DEADLINE")
+STATE_STYLES = {'PENDING': "yellow", 'RUNNING': "cyan", 'COMPLETED': "green"}
+
+
+def findRunFiles(uid, runDir):
+    """[Returns the log list and job telemetry files written when the jobs of a run were submitted. runDir is the raw or output directory of the run, or its log directory]"""
+    for logDir in [os.path.join(runDir, "log"), runDir]:
+        logList = os.path.join(logDir, f"{uid}_log_files.txt")
+        if os.path.exists(logList):
+            return logList, os.path.join(logDir, f"{uid}_job_telemetry.json")
+    raise FileNotFoundError(f"No {uid}_log_files.txt in {runDir} or {runDir}/log. Give the raw directory (or the output directory) of the run")
+
+def readRunJobs(logList, telemetryFile):
+    """[Reads the jobs of a run: one per log file, with the slurm job ID of the log file and the step and sample recorded at submission]
+
+    Returns:
+        [lst]: [Dictionaries with log, jobID, step and sample, in submission order]
+    """
+    with open(logList, "rt") as f:
+        logFiles = [line.rstrip() for line in f if line.strip()]
+    telemetry = {}
+    if os.path.exists(telemetryFile):
+        with open(telemetryFile, "rt") as f:
+            telemetry = json.load(f)['jobs']
+    jobs = []
+    for logFile in logFiles:
+        info = telemetry.get(logFile, {})
+        jobs.append({'log': logFile, 'jobID': get_logJobID(logFile), 'step': info.get('step', getStepFromLog(logFile)), 'sample': info.get('sample', "")})
+    return jobs
+
+def expandArrayID(jobID):
+    """[Expands the pending tasks of a job array as sacct lists them, i.e 123_[4-6,9%20] -> 123_4, 123_5, 123_6, 123_9]"""
+    match = re.match(r"(\d+)_\[([^\]%]+)", jobID)
+    if not match:
+        return [jobID]
+    ids = []
+    for part in match.group(2).split(","):
+        first, _, last = part.partition("-")
+        ids += ["{}_{}".format(match.group(1), task) for task in range(int(first), int(last or first) + 1)]
+    return ids
+
+def pollJobs(jobIDs):
+    """[Retrieves the state and elapsed time of all the jobs of a run with a single sacct query. sacct reads the accounting database and does not load the slurm controller]
+
+    Args:
+        jobIDs ([lst]): [slurm job IDs, job array tasks as {arrayID}_{taskID}]
+
+    Returns:
+        [dict]: [job ID -> (state, elapsed seconds)]
+    """
+    allocations = sorted(set(jobID.split("_")[0] for jobID in jobIDs))
+    cmd = "sacct -X -n -P -j {jobIDs} -oJobID,State,Elapsed".format(jobIDs = ",".join(allocations))
+    out = subprocess.check_output(cmd, shell=True, universal_newlines=True, stderr=subprocess.DEVNULL)
+    states = {}
+    for line in out.splitlines():
+        fields = line.split("|")
+        if len(fields) != 3:
+            continue
+        state = fields[1].split(" ")[0]
+        for jobID in expandArrayID(fields[0]):
+            states[jobID] = (state, getSeconds(fields[2]) if fields[2] else 0)
+    return states
+
+def getStepDurations(configFileDict):
+    """[Returns the median elapsed time of the successful jobs of each step in the previous runs, from the run database or else from the resource history]"""
+    durations = {}
+    if configFileDict.get('run_db', "").strip() and os.path.exists(configFileDict['run_db'].strip()):
+        db = openDatabase(configFileDict['run_db'].strip())
+        for step, elapsed in db.execute("SELECT step, elapsed_s FROM jobs WHERE state = 'COMPLETED' AND cached = 0 AND elapsed_s IS NOT NULL"):
+            durations.setdefault(step, []).append(elapsed)
+        db.close()
+    else:
+        for row in readHistory(configFileDict.get('resource_history', "").strip()):
+            durations.setdefault(row['step'], []).append(row['elapsed_s'])
+    return {step: statistics.median(values) for step, values in durations.items()}
+
+def updateJobs(jobs, states):
+    """[Sets the state and elapsed time of the jobs of a run. A task of a packed job takes its state from its own job summary once the pack is done]"""
+    for job in jobs:
+        if job.get('done'):
+            continue
+        job['state'], job['elapsed'] = states.get(job['jobID'], ("UNKNOWN", 0))
+        if job['state'] in FINISHED:
+            if re.search(r"\.task\d+\.out$", job['log']):
+                task = read_jobSummary(job['log'])
+                if task:
+                    job['state'], job['elapsed'] = task['State'], getSeconds(task['Elapsed'])
+            job['done'] = True
+
+def getETA(jobs, durations):
+    """[Estimates the remaining time of each step and of the run from the step durations: the jobs of a sample run one after the other, in submission order, and the queue waiting time is ignored]
+
+    Returns:
+        [tuple]: [step -> remaining seconds (None if unknown), remaining seconds of the run]
+    """
+    # The steps without history use the median of their jobs already done in this run
+    done = {}
+    for job in jobs:
+        if job['state'] == "COMPLETED":
+            done.setdefault(job['step'], []).append(job['elapsed'])
+    durations = dict({step: statistics.median(values) for step, values in done.items()}, **durations)
+
+    stepETA = {}
+    remaining = {}
+    for job in jobs:
+        if job['state'] in FINISHED:
+            continue
+        if job['step'] not in durations:
+            stepETA[job['step']] = None
+            continue
+        key = job['sample'] or job['log']
+        remaining[key] = remaining.get(key, 0) + max(durations[job['step']] - (job['elapsed'] if job['state'] == "RUNNING" else 0), 0)
+        if job['step'] not in stepETA or stepETA[job['step']] is not None:
+            stepETA[job['step']] = max(stepETA.get(job['step']) or 0, remaining[key])
+    return stepETA, max(remaining.values(), default=0)
+
+def formatSeconds(seconds):
+    if seconds is None:
+        return "?"
+    seconds = int(seconds)
+    return "{}:{:02d}:{:02d}".format(seconds // 3600, seconds % 3600 // 60, seconds % 60)
+
+def renderRun(uid, jobs, durations, interval, showAll=False):
+    """[Renders the state of the jobs of a run as a table per step and a table of the samples with jobs running or failed (all samples with showAll)]"""
+    stepETA, runETA = getETA(jobs, durations)
+    steps = Table(title="Run {}: {}/{} jobs done, ETA {} (refreshed every {}s)".format(uid, sum(job['state'] in FINISHED for job in jobs), len(jobs), formatSeconds(runETA), interval))
+    for column in ["step", "jobs", "pending", "running", "completed", "failed", "median elapsed", "ETA"]:
+        steps.add_column(column, justify="left" if column == "step" else "right")
+    for step in dict.fromkeys(job['step'] for job in jobs):
+        stepJobs = [job for job in jobs if job['step'] == step]
+        count = lambda states: sum(job['state'] in states for job in stepJobs)
+        elapsed = [job['elapsed'] for job in stepJobs if job['state'] == "COMPLETED"]
+        steps.add_row(step, str(len(stepJobs)), str(count(("PENDING", "UNKNOWN"))), str(count(("RUNNING",))), str(count(("COMPLETED",))),
+                      "[red]{}[/red]".format(count(FINISHED[1:])) if count(FINISHED[1:]) else "0",
+                      formatSeconds(statistics.median(elapsed)) if elapsed else "-", formatSeconds(stepETA[step]) if step in stepETA else "done")
+
+    samples = Table(title="Samples" + ("" if showAll else " with jobs running or failed"))
+    for column in ["sample", "step", "state", "elapsed"]:
+        samples.add_column(column)
+    for job in jobs:
+        if job['sample'] and (showAll or job['state'] == "RUNNING" or (job['state'] in FINISHED and job['state'] != "COMPLETED")):
+            samples.add_row(job['sample'], job['step'], "[{}]{}[/]".format(STATE_STYLES.get(job['state'], "red"), job['state']), formatSeconds(job['elapsed']))
+    return Group(steps, samples)
+
+def monitorRun(uid, runDir, configFileDict={}, interval=60, showAll=False, once=False):
+    """[Follows the jobs of a run until they are all done, polling their state with a single sacct query every interval seconds]
+
+    Args:
+        uid ([str]): [Unique ID of the run]
+        runDir ([str]): [Raw or output directory of the run]
+        configFileDict ([dict]): [configuration file dictionary, for the step durations of run_db or resource_history]
+        interval ([int]): [Seconds between two polls]
+        showAll ([bool]): [Show all the jobs of the samples, not only the running and failed ones]
+        once ([bool]): [Print the state of the run a single time]
+
+    Returns:
+        [int]: [0 if all the jobs completed, 1 otherwise]
+    """
+    jobs = readRunJobs(*findRunFiles(uid, runDir))
+    durations = getStepDurations(configFileDict)
+    with Live(auto_refresh=False) as live:
+        while True:
+            pending = [job['jobID'] for job in jobs if not job.get('done')]
+            if pending:
+                try:
+                    updateJobs(jobs, pollJobs(pending))
+                except subprocess.CalledProcessError:
+                    pass
+            live.update(renderRun(uid, jobs, durations, interval, showAll), refresh=True)
+            if once or all(job.get('done') for job in jobs):
+                break
+            time.sleep(interval)
+    return 0 if all(job['state'] == "COMPLETED" for job in jobs) else 1
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from sys import argv, exit
+
+from executors import writeJobSummary
+
+printLock = threading.Lock()
+
+
+def readManifest(manifest):
+    """[Reads the manifest of a packed job written by submitPackedJobs: task index, sample and command separated by tabs]
+
+    Returns:
+        [lst]: [(task index, sample, command) of each task]
+    """
+    with open(manifest, "rt") as f:
+        return [tuple(line.rstrip("\n").split("\t", 2)) for line in f if line.strip()]
+
+def runTask(jobID, index, sample, cmd, logFile):
+    """[Runs one task of a packed job. Its output goes to its own log file, followed by the job summary lines so that the report checks each task separately]
+
+    Args:
+        jobID ([str]): [slurm job ID of the packed job]
+        index ([str]): [Task index]
+        sample ([str]): [Sample ID]
+        cmd ([str]): [Command of the task]
+        logFile ([str]): [Log file of the task]
+
+    Returns:
+        [int]: [Exit code of the task]
+    """
+    start = datetime.now()
+    with printLock:
+        print(f"==> [{index}] {sample} started: {cmd}", flush=True)
+    with open(logFile, "w") as log:
+        log.write(f"Sample: {sample}\n")
+        log.flush()
+        returncode = subprocess.call(cmd, shell=True, executable="/bin/bash", stdout=log, stderr=subprocess.STDOUT)
+    writeJobSummary(logFile, f"{jobID}.task{index}", "COMPLETED" if returncode == 0 else "FAILED", returncode, start)
+    with printLock:
+        print(f"<== [{index}] {sample} finished with exit code {returncode}. Log: {logFile}", flush=True)
+    return returncode
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Runs the tasks of a packed job written by submitPackedJobs")
+    parser.add_argument('manifest', type=str, help='Manifest of the packed job')
+    parser.add_argument('logPrefix', type=str, help='Prefix of the log files of the tasks, %%j is replaced by the slurm job ID')
+    parser.add_argument('-w', '--workers', dest='workers', type=int, help='Number of tasks running at the same time. Default: the cpus of the job')
+    parser.add_argument('-setup', dest='setup', type=str, default="", help='Command run once before the tasks, i.e loading a genome in shared memory. %%j is replaced by the slurm job ID')
+    parser.add_argument('-teardown', dest='teardown', type=str, default="", help='Command run once after the tasks, even if the tasks or the setup failed')
+    args = parser.parse_args()
+
+    TASKS = readManifest(args.manifest)
+    jobID = os.environ.get('SLURM_JOB_ID', "0")
+    logPrefix = args.logPrefix.replace("%j", jobID)
+    workers = min(args.workers or int(os.environ.get('SLURM_CPUS_PER_TASK', os.cpu_count())), len(TASKS))
+    # %j is replaced by the slurm job ID in the setup and teardown commands too
+    setup, teardown = args.setup.replace("%j", jobID), args.teardown.replace("%j", jobID)
+    if setup:
+        print(f"Setup: {setup}", flush=True)
+        returncode = subprocess.call(setup, shell=True, executable="/bin/bash")
+    if setup and returncode != 0:
+        # Each task fails with the exit code of the setup, in its own log file
+        print(f"Setup failed with exit code {returncode}, the tasks are not run", flush=True)
+        for index, sample, cmd in TASKS:
+            with open(f"{logPrefix}.task{index}.out", "w") as log:
+                log.write(f"Sample: {sample}\nSetup failed with exit code {returncode}: {setup}\n")
+            writeJobSummary(f"{logPrefix}.task{index}.out", f"{jobID}.task{index}", "FAILED", returncode)
+        returncodes = [returncode]
+    else:
+        print(f"Running {len(TASKS)} tasks with {workers} workers", flush=True)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            returncodes = list(pool.map(lambda task: runTask(jobID, *task, f"{logPrefix}.task{task[0]}.out"), TASKS))
+    if teardown:
+        print(f"Teardown: {teardown}", flush=True)
+        subprocess.call(teardown, shell=True, executable="/bin/bash")
+    exit(0 if all(returncode == 0 for returncode in returncodes) else 1)
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import re
+
+FASTQ_NAME = re.compile(r"_S.*_L.*_R[12]_.*.fastq.gz")
+FASTQ_LANE = re.compile(r"_(S\d+_L\d+)_R[12]_")
+FASTQ_READ = re.compile(r"_(R[12])_")
+
+# Files written for each sample by the steps of the pipeline, only listed for the directories of the run
+ARTEFACTS = {
+    'bam': ('bam_dir', "{dir}/{sample}.Aligned.sortedByCoord.bam"),
+    'marked_bam': ('marked_bam_dir', "{dir}/{sample}.sortedByCoord.Picard.bam"),
+    'filtered_bam': ('filtered_bam_dir', "{dir}/{sample}.QualTrim_NoDup_NochrM_SortedByCoord.bam"),
+    'bigwig': ('bw_dir', "{dir}/{sample}.bw"),
+    'bed': ('bed_dir', "{dir}/{sample}.bed"),
+    'narrowPeak': ('peaks_dir', "{dir}/{sample}.MACS/{sample}_peaks.narrowPeak"),
+}
+
+__SCANS = {}
+
+
+def scanDir(directory):
+    """[Lists the file names of a directory. Each directory is read a single time per run, the inputs do not change while the jobs are submitted]
+
+    Args:
+        directory ([str]): [Directory to read]
+
+    Returns:
+        [lst]: [Sorted names of the files of the directory, empty if it does not exist]
+    """
+    directory = directory.rstrip("/")
+    if directory not in __SCANS:
+        try:
+            with os.scandir(directory) as entries:
+                __SCANS[directory] = sorted(entry.name for entry in entries if entry.is_file())
+        except (FileNotFoundError, NotADirectoryError):
+            __SCANS[directory] = []
+    return __SCANS[directory]
+
+def listFiles(directory, suffix):
+    """[Returns the paths of the files of a directory ending with suffix, i.e .bam]"""
+    return [f"{directory.rstrip('/')}/{name}" for name in scanDir(directory) if name.endswith(suffix)]
+
+def getSampleID(fastq_file):
+    """[Returns the sample ID of a fastq file as getFastqPrefix names it: SampleID_S1_L001_R1_001.fastq.gz -> SampleID]"""
+    return FASTQ_NAME.sub("", os.path.basename(fastq_file))
+
+def getTrimmedName(fastq_file):
+    """[Returns the name of the trimmed fastq file written by submitTrimming: SampleID_S1_L001_R1_001.fastq.gz -> SampleID.trimmed_S1_L001_R1_001.fastq.gz]"""
+    return re.sub("_S", ".trimmed_S", os.path.basename(fastq_file))
+
+def getLaneKey(lane):
+    """[Sort key of the lanes of the manifest, in lane order then sample number order: S5_L001 -> (1, 5)]"""
+    return tuple(int(number) for number in reversed(re.findall(r"\d+", lane)))
+
+def buildManifest(configFileDict, fastqDir):
+    """[Builds the sample manifest of the run from a single scan of the fastq directory: sample -> lanes -> R1/R2 files and groups of the sample. It is saved in configFileDict['sample_manifest'] and the sample IDs in configFileDict['sample_prefix']]
+
+    Args:
+        configFileDict ([dict]): [configuration file dictionary]
+        fastqDir ([str]): [fastq directory]
+
+    Returns:
+        [dict]: [Sample manifest. Files that are not named SampleID_S1_L001_R1_001.fastq.gz are listed in unmatched]
+    """
+    groups = configFileDict["groups"].split("|") if configFileDict.get("groups") != None else []
+    manifest = {'fastq_dir': fastqDir.rstrip("/"), 'samples': {}, 'groups': {group: [] for group in groups}, 'unmatched': []}
+    for name in scanDir(fastqDir):
+        if not name.endswith("fastq.gz"):
+            continue
+        read = FASTQ_READ.search(name)
+        if not read or not FASTQ_NAME.search(name):
+            manifest['unmatched'].append(name)
+            continue
+        lane = FASTQ_LANE.search(name)
+        sample = manifest['samples'].setdefault(getSampleID(name), {'groups': [], 'lanes': {}})
+        # A sample sequenced on several flowcells has a sample number (S1, S5) per flowcell, each with its own lanes
+        sample['lanes'].setdefault(lane.group(1) if lane else "S1_L001", {}).setdefault(read.group(1), []).append(f"{manifest['fastq_dir']}/{name}")
+
+    for sampleID, sample in manifest['samples'].items():
+        # The group regexes are searched in the sample ID only, the S1_L001 tokens of the file names would match other groups
+        for group in groups:
+            if re.search(group, sampleID):
+                sample['groups'].append(group)
+                manifest['groups'][group].append(sampleID)
+
+    configFileDict['sample_manifest'] = manifest
+    configFileDict['sample_prefix'] = sorted(manifest['samples'])
+    return manifest
+
+def getSampleFastq(configFileDict, sample, read, fastqDir=None):
+    """[Returns the fastq files of a sample for one read, one per lane in lane order. For the trimmed fastq directory, the names of the trimmed files are returned]
+
+    Args:
+        configFileDict ([dict]): [configuration file dictionary]
+        sample ([str]): [Sample ID]
+        read ([str]): [R1 or R2]
+        fastqDir ([str], optional): [Directory of the fastq files, the fastq directory of the manifest by default]
+
+    Returns:
+        [lst]: [Paths of the fastq files]
+    """
+    manifest = configFileDict['sample_manifest']
+    lanes = manifest['samples'][sample]['lanes']
+    files = [path for lane in sorted(lanes, key=getLaneKey) for path in lanes[lane].get(read, [])]
+    if fastqDir is None or fastqDir.rstrip("/") == manifest['fastq_dir']:
+        return files
+    return ["{}/{}".format(fastqDir.rstrip("/"), getTrimmedName(path)) for path in files]
+
+def getSampleUnits(configFileDict, sample, fastqDir=None):
+    """[Returns the sequencing units of a sample, one per R1 fastq file (a lane of a flowcell), in lane order. The unit ID is taken from the file name: SampleID_S1_L001_R1_001.fastq.gz -> S1_L001_001]
+
+    Args:
+        configFileDict ([dict]): [configuration file dictionary]
+        sample ([str]): [Sample ID]
+        fastqDir ([str], optional): [Directory of the fastq files, the fastq directory of the manifest by default]
+
+    Returns:
+        [lst]: [(unit ID, R1 file, R2 file) tuples. The R2 file is None for single end reads]
+    """
+    R1 = getSampleFastq(configFileDict, sample, "R1", fastqDir)
+    R2 = getSampleFastq(configFileDict, sample, "R2", fastqDir)
+    units = []
+    for i, path in enumerate(getSampleFastq(configFileDict, sample, "R1")):
+        unit = FASTQ_READ.sub("_", os.path.basename(path)[len(sample) + 1:]).replace(".fastq.gz", "")
+        units.append((unit, R1[i], R2[i] if len(R2) == len(R1) else None))
+    return units
+
+def getGroupFiles(configFileDict, FILES):
+    """[Groups the files of the samples (i.e bigwig files) by the groups of the manifest. Without a manifest, the groups regexes are searched in the file paths]
+
+    Args:
+        configFileDict ([dict]): [configuration file dictionary]
+        FILES ([lst]): [Files named {sample}.*]
+
+    Returns:
+        [dict]: [group -> files of the samples of the group]
+    """
+    manifest = configFileDict.get('sample_manifest')
+    if not manifest:
+        from groupCheck import createGroups
+        return createGroups(configFileDict.get("groups"), FILES)
+    return {group: [path for path in FILES if os.path.basename(path).split(".")[0] in samples] for group, samples in manifest['groups'].items()}
+
+def addArtefacts(configFileDict):
+    """[Adds to each sample of the manifest the paths of the files written by the steps of the run]"""
+    for sampleID, sample in configFileDict['sample_manifest']['samples'].items():
+        sample['artefacts'] = {artefact: path.format(dir = configFileDict[dirKey], sample = sampleID) for artefact, (dirKey, path) in ARTEFACTS.items() if configFileDict.get(dirKey)}
+        if configFileDict.get('trimmed_fastq_dir') and '1' in configFileDict.get('task_list', []):
+            sample['artefacts']['trimmed_fastq'] = {read: getSampleFastq(configFileDict, sampleID, read, configFileDict['trimmed_fastq_dir']) for read in ["R1", "R2"]}
+
+def getProcessedSamples(configFileDict):
+    """[Returns the samples of the manifest already processed by a previous run of the project: their filtered BAM file exists and, when peaks are called, their narrowPeak file (Input samples have no peaks). The outputs are checked rather than the cache records, which only exist if the previous runs used --use-cache]
+
+    Args:
+        configFileDict ([dict]): [configuration file dictionary]
+
+    Returns:
+        [lst]: [Sample IDs. Empty without a filtered BAM directory]
+    """
+    if not configFileDict.get('filtered_bam_dir') or not configFileDict.get('sample_manifest'):
+        return []
+    processed = []
+    for sampleID in sorted(configFileDict['sample_manifest']['samples']):
+        files = [ARTEFACTS['filtered_bam'][1].format(dir = configFileDict['filtered_bam_dir'], sample = sampleID)]
+        if configFileDict.get('peaks_dir') and sampleID.split("_")[0] != "Input":
+            files.append(ARTEFACTS['narrowPeak'][1].format(dir = configFileDict['peaks_dir'], sample = sampleID))
+        if all(os.path.exists(path) for path in files):
+            processed.append(sampleID)
+    return processed
+
+def writeSampleManifest(configFileDict, log_dir):
+    """[Writes the sample manifest of the run as {uid}_samples.json and as a table with one line per fastq file, {uid}_samples.tsv]
+
+    Args:
+        configFileDict ([dict]): [configuration file dictionary]
+        log_dir ([str]): [Directory where the manifest is written]
+
+    Returns:
+        [str]: [Path of the json manifest]
+    """
+    addArtefacts(configFileDict)
+    manifest = configFileDict['sample_manifest']
+    prefix = "{}/{}_samples".format(log_dir, configFileDict['uid'])
+    with open(prefix + ".json", "w") as g:
+        json.dump(manifest, g, indent=1)
+    columns = list(ARTEFACTS)
+    with open(prefix + ".tsv", "w") as g:
+        g.write("\t".join(["sample", "groups", "lane", "read", "fastq"] + columns) + "\n")
+        for sampleID, sample in sorted(manifest['samples'].items()):
+            for lane, reads in sorted(sample['lanes'].items(), key=lambda item: getLaneKey(item[0])):
+                for read, files in sorted(reads.items()):
+                    for path in files:
+                        g.write("\t".join([sampleID, ",".join(sample['groups']) or "NA", lane, read, path] + [sample['artefacts'].get(column, "NA") for column in columns]) + "\n")
+    return prefix + ".json"
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+
+import glob
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+from sys import argv, exit
+
+PATH_PATTERN = r"(?<![\w.])(/[^\s;|&<>'\"=,():#]+)"
+INDEX_EXTENSIONS = [".bai", ".csi", ".crai", ".tbi"]
+CHUNK = 16 * 1024 * 1024
+
+
+def useScratch(configFileDict, waitKey):
+    """[Checks whether the jobs of a step run in the node-local scratch directory: use_scratch is set and the step is listed in scratch_steps]"""
+    if configFileDict.get('use_scratch', "0").strip() != "1":
+        return False
+    steps = configFileDict.get('scratch_steps', "map pcr_duplication filter_bam bam2bw bam2bed ext_bed peak_calling").split()
+    return waitKey[:-len("_WAIT")].lower() in steps
+
+def getConfigPaths(configFileDict):
+    """[Returns the paths written in the configuration file (tools, reference files and directories). They are never staged]"""
+    return set(path for value in configFileDict.values() if isinstance(value, str) for path in re.findall(PATH_PATTERN, value))
+
+def getStageInfo(configFileDict, cmd, configPaths):
+    """[Returns the staging settings of a job, saved with its command in the job record]
+
+    Args:
+        configFileDict ([dict]): [configuration file dictionary]
+        cmd ([str]): [Command of the job]
+        configPaths ([set]): [Paths of the configuration file, see getConfigPaths]
+
+    Returns:
+        [dict]: [scratch directory (environment variables are expanded on the node) and paths of the command that are not staged]
+    """
+    return {'scratch': configFileDict.get('scratch_dir', "$TMPDIR").strip(), 'exclude': [path for path in dict.fromkeys(re.findall(PATH_PATTERN, cmd)) if path in configPaths]}
+
+def getStagedJobs(configFileDict, waitKey, JOBS, log_dir):
+    """[Wraps the commands of the jobs of a step so that they run in the node-local scratch directory]
+
+    Args:
+        configFileDict ([dict]): [configuration file dictionary]
+        waitKey ([str]): [Key of the step wait condition, i.e FILTER_BAM_WAIT]
+        JOBS ([lst]): [List of (sample, cmd, dependency) tuples]
+        log_dir ([str]): [Directory where the slurm logs and job records of the step are written]
+
+    Returns:
+        [lst]: [List of (sample, cmd, dependency) tuples to submit]
+    """
+    configPaths = getConfigPaths(configFileDict)
+    STAGED_JOBS = []
+    for sample, cmd, dependency in JOBS:
+        recordFile = f"{log_dir}/{sample}.{waitKey}.stage.json"
+        with open(recordFile, "w") as g:
+            json.dump(dict(getStageInfo(configFileDict, cmd, configPaths), cmd = cmd), g, indent=1)
+        STAGED_JOBS.append((sample, "python3 {stageScript} {record}".format(stageScript = configFileDict['stageScript'], record = recordFile), dependency))
+    return STAGED_JOBS
+
+def getScratchDir(scratch):
+    """[Returns the scratch directory on the node, or an empty string if it is not set or does not exist]"""
+    scratch = os.path.expandvars(scratch or "$TMPDIR")
+    return scratch if "$" not in scratch and os.path.isdir(scratch) else ""
+
+def md5sum(path):
+    md5 = hashlib.md5()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK), b""):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+def copyVerified(source, destination):
+    """[Copies a file and checks that the md5 checksum of the copy is the one of the source before moving it to its destination]"""
+    tmp = destination + ".staging"
+    md5 = hashlib.md5()
+    with open(source, "rb") as f, open(tmp, "wb") as g:
+        for chunk in iter(lambda: f.read(CHUNK), b""):
+            md5.update(chunk)
+            g.write(chunk)
+    if md5sum(tmp) != md5.hexdigest():
+        os.remove(tmp)
+        raise IOError(f"The checksum of the copy of {source} to {destination} does not match")
+    os.replace(tmp, destination)
+
+def fingerprint(path):
+    stat = os.stat(path)
+    return (stat.st_size, stat.st_mtime_ns)
+
+def stagePaths(cmd, workDir, exclude):
+    """[Maps the data files of a command to mirrors of their directories in the scratch directory and copies the inputs there]
+
+    Existing files are inputs, with their index files. Paths that do not exist yet in an existing directory are written by the command. Directories, executables and the excluded paths stay on the shared filesystem.
+
+    Returns:
+        [tuple]: [path of the command -> scratch path, directory -> mirror and fingerprint of the staged inputs]
+    """
+    mapping, mirrors, staged = {}, {}, {}
+    tokens = list(dict.fromkeys(re.findall(PATH_PATTERN, cmd)))
+    for token in tokens:
+        if token in exclude:
+            continue
+        directory, name = os.path.split(token.rstrip("/"))
+        if not name or glob.has_magic(directory) or not os.path.isdir(directory):
+            continue
+        if glob.has_magic(name):
+            files = [path for path in glob.glob(token) if os.path.isfile(path)]
+            if not files:
+                continue
+        elif os.path.isfile(token) and not os.access(token, os.X_OK):
+            files = [token]
+        elif not os.path.exists(token):
+            files = []
+        else:
+            continue
+        if directory not in mirrors:
+            mirrors[directory] = os.path.join(workDir, str(len(mirrors)))
+            os.makedirs(mirrors[directory])
+        for path in files:
+            for index in [path + extension for extension in INDEX_EXTENSIONS] + [re.sub(r"\.bam$", ".bai", path)]:
+                if index != path and os.path.isfile(index) and index not in files:
+                    files.append(index)
+        for path in files:
+            stagedPath = os.path.join(mirrors[directory], os.path.basename(path))
+            shutil.copyfile(path, stagedPath)
+            staged[stagedPath] = fingerprint(stagedPath)
+        mapping[token] = os.path.join(mirrors[directory], name)
+    # Paths inside a directory created by the command, i.e the MACS2 output directory
+    for token in tokens:
+        directory, name = os.path.split(token.rstrip("/"))
+        if token not in mapping and token not in exclude and directory in mapping:
+            mapping[token] = os.path.join(mapping[directory], name)
+    return mapping, mirrors, staged
+
+def copyBack(mirrors, staged):
+    """[Copies the files created or modified by the command in the scratch directory back to the shared filesystem, checking their checksums]"""
+    for directory, mirror in mirrors.items():
+        for root, dirs, files in os.walk(mirror):
+            for name in files:
+                path = os.path.join(root, name)
+                if staged.get(path) == fingerprint(path):
+                    continue
+                destination = os.path.join(directory, os.path.relpath(path, mirror))
+                os.makedirs(os.path.dirname(destination), exist_ok=True)
+                copyVerified(path, destination)
+
+def runStaged(cmd, scratch, exclude):
+    """[Runs a command in the node-local scratch directory: copies its inputs there, runs it with its temporary files there and copies back its outputs]
+
+    The command runs on the shared filesystem if there is no scratch directory on the node.
+
+    Args:
+        cmd ([str]): [Command to run]
+        scratch ([str]): [Scratch directory, environment variables are expanded on the node, i.e $TMPDIR]
+        exclude ([lst]): [Paths of the command that are not staged]
+
+    Returns:
+        [int]: [Exit code of the command, 1 if the outputs could not be copied back. The scratch directory is then left in place]
+    """
+    scratchDir = getScratchDir(scratch)
+    if not scratchDir:
+        print(f"Scratch directory {scratch} not found on this node. Running on the shared filesystem.", flush=True)
+        return subprocess.call(cmd, shell=True, executable="/bin/bash")
+
+    workDir = tempfile.mkdtemp(prefix="braunLP_", dir=scratchDir)
+    keep = False
+    try:
+        mapping, mirrors, staged = stagePaths(cmd, workDir, exclude)
+        tmp = os.path.join(workDir, "tmp")
+        os.makedirs(tmp)
+        env = dict(os.environ, TMPDIR=tmp, _JAVA_OPTIONS=(os.environ.get("_JAVA_OPTIONS", "") + f" -Djava.io.tmpdir={tmp}").strip())
+        stagedCmd = re.sub(PATH_PATTERN, lambda match: mapping.get(match.group(1), match.group(1)), cmd)
+        print(f"Running in {workDir}", flush=True)
+        returncode = subprocess.call(stagedCmd, shell=True, executable="/bin/bash", env=env)
+        if returncode == 0:
+            try:
+                copyBack(mirrors, staged)
+            except IOError as e:
+                # The scratch directory holds the only complete copy of the outputs
+                keep = True
+                print(f"{e}. The outputs are kept in {workDir}", flush=True)
+                return 1
+        return returncode
+    finally:
+        if not keep:
+            shutil.rmtree(workDir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    if len(argv) != 2:
+        print("Usage: scratchStaging.py <job record>")
+        exit(1)
+    with open(argv[1], "rt") as f:
+        record = json.load(f)
+    exit(runStaged(record['cmd'], record['scratch'], record['exclude']))
@@ -1,11 +1,62 @@
 #!/usr/bin/env python3 
 
-from os import wait
+import os
 import subprocess
 import sys 
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from executors import getExecutor, parseDependency, formatDependency
+from submissionJournal import getJournal
+from resultCache import getUncachedJobs
+from scratchStaging import useScratch, getStagedJobs
+from resourceModel import getStepName, getInputSize, tuneResources
+from runDatabase import getCommandHash
+from retrySupervisor import useRetry, isRetryStep, getDependencyType, recordJob, markJobs
+import re
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 
 
 
+def submitJob(configFileDict, SLURM_CMD):
+    """[Submits a wsbatch command with the executor of the run]
+
+    Args:
+        configFileDict ([dict]): [configuration file dictionary]
+        SLURM_CMD ([str]): [wsbatch command]
+
+    Returns:
+        [str]: [sbatch output from which the job ID is caught with catchJID]
+    """
+    SLURM_CMD = cleanDependency(SLURM_CMD)
+    journal = getJournal(configFileDict)
+    out = journal.submit(SLURM_CMD, getExecutor(configFileDict).submit) if journal else getExecutor(configFileDict).submit(SLURM_CMD)
+    if useRetry(configFileDict):
+        recordJob(configFileDict, SLURM_CMD, catchJID(out))
+    return out
+
+def submitJobs(configFileDict, SLURM_CMDS):
+    """[Submits independent wsbatch commands concurrently, at most submit_workers (default 8) at the same time]
+
+    Args:
+        configFileDict ([dict]): [configuration file dictionary]
+        SLURM_CMDS ([lst]): [wsbatch commands that do not depend on each other]
+
+    Returns:
+        [lst]: [sbatch outputs in the same order as the commands]
+    """
+    workers = min(int(configFileDict.get('submit_workers', "8")), len(SLURM_CMDS))
+    if workers <= 1 or not getExecutor(configFileDict).concurrentSubmission:
+        return [submitJob(configFileDict, SLURM_CMD) for SLURM_CMD in SLURM_CMDS]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(lambda SLURM_CMD: submitJob(configFileDict, SLURM_CMD), SLURM_CMDS))
+
+def cleanDependency(SLURM_CMD):
+    """[Removes the empty job IDs and dependencies from a wsbatch command]"""
+    def clean(match):
+        dependency = formatDependency(parseDependency(match.group(0)))
+        return "--dependency={}".format(dependency) if dependency else ""
+    return re.sub(r"--dependency=([^\s]*)", clean, SLURM_CMD)
+
 def catchJID(out):
     return out.rstrip().split(" ")[-1]
 
@@ -13,12 +64,348 @@ def getSlurmLog(log_dir, uuid, out):
     jid = catchJID(out)
     return f"{log_dir}/{uuid}_slurm-{jid}.out"
 
+def addSampleJID(configFileDict, waitKey, sample, jid):
+    """[Records the slurm job ID of a sample for a step]
+
+    Args:
+        configFileDict ([dict]): [configuration file dictionary]
+        waitKey ([str]): [Key of the step wait condition, i.e TRIM_WAIT]
+        sample ([str]): [Sample ID]
+        jid ([str]): [slurm job ID]
+    """
+    configFileDict.setdefault(f"{waitKey}_DICT", {})[sample] = jid
+
+def getSampleWait(configFileDict, waitKey, *samples):
+    """[Returns the slurm job IDs the given sample(s) need to wait for in the previous step]
+
+    Args:
+        configFileDict ([dict]): [configuration file dictionary]
+        waitKey ([str]): [Key of the previous step wait condition, i.e TRIM_WAIT]
+        samples ([str]): [Sample IDs]
+
+    Returns:
+        [str]: [comma separated slurm job IDs. Falls back to the whole previous step if a sample was not submitted by it]
+    """
+    sampleJID = configFileDict.get(f"{waitKey}_DICT", {})
+    if not all(sample in sampleJID for sample in samples):
+        return configFileDict[waitKey]
+    return ",".join(sampleJID[sample] for sample in samples if sampleJID[sample])
+
+def getSlurmCMD(configFileDict, cmd, slurm, log_dir, dependency="", lane=""):
+    """[Creates the wsbatch command of a single job]
+
+    Args:
+        configFileDict ([dict]): [configuration file dictionary]
+        cmd ([str]): [Command to run]
+        slurm ([str]): [slurm resources, i.e configFileDict['slurm_general']]
+        log_dir ([str]): [Directory where the slurm log is written]
+        dependency ([str]): [comma separated slurm job IDs to wait for. Empty if the job does not wait for anything]
+        lane ([str]): [slurm job IDs separated by : of the previous jobs of the lane and of the I/O slot of the job, see submitInLanes. They are waited for even if they failed]
+
+    Returns:
+        [str]: [wsbatch command]
+    """
+    # With auto_retry the job waits for the jobs of its sample to succeed, it is not killed if they fail so that it can wait for their resubmission
+    conditions = [f"{getDependencyType(configFileDict)}:{dependency}"] if dependency else []
+    if lane:
+        conditions.append(f"afterany:{lane}")
+    if dependency and useRetry(configFileDict):
+        slurm = f"{slurm} --kill-on-invalid-dep=no"
+    if conditions:
+        return "{wsbatch} {slurm} -o {log_dir}/{uid}_slurm-%j.out --dependency={dependency} --wrap=\"{cmd}\"".format(wsbatch = configFileDict["wsbatch"], slurm = slurm, log_dir = log_dir, uid = configFileDict["uid"], cmd = cmd, dependency = ",".join(conditions))
+    return "{wsbatch} {slurm} -o {log_dir}/{uid}_slurm-%j.out --wrap=\"{cmd}\"".format(wsbatch = configFileDict["wsbatch"], slurm = slurm, log_dir = log_dir, uid = configFileDict["uid"], cmd = cmd)
+
+def getStepLimit(configFileDict, waitKey):
+    """[Returns max_concurrent_<step> of a step, 0 if the step is not limited]"""
+    step = waitKey[:-len("_WAIT")].lower()
+    if configFileDict.get(f"max_concurrent_{step}", "").strip():
+        return int(configFileDict[f"max_concurrent_{step}"])
+    return 0
+
+def isIOStep(configFileDict, waitKey):
+    """[Checks whether the jobs of a step share the I/O budget of the run (max_concurrent_io)]"""
+    if not configFileDict.get('max_concurrent_io', "").strip():
+        return False
+    steps = configFileDict.get('io_steps', "trim pcr_duplication filter_bam bam2bw bam2bed ext_bed").split()
+    return waitKey[:-len("_WAIT")].lower() in steps
+
+def getIOSlots(configFileDict):
+    """[Returns the last job ID of each slot of the max_concurrent_io budget]"""
+    return configFileDict.setdefault('io_slots', [""] * int(configFileDict['max_concurrent_io']))
+
+def getArrayDependency(configFileDict, JOBS):
+    """[Returns the sbatch dependency options of a job array]
+
+    Args:
+        configFileDict ([dict]): [configuration file dictionary]
+        JOBS ([lst]): [List of (sample, cmd, dependency) tuples]
+
+    Returns:
+        [str]: [sbatch dependency options. Empty if the array does not wait for anything]
+    """
+    dependencies = [dependency for sample, cmd, dependency in JOBS]
+    dependencyType = getDependencyType(configFileDict)
+    options = " --kill-on-invalid-dep=no" if useRetry(configFileDict) else ""
+    arrayJID = dependencies[0].split("_")[0]
+    if dependencyType == "afterok" and all(dependency == f"{arrayJID}_{i}" for i, dependency in enumerate(dependencies)):
+        return f"--dependency=aftercorr:{arrayJID}{options}"
+    JID_LIST = list(dict.fromkeys(jid for dependency in dependencies for jid in dependency.split(",") if jid))
+    if not JID_LIST:
+        return ""
+    return "--dependency={}:{}{}".format(dependencyType, ",".join(JID_LIST), options)
+
+def getManifest(configFileDict, waitKey, log_dir):
+    """[Returns a new manifest file name for a job array or a pack of the step]"""
+    n = configFileDict.get('manifest_id', 0)
+    configFileDict['manifest_id'] = n + 1
+    return "{log_dir}/{uid}_{step}.{n}.manifest.tsv".format(log_dir = log_dir, uid = configFileDict['uid'], step = waitKey, n = n)
+
+def writeManifest(manifest, JOBS):
+    """[Writes the sample manifest of a job array: task index, sample and command separated by tabs]"""
+    with open(manifest, "w") as g:
+        for i, (sample, cmd, dependency) in enumerate(JOBS):
+            g.write(f"{i}\t{sample}\t{cmd}\n")
+
+def submitArray(configFileDict, waitKey, logKey, JOBS, slurm, log_dir, dryRun=False):
+    """[Submits the per-sample jobs of a step as a single slurm job array]
+
+    Args:
+        configFileDict ([dict]): [configuration file dictionary]
+        waitKey ([str]): [Key of the step wait condition, i.e TRIM_WAIT]
+        logKey ([str]): [Key of the step log files, i.e trim_log_files]
+        JOBS ([lst]): [List of (sample, cmd, dependency) tuples]
+        slurm ([str]): [slurm resources]
+        log_dir ([str]): [Directory where the manifest and slurm logs are written]
+
+    Returns:
+        [str]: [slurm job ID of the array]
+    """
+    manifest = getManifest(configFileDict, waitKey, log_dir)
+    array = "0-{}".format(len(JOBS) - 1)
+    limits = [int(configFileDict['job_array_limit'])] if configFileDict.get('job_array_limit', "").strip() else []
+    if getStepLimit(configFileDict, waitKey):
+        limits.append(getStepLimit(configFileDict, waitKey))
+    if limits:
+        array += "%{}".format(min(limits))
+    cmd = "python3 {arrayTask} {manifest}".format(arrayTask = configFileDict['arrayTaskScript'], manifest = manifest)
+    SLURM_CMD = "{wsbatch} {slurm} --array={array} -o {log_dir}/{uid}_slurm-%A_%a.out {dependency} --wrap=\"{cmd}\"".format(wsbatch = configFileDict["wsbatch"], slurm = slurm, array = array, log_dir = log_dir, uid = configFileDict["uid"], dependency = getArrayDependency(configFileDict, JOBS), cmd = cmd)
+
+    if not dryRun:
+        writeManifest(manifest, JOBS)
+    out = submitJob(configFileDict, SLURM_CMD)
+    jid = catchJID(out)
+    for i, (sample, sample_cmd, dependency) in enumerate(JOBS):
+        if dryRun:
+            print(f"    [{i}] {sample}: {sample_cmd}")
+            getExecutor(configFileDict).describe(f"{jid}_{i}", sample = sample, cmd = sample_cmd)
+        addSampleJID(configFileDict, waitKey, sample, f"{jid}_{i}")
+        configFileDict[logKey].append(f"{log_dir}/{configFileDict['uid']}_slurm-{jid}_{i}.out")
+    return jid
+
+def isPackedStep(configFileDict, waitKey):
+    """[Checks whether the jobs of a step are packed (pack_size and pack_steps)]"""
+    if int(configFileDict.get('pack_size', "1").strip() or 1) < 2:
+        return False
+    steps = configFileDict.get('pack_steps', "atacqc bamqc ext_bed").split()
+    return waitKey[:-len("_WAIT")].lower() in steps
+
+def submitPackedJobs(configFileDict, waitKey, logKey, JOBS, slurm, log_dir, dryRun=False, group=None):
+    """[Submits the per-sample jobs of a step in packs of pack_size commands]
+
+    Args:
+        configFileDict ([dict]): [configuration file dictionary]
+        waitKey ([str]): [Key of the step wait condition, i.e BAMQC_WAIT]
+        logKey ([str]): [Key of the step log files, i.e bamQC_log_files]
+        JOBS ([lst]): [List of (sample, cmd, dependency) tuples]
+        slurm ([str]): [slurm resources of a single command]
+        log_dir ([str]): [Directory where the manifests and slurm logs are written]
+        group ([dict], optional): [size, workers, setup and teardown commands of the groups of the step, instead of pack_size and pack_cpus]
+
+    Returns:
+        [str]: [comma separated slurm job IDs of the packs]
+    """
+    if group:
+        size = group['size']
+        options = " -w {workers} -setup '{setup}' -teardown '{teardown}'".format(**group)
+    else:
+        size = int(configFileDict['pack_size'])
+        options = ""
+        cpus = configFileDict.get('pack_cpus', "4").strip()
+        if re.search(r"(--cpus-per-task=|-c )\d+", slurm):
+            slurm = re.sub(r"(--cpus-per-task=|-c )\d+", lambda match: match.group(1) + cpus, slurm)
+        else:
+            slurm = f"{slurm} -c {cpus}"
+
+    PACKS = [JOBS[start:start + size] for start in range(0, len(JOBS), size)]
+    PACK_JOBS = []
+    for PACK in PACKS:
+        manifest = getManifest(configFileDict, waitKey, log_dir)
+        if not dryRun:
+            writeManifest(manifest, PACK)
+        dependency = ",".join(dict.fromkeys(jid for sample, cmd, sample_dependency in PACK for jid in sample_dependency.split(",") if jid))
+        cmd = "python3 {packScript} {manifest} {log_dir}/{uid}_slurm-%j{options}".format(packScript = configFileDict['packScript'], manifest = manifest, log_dir = log_dir, uid = configFileDict['uid'], options = options)
+        PACK_JOBS.append((cmd, slurm, dependency))
+
+    JID_LIST = []
+    # The packs count as single jobs in the concurrency limit of the step
+    for PACK, out in zip(PACKS, submitInLanes(configFileDict, waitKey, PACK_JOBS, log_dir)):
+        jid = catchJID(out)
+        JID_LIST.append(jid)
+        for i, (sample, sample_cmd, dependency) in enumerate(PACK):
+            if dryRun:
+                print(f"    [{i}] {sample}: {sample_cmd}")
+                getExecutor(configFileDict).describe(f"{jid}_{i}", sample = sample, cmd = sample_cmd)
+            addSampleJID(configFileDict, waitKey, sample, jid)
+            configFileDict[logKey].append(f"{log_dir}/{configFileDict['uid']}_slurm-{jid}.task{i}.out")
+    return ",".join(JID_LIST)
+
+def getWrappedJobs(configFileDict, waitKey, JOBS, log_dir, dryRun=False):
+    """[Wraps the commands of a step for the result cache and the scratch directory]
+
+    Args:
+        configFileDict ([dict]): [configuration file dictionary]
+        waitKey ([str]): [Key of the step wait condition, i.e TRIM_WAIT]
+        JOBS ([lst]): [List of (sample, cmd, dependency) tuples]
+        log_dir ([str]): [Directory where the slurm logs, cache and staging records of the step are written]
+
+    Returns:
+        [lst]: [List of (sample, cmd, dependency) tuples to submit]
+    """
+    stage = useScratch(configFileDict, waitKey) and not dryRun
+    if configFileDict.get('use_cache') == "1":
+        return getUncachedJobs(configFileDict, waitKey, JOBS, log_dir, dryRun, stage)
+    if stage:
+        return getStagedJobs(configFileDict, waitKey, JOBS, log_dir)
+    return JOBS
+
+def useArray(configFileDict, waitKey, JOBS):
+    """[Checks whether the jobs of a step are submitted as a single job array]"""
+    return configFileDict.get('job_array', "0").strip() == "1" and len(JOBS) > 1 and getExecutor(configFileDict).arrays and not isRetryStep(configFileDict, waitKey) and not isIOStep(configFileDict, waitKey)
+
+def submitInLanes(configFileDict, waitKey, JOBS, log_dir):
+    """[Submits the wsbatch commands of a step within its concurrency limit and the I/O budget]
+
+    Args:
+        configFileDict ([dict]): [configuration file dictionary]
+        waitKey ([str]): [Key of the step wait condition, i.e TRIM_WAIT]
+        JOBS ([lst]): [List of (cmd, slurm, dependency) tuples]
+        log_dir ([str]): [Directory where the slurm logs are written]
+
+    Returns:
+        [lst]: [sbatch outputs in the same order as the jobs]
+    """
+    limit = getStepLimit(configFileDict, waitKey) or len(JOBS)
+    SLOTS = getIOSlots(configFileDict) if isIOStep(configFileDict, waitKey) else []
+    batch = max(min([limit] + ([len(SLOTS)] if SLOTS else [])), 1)
+    OUTS = []
+    # Job i waits for job i-limit of the step and for the previous job of its I/O slot, even if they failed. Each batch needs the job IDs of the previous one
+    for start in range(0, len(JOBS), batch):
+        SLURM_CMDS, USED = [], []
+        for i, (cmd, slurm, dependency) in enumerate(JOBS[start:start + batch], start):
+            lanes = [catchJID(OUTS[i - limit])] if i >= limit else []
+            if SLOTS:
+                slot = configFileDict.get('io_slot', 0)
+                configFileDict['io_slot'] = (slot + 1) % len(SLOTS)
+                lanes += [SLOTS[slot]] if SLOTS[slot] else []
+                USED.append(slot)
+            SLURM_CMDS.append(getSlurmCMD(configFileDict, cmd, slurm, log_dir, dependency, ":".join(dict.fromkeys(lanes))))
+        OUTS += submitJobs(configFileDict, SLURM_CMDS)
+        for slot, out in zip(USED, OUTS[start:]):
+            SLOTS[slot] = catchJID(out)
+    return OUTS
+
+def submitSingleJobs(configFileDict, waitKey, logKey, JOBS, SLURMS, log_dir):
+    """[Submits one wsbatch call per sample, see submitInLanes]
+
+    Args:
+        configFileDict ([dict]): [configuration file dictionary]
+        waitKey ([str]): [Key of the step wait condition, i.e TRIM_WAIT]
+        logKey ([str]): [Key of the step log files, i.e trim_log_files]
+        JOBS ([lst]): [List of (sample, cmd, dependency) tuples]
+        SLURMS ([lst]): [slurm resources of each job]
+        log_dir ([str]): [Directory where the slurm logs are written]
+
+    Returns:
+        [str]: [comma separated slurm job IDs]
+    """
+    JID_LIST = []
+    for (sample, cmd, dependency), out in zip(JOBS, submitInLanes(configFileDict, waitKey, [(cmd, slurm, dependency) for (sample, cmd, dependency), slurm in zip(JOBS, SLURMS)], log_dir)):
+        JID_LIST.append(catchJID(out))
+        addSampleJID(configFileDict, waitKey, sample, catchJID(out))
+        configFileDict[logKey].append(getSlurmLog(log_dir, configFileDict['uid'], out))
+    return ",".join(JID_LIST)
+
+def recordSampleJobs(configFileDict, waitKey, JOBS, logFiles, step, sizes, hashes, packSize=None, dryRun=False):
+    """[Records the submitted jobs of a step for the plan, the resource history and the run monitor]
+
+    Args:
+        configFileDict ([dict]): [configuration file dictionary]
+        waitKey ([str]): [Key of the step wait condition, i.e TRIM_WAIT]
+        JOBS ([lst]): [List of the submitted (sample, cmd, dependency) tuples]
+        logFiles ([lst]): [Log files of the submitted jobs, in the same order]
+        step ([str]): [Step name, see getStepName]
+        sizes ([dict]): [Input size of each sample, see getInputSize]
+        hashes ([dict]): [Step name and hash of the command of each sample, taken before the commands are wrapped]
+        packSize ([int], optional): [Number of commands per pack, the resources of packed jobs are not recorded]
+    """
+    executor = getExecutor(configFileDict)
+    sampleJID = configFileDict.get(f"{waitKey}_DICT", {})
+    if dryRun:
+        for n, (sample, cmd, dependency) in enumerate(JOBS):
+            if packSize:
+                executor.describe(sampleJID[sample], step = step)
+                executor.describe(f"{sampleJID[sample]}_{n % packSize}", input_bytes = sizes[sample])
+                continue
+            if n == 0 and "_" in sampleJID[sample]:
+                executor.describe(sampleJID[sample].split("_")[0], step = step)
+            executor.describe(sampleJID[sample], sample = sample, step = step, input_bytes = sizes[sample])
+        return
+    if not packSize and (configFileDict.get('auto_resources', "0").strip() == "1" or configFileDict.get('resource_history', "").strip() != ""):
+        for (sample, cmd, dependency), logFile in zip(JOBS, logFiles):
+            configFileDict.setdefault('job_resources', {})[logFile] = {'step': step, 'size': sizes[sample]}
+    submit = datetime.now().strftime("%Y-%m-%dT%H:%M:%S")
+    for (sample, cmd, dependency), logFile in zip(JOBS, logFiles):
+        configFileDict.setdefault('job_telemetry', {})[logFile] = {'step': hashes[sample][0], 'sample': sample, 'cmd_hash': hashes[sample][1], 'submit': submit}
 
+def submitSampleJobs(configFileDict, waitKey, logKey, JOBS, slurm, log_dir, dryRun=False, group=None):
+    """[Submits the per-sample jobs of a step: packed, as a job array or one job per sample]
 
-        
+    Args:
+        configFileDict ([dict]): [configuration file dictionary]
+        waitKey ([str]): [Key of the step wait condition, i.e TRIM_WAIT]
+        logKey ([str]): [Key of the step log files, i.e trim_log_files]
+        JOBS ([lst]): [List of (sample, cmd, dependency) tuples. dependency is a comma separated list of job IDs or empty]
+        slurm ([str]): [slurm resources]
+        log_dir ([str]): [Directory where the slurm logs are written]
+        group ([dict], optional): [Packs all the jobs in groups, see submitPackedJobs]
 
-    
+    Returns:
+        [str]: [comma separated slurm job IDs for the wait condition of the next steps. In a dry run, the pseudo job IDs of the execution plan]
+    """
+    # The resources are recorded and tuned, and the commands hashed for the run database, on the commands of the step before they are wrapped by the cache or the scratch staging
+    step = getStepName(waitKey, JOBS[0][1]) if JOBS else waitKey
+    sizes = {sample: getInputSize(configFileDict, sample, cmd) for sample, cmd, dependency in JOBS}
+    hashes = {sample: (getStepName(waitKey, cmd), getCommandHash(cmd)) for sample, cmd, dependency in JOBS}
+    autoResources = configFileDict.get('auto_resources', "0").strip() == "1"
 
-    
-    
+    JOBS = getWrappedJobs(configFileDict, waitKey, JOBS, log_dir, dryRun)
+    nLogs = len(configFileDict[logKey])
+    packSize = None
+    # The arrays and packs run several samples, the retry supervisor does not resubmit them
+    shared = True
+    if (isPackedStep(configFileDict, waitKey) and len(JOBS) > 1) or (group is not None and len(JOBS) > 0):
+        JID = submitPackedJobs(configFileDict, waitKey, logKey, JOBS, slurm, log_dir, dryRun, group)
+        packSize = group['size'] if group else int(configFileDict['pack_size'])
+    elif useArray(configFileDict, waitKey, JOBS):
+        if autoResources:
+            slurm = tuneResources(configFileDict, step, slurm, max(sizes[sample] for sample, cmd, dependency in JOBS))
+        JID = submitArray(configFileDict, waitKey, logKey, JOBS, slurm, log_dir, dryRun)
+    else:
+        shared = False
+        SLURMS = [tuneResources(configFileDict, step, slurm, sizes[sample]) if autoResources else slurm for sample, cmd, dependency in JOBS]
+        JID = submitSingleJobs(configFileDict, waitKey, logKey, JOBS, SLURMS, log_dir)
+    if useRetry(configFileDict):
+        markJobs(configFileDict, waitKey, JID, shared)
 
+    recordSampleJobs(configFileDict, waitKey, JOBS, configFileDict[logKey][nLogs:], step, sizes, hashes, packSize, dryRun)
+    return JID
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import threading
+
+
+class SubmissionJournal:
+    """[Write-ahead journal of the jobs submitted by a run, {raw_log}/{uid}_submission_journal.jsonl]
+
+    Each job is written in the journal before it is submitted and again with its sbatch output once it is queued. When the submission of a run is resumed, the pipeline builds the same commands again: a command already queued gets the sbatch output of the journal instead of being submitted a second time, so the jobs depending on it wait for the job already queued.
+    """
+
+    def __init__(self, journalFile, resume=False):
+        self.journalFile = journalFile
+        self.lock = threading.Lock()
+        self.queued = {}
+        self.unconfirmed = []
+        self.replayed = 0
+        self.submitted = 0
+        if resume:
+            self.read()
+
+    def read(self):
+        """[Reads the jobs already queued. A job written before its submission but neither as queued nor as failed was being submitted when the run was killed]"""
+        pending = {}
+        with open(self.journalFile, "rt") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # Last line cut when the run was killed
+                    continue
+                if entry['event'] == "submit":
+                    pending[entry['cmd']] = pending.get(entry['cmd'], 0) + 1
+                elif entry['event'] == "failed":
+                    pending[entry['cmd']] -= 1
+                elif entry['event'] == "queued":
+                    pending[entry['cmd']] -= 1
+                    self.queued.setdefault(entry['cmd'], []).append(entry['out'])
+        self.unconfirmed = [cmd for cmd, count in pending.items() if count > 0]
+
+    def write(self, entry):
+        with open(self.journalFile, "a") as g:
+            g.write(json.dumps(entry) + "\n")
+            g.flush()
+            os.fsync(g.fileno())
+
+    def submit(self, SLURM_CMD, submit):
+        """[Submits a wsbatch command unless it is already queued according to the journal]
+
+        Args:
+            SLURM_CMD ([str]): [wsbatch command]
+            submit ([function]): [submit method of the executor]
+
+        Returns:
+            [str]: [sbatch output of the job]
+        """
+        with self.lock:
+            if self.queued.get(SLURM_CMD):
+                self.replayed += 1
+                return self.queued[SLURM_CMD].pop(0)
+            self.write({'event': "submit", 'cmd': SLURM_CMD})
+        try:
+            out = submit(SLURM_CMD)
+        except Exception:
+            # sbatch refused the job, it is submitted again when the submission is resumed
+            with self.lock:
+                self.write({'event': "failed", 'cmd': SLURM_CMD})
+            raise
+        with self.lock:
+            self.write({'event': "queued", 'cmd': SLURM_CMD, 'out': out})
+            self.submitted += 1
+        return out
+
+
+JOURNAL = None
+
+def getJournalFile(configFileDict):
+    return "{raw_log}/{uid}_submission_journal.jsonl".format(raw_log = configFileDict['raw_log'], uid = configFileDict['uid'])
+
+def getJournal(configFileDict):
+    """[Returns the submission journal of the run. The jobs run by the local executor and the jobs of a dry run are not journaled]
+
+    Args:
+        configFileDict ([dict]): [configuration file dictionary]
+
+    Returns:
+        [SubmissionJournal]: [Journal shared by all the steps of the run, None if the jobs are not journaled]
+    """
+    global JOURNAL
+    if JOURNAL is None and configFileDict.get('executor', "slurm").strip() == "slurm" and configFileDict.get('dry_run') != "1":
+        JOURNAL = SubmissionJournal(getJournalFile(configFileDict), configFileDict.get('resume_submission') == "1")
+    return JOURNAL
@@ -14,8 +14,59 @@ pipeline_tools_path = os.path.abspath(pipeline_path + "/pipeline_tools")
 sys.path.append(pipeline_tools_path)
 from slurmTools import *
 from groupCheck import * 
+from fastqTools import getFastqSample
+from sampleManifest import getSampleFastq, getSampleUnits, getGroupFiles
+from runDatabase import getRunInfo
+from resourceModel import getSortResources, getSortTmp, getGroupResources, getMappingChunks, getJobCpus, setJobCpus, getTrimCores
+from retrySupervisor import useRetry, writeRetryJobs, submitRetrySupervisor
+from STAR_2pass import removeSTARoptions, getFirstPassCMD, getJunctionMergeCMD, getSecondPassParameters
+from configParser import dict2File
 
 
+def getTrimCMD(configFileDict, cores, lane):
+    """[Creates the cutadapt command trimming a lane of a sample on cores cores]
+
+    Args:
+        configFileDict ([dict]): [configuration file dictionary]
+        cores ([int]): [Number of cores of cutadapt, see getTrimCores]
+        lane ([tuple]): [(R1, R2, trimmed R1, trimmed R2) for paired end reads, (R1, trimmed R1) for single end reads. With - as trimmed files, the trimmed reads are written to the standard output, interleaved for paired end reads]
+
+    Returns:
+        [str]: [cutadapt command]
+    """
+    cutadapt = "{bin} -j {cores}".format(bin=configFileDict["cutadapt"], cores=cores)
+    parameters = " ".join(re.sub(r"(?<!\S)(-j|--cores)(=|\s+)\d+", "", configFileDict["trim_reads"]).split())
+    if len(lane) == 4:
+        pair1, pair2, output1, output2 = lane
+        output = "--interleaved -o -" if output1 == "-" else f"-o {output1} -p {output2}"
+        return "{bin} {parameters} {output} {pair1} {pair2}".format(bin=cutadapt, parameters=parameters, output=output, pair1 = pair1, pair2 = pair2)
+    pair1, output1 = lane
+    if configFileDict.get("RNAkit") == "Colibri" and configFileDict['technology'] == "RNAseq":
+        return parameters.replace("BIN",cutadapt).replace("INPUT",pair1).replace("OUTPUT",output1)
+    return "{bin} {parameters} -o {output1} {pair1}".format(bin=cutadapt, parameters=parameters, pair1 = pair1, output1 = output1)
+
+def getTrimPipe(configFileDict, R1, R2=[]):
+    """[Creates the command streaming the trimmed reads of a sample into the mapper]
+
+    Args:
+        configFileDict ([dict]): [configuration file dictionary]
+        R1 ([lst]): [R1 fastq files of the sample, one per lane]
+        R2 ([lst]): [R2 fastq files of the sample, empty for single end reads]
+
+    Returns:
+        [tuple]: [Trimming command piped into the mapper, i.e set -o pipefail; cutadapt ... | , and the bowtie2 options reading the trimmed reads from the standard input]
+    """
+    cores = getTrimCores(configFileDict)
+    if R2:
+        LANE_CMDS = [getTrimCMD(configFileDict, cores, (pair1, pair2, "-", "-")) for pair1, pair2 in zip(R1, R2)]
+        reads = "--interleaved -"
+    else:
+        LANE_CMDS = [getTrimCMD(configFileDict, cores, (pair1, "-")) for pair1 in R1]
+        reads = "-U -"
+    trim = LANE_CMDS[0] if len(LANE_CMDS) == 1 else "{{ {}; }}".format(" && ".join(LANE_CMDS))
+    # A failure of cutadapt fails the job instead of mapping the reads trimmed until then
+    return f"set -o pipefail; {trim} | ", reads
+
 def submitTrimming(configFileDict, FASTQ_PREFIX, dryRun=False):
     """Function that submits slurm jobs for trimming reads.
 
@@ -26,51 +77,75 @@ def submitTrimming(configFileDict, FASTQ_PREFIX, dryRun=False):
     Returns:
         [str]: comma separated string containing slurm job IDs for wait condition
     """    
-    TRIM_JID_LIST = []
+    TRIM_JOBS = {}
+    splitLanes = configFileDict.get('split_lanes', "0").strip() == "1"
     
-    R1 = re.compile('''R1''')
-    R2 = re.compile('''R2''')
     for file in FASTQ_PREFIX:
-        # GET FASTQ FILES # 
-        fastq_files = glob.glob("{path}/{file}*.fastq.gz".format(path = configFileDict['fastq_dir'], file = file))
+        # GET FASTQ FILES OF EACH LANE FROM THE SAMPLE MANIFEST # 
+        fastq_files = getSampleFastq(configFileDict, file, "R1")
+        trimmed_files = getSampleFastq(configFileDict, file, "R1", configFileDict["trimmed_fastq_dir"])
         if configFileDict['pairend'] == "1":
-            fastq_pair1 = [os.path.basename(i) for i in fastq_files if R1.search(i)][0]
-            fastq_pair2 = [os.path.basename(i) for i in fastq_files if R2.search(i)][0]
-            output_pair1 = re.sub("_S",".trimmed_S",fastq_pair1)
-            output_pair2 = re.sub("_S",".trimmed_S",fastq_pair2)
-            TRIM_CMD = "{bin} {parameters} -o {trimmed_dir}/{output1} -p {trimmed_dir}/{output2} {fastq_dir}/{pair1} {fastq_dir}/{pair2}".format(bin=configFileDict["cutadapt"], parameters=configFileDict["trim_reads"], pair1 = fastq_pair1, pair2 = fastq_pair2, output1 = output_pair1, output2 = output_pair2,  trimmed_dir = configFileDict["trimmed_fastq_dir"], fastq_dir=configFileDict['fastq_dir'])
+            LANES = list(zip(fastq_files, getSampleFastq(configFileDict, file, "R2"), trimmed_files, getSampleFastq(configFileDict, file, "R2", configFileDict["trimmed_fastq_dir"])))
         else:
-            if configFileDict.get("RNAkit") == "Colibri" and configFileDict['technology'] == "RNAseq":
-                fastq_pair1 = [os.path.basename(i) for i in fastq_files if R1.search(i)][0]
-                output_pair1 = re.sub("_S",".trimmed_S",fastq_pair1)
-                
-                BIN = configFileDict['cutadapt']
-                INPUT = "{fastq_dir}/{pair1}".format(fastq_dir = configFileDict['fastq_dir'], pair1 = fastq_pair1)
-                OUTPUT = "{trimmed_dir}/{output1}".format(trimmed_dir = configFileDict["trimmed_fastq_dir"], output1 = output_pair1)
-                trimReadsCommand = configFileDict['trim_reads']
-                trimReadsCommand = trimReadsCommand.replace("BIN",configFileDict['cutadapt']).replace("INPUT",INPUT).replace("OUTPUT",OUTPUT)
-                TRIM_CMD = trimReadsCommand
-    
-            else:
-                TRIM_CMD = "{bin} {parameters} -o {trimmed_dir}/{file}.trim_S1_L001_R1_001.fastq.gz  {fastq_dir}/{file}*_R1_001.fastq.gz ".format(bin=configFileDict["cutadapt"], parameters=configFileDict["trim_reads"], file=file, trimmed_dir = configFileDict["trimmed_fastq_dir"], fastq_dir=configFileDict['fastq_dir'])
-            
-        SLURM_CMD = "{wsbatch} {slurm} -o {trimmed_log_dir}/{uid}_slurm-%j.out --wrap=\"{cmd}\"".format(wsbatch = configFileDict["wsbatch"], slurm = configFileDict["slurm_trim"], trimmed_log_dir = "{}/log".format(configFileDict["trimmed_fastq_dir"]), uid = configFileDict["uid"], cmd = TRIM_CMD)
+            LANES = list(zip(fastq_files, trimmed_files))
         
-        if dryRun:
-            print(SLURM_CMD)
-            print()
-        else:
-            out = subprocess.check_output(SLURM_CMD, shell=True, universal_newlines= True, stderr=subprocess.STDOUT)
-            TRIM_JID_LIST.append(catchJID(out))
-        
-            configFileDict['trim_log_files'].append(getSlurmLog("{}/log".format(configFileDict["trimmed_fastq_dir"]),configFileDict['uid'],out))
+        # With split_lanes, each lane of the sample is trimmed by its own job
+        units = getSampleUnits(configFileDict, file) if splitLanes else []
+        PARTS = [(f"{file}.{unit}", [lane]) for (unit, R1, R2), lane in zip(units, LANES)] if len(units) > 1 else [(file, LANES)]
+        for name, lanes in PARTS:
+            cores = getTrimCores(configFileDict, sum(os.path.getsize(path) for lane in lanes for path in lane[:len(lane) // 2] if os.path.exists(path)))
+            TRIM_JOBS.setdefault(cores, []).append((name, " && ".join(getTrimCMD(configFileDict, cores, lane) for lane in lanes), ""))
         
-    if dryRun:
-        return "dryRun"
-    else:    
-        TRIM_WAIT = ",".join(TRIM_JID_LIST)
-        return TRIM_WAIT
+    # The jobs request the cores of their cutadapt command
+    TRIM_WAIT = ",".join(JID for JID in [submitSampleJobs(configFileDict, 'TRIM_WAIT', 'trim_log_files', JOBS, setJobCpus(configFileDict["slurm_trim"], cores), "{}/log".format(configFileDict["trimmed_fastq_dir"]), dryRun) for cores, JOBS in TRIM_JOBS.items()] if JID)
+    if splitLanes:
+        # The steps mapping the whole sample wait for the jobs of all its lanes
+        for file in FASTQ_PREFIX:
+            units = getSampleUnits(configFileDict, file)
+            if len(units) > 1:
+                addSampleJID(configFileDict, 'TRIM_WAIT', file, getSampleWait(configFileDict, 'TRIM_WAIT', *[f"{file}.{unit}" for unit, R1, R2 in units]))
+    return TRIM_WAIT
+
 
+def getReadGroup(sample, unit):
+    """[Returns the bowtie2 read group options of a lane of a sample]"""
+    return "--rg-id {sample}.{unit} --rg SM:{sample} --rg LB:{sample} --rg PL:ILLUMINA --rg PU:{unit}".format(sample = sample, unit = unit)
+
+def getPartMappingCMD(configFileDict, name, reads, threads, mem, readGroup="", trim=""):
+    """[Creates the command mapping and sorting a part (lane or chunk) of the reads of a sample]
+
+    Args:
+        configFileDict ([dict]): [configuration file dictionary]
+        name ([str]): [Name of the part, i.e SampleID.chunk0]
+        reads ([str]): [bowtie2 options of the fastq files, i.e -1 R1 -2 R2]
+        threads ([int]): [samtools sort threads, see getSortResources]
+        mem ([str]): [samtools sort memory per thread, see getSortResources]
+        readGroup ([str]): [bowtie2 read group options, see getReadGroup]
+        trim ([str]): [Command trimming the reads streamed into bowtie2, see getTrimPipe]
+
+    Returns:
+        [str]: [Mapping command]
+    """
+    return "{trim}{mapper} {parameters} -x {REFSEQ} {reads} | {samtools} sort -@ {threads} -m {mem} -T {tmp} -O BAM -o {bam_dir}/{name}.sortedByCoord.part -".format(tmp=getSortTmp(configFileDict, name), trim=trim, mapper=configFileDict['bowtie2'], parameters=" ".join([configFileDict['bowtie_parameters'], readGroup]), REFSEQ=configFileDict['reference_genome'], reads=reads, samtools=configFileDict["samtools"], threads=threads, mem=mem, bam_dir=configFileDict['bam_dir'], name=name)
+
+def getPartMergeCMD(configFileDict, sample, PARTS, TMP_FILES=[]):
+    """[Creates the command merging the sorted parts of a sample into its BAM file]
+
+    Args:
+        configFileDict ([dict]): [configuration file dictionary]
+        sample ([str]): [Sample ID]
+        PARTS ([lst]): [Names of the parts, see getPartMappingCMD]
+        TMP_FILES ([lst]): [Other files to remove, i.e the fastq files of the chunks]
+
+    Returns:
+        [str]: [Merge command]
+    """
+    bam_dir = configFileDict['bam_dir']
+    part_bams = [f"{bam_dir}/{name}.sortedByCoord.part" for name in PARTS]
+    MERGE_CMD = "{samtools} merge -@ 4 -f {bam_dir}/{sample}.Aligned.sortedByCoord.bam {part_bams} && {samtools} index {bam_dir}/{sample}.Aligned.sortedByCoord.bam".format(samtools=configFileDict["samtools"], bam_dir=bam_dir, sample=sample, part_bams=" ".join(part_bams))
+    if configFileDict.get('keep_intermediate_bam', "0").strip() != "1":
+        MERGE_CMD += " && rm {}".format(" ".join(part_bams + TMP_FILES))
+    return MERGE_CMD
 
 def submitMappingBowtie(configFileDict, FASTQ_PREFIX, FASTQ_PATH, dryRun=False):
     """[Submits jobs for Mapping using Bowtie2]
@@ -82,37 +157,77 @@ def submitMappingBowtie(configFileDict, FASTQ_PREFIX, FASTQ_PATH, dryRun=False):
     Returns:
         [str]: [Returns the slurm Job IDs so that the jobs of the next step can wait until mapping has finished]
     """  
-    MAP_JID_LIST = []
+    MAP_JOBS = []
     configFileDict['mapping_log_files'] = []
     
+    # The reads are sorted as bowtie2 writes them and the index is written by the sort, the unsorted BAM file is never written
+    stream = configFileDict.get('stream_mapping', "0").strip() == "1"
+    threads, mem = getSortResources(configFileDict, configFileDict["slurm_mapping"])
+    bam_dir = configFileDict['bam_dir']
+    # With stream_trimming, cutadapt writes the trimmed reads to bowtie2 and its cores are added to the mapping jobs
+    streamTrim = configFileDict.get('stream_trimming', "0").strip() == "1"
+    slurm_mapping = setJobCpus(configFileDict["slurm_mapping"], getJobCpus(configFileDict["slurm_mapping"]) + getTrimCores(configFileDict)) if streamTrim else configFileDict["slurm_mapping"]
+    splitLanes = configFileDict.get('split_lanes', "0").strip() == "1"
+    LANE_JOBS = []
+    SPLIT_JOBS = []
+    CHUNK_JOBS = []
+    MERGE_JOBS = []
+
     for file in FASTQ_PREFIX:                                                        
         
-        if configFileDict['pairend'] ==  "1": 
-            
-            MAP_CMD = "{mapper} {parameters} -x {REFSEQ} -1 {dir}/{file}*_R1_001.fastq.gz -2 {dir}/{file}*_R2_001.fastq.gz | {samtools} view -b -h -o {bam_dir}/{file}.raw.bam && {samtools} sort -O BAM -o {bam_dir}/{file}.Aligned.sortedByCoord.bam {bam_dir}/{file}.raw.bam && rm {bam_dir}/{file}.raw.bam && {samtools} index {bam_dir}/{file}.Aligned.sortedByCoord.bam".format(mapper=configFileDict['bowtie2'], parameters=configFileDict['bowtie_parameters'],dir=FASTQ_PATH,file=file, samtools = configFileDict["samtools"], bam_dir=configFileDict['bam_dir'], REFSEQ=configFileDict['reference_genome'])
+        JID = getSampleWait(configFileDict, 'TRIM_WAIT', file) if '1' in configFileDict['task_list'] else ""
+        units = getSampleUnits(configFileDict, file, FASTQ_PATH) if splitLanes else []
+        readGroup = getReadGroup(file, units[0][0]) if len(units) == 1 else ""
+        if len(units) > 1:
+            # Each lane is mapped by its own job with its read group, the sorted lanes are merged by a last job before duplicates are marked
+            lanes = [f"{file}.{unit}" for unit, R1, R2 in units]
+            for lane, (unit, R1, R2) in zip(lanes, units):
+                reads = f"-1 {R1} -2 {R2}" if configFileDict['pairend'] == "1" else f"-U {R1}"
+                trim = ""
+                if streamTrim:
+                    trim, reads = getTrimPipe(configFileDict, [R1], [R2] if configFileDict['pairend'] == "1" else [])
+                LANE_JOBS.append((lane, getPartMappingCMD(configFileDict, lane, reads, threads, mem, getReadGroup(file, unit), trim), getSampleWait(configFileDict, 'TRIM_WAIT', lane) if '1' in configFileDict['task_list'] else ""))
+            MERGE_JOBS.append((file, getPartMergeCMD(configFileDict, file, lanes), 'MAP_LANE_WAIT', lanes))
+            continue
+
+        nChunks = getMappingChunks(configFileDict, file)
+        if nChunks > 1:
+            # The reads of a large sample are split in chunks mapped by independent jobs, the sorted chunks are merged by a last job
+            SPLIT_CMD = "python3 {splitScript} -1 {R1} {R2} -n {nChunks} -o {bam_dir}/{file}".format(splitScript=configFileDict['splitFastqScript'], R1=" ".join(getSampleFastq(configFileDict, file, "R1", FASTQ_PATH)), R2="-2 {}".format(" ".join(getSampleFastq(configFileDict, file, "R2", FASTQ_PATH))) if configFileDict['pairend'] == "1" else "", nChunks=nChunks, bam_dir=bam_dir, file=file)
+            SPLIT_JOBS.append((file, SPLIT_CMD, JID))
+            chunks = [f"{file}.chunk{i}" for i in range(nChunks)]
+            CHUNK_FASTQ = []
+            for chunk in chunks:
+                CHUNK_FASTQ += [f"{bam_dir}/{chunk}.{read}.fastq.gz" for read in (["R1", "R2"] if configFileDict['pairend'] == "1" else ["R1"])]
+                reads = f"-1 {bam_dir}/{chunk}.R1.fastq.gz -2 {bam_dir}/{chunk}.R2.fastq.gz" if configFileDict['pairend'] == "1" else f"-U {bam_dir}/{chunk}.R1.fastq.gz"
+                CHUNK_JOBS.append((chunk, getPartMappingCMD(configFileDict, chunk, reads, threads, mem, readGroup), file))
+            MERGE_JOBS.append((file, getPartMergeCMD(configFileDict, file, chunks, CHUNK_FASTQ), 'MAP_CHUNK_WAIT', chunks))
+            continue
+
+        reads = "-1 {R1} -2 {R2}".format(R1=",".join(getSampleFastq(configFileDict, file, "R1", FASTQ_PATH)), R2=",".join(getSampleFastq(configFileDict, file, "R2", FASTQ_PATH))) if configFileDict['pairend'] == "1" else "-U {R1}".format(R1=",".join(getSampleFastq(configFileDict, file, "R1", FASTQ_PATH)))
+        if streamTrim:
+            trim, reads = getTrimPipe(configFileDict, getSampleFastq(configFileDict, file, "R1", FASTQ_PATH), getSampleFastq(configFileDict, file, "R2", FASTQ_PATH) if configFileDict['pairend'] == "1" else [])
+        if stream:
+            MAP_CMD = "{mapper} {parameters} -x {REFSEQ} {reads} | {samtools} sort -@ {threads} -m {mem} -T {tmp} -O BAM --write-index -o {bam_dir}/{file}.Aligned.sortedByCoord.bam##idx##{bam_dir}/{file}.Aligned.sortedByCoord.bam.bai -".format(tmp=getSortTmp(configFileDict, file), mapper=configFileDict['bowtie2'], parameters=" ".join([configFileDict['bowtie_parameters'], readGroup]), REFSEQ=configFileDict['reference_genome'], reads=reads, samtools=configFileDict["samtools"], threads=threads, mem=mem, bam_dir=configFileDict['bam_dir'], file=file)
         else:
-            MAP_CMD = "{mapper} {parameters} -x {REFSEQ} -U {dir}/{file}*_R1_001.fastq.gz | {samtools} view -b -h -o {bam_dir}/{file}.raw.bam && {samtools} sort -O BAM -o {bam_dir}/{file}.Aligned.sortedByCoord.bam {bam_dir}/{file}.raw.bam && rm {bam_dir}/{file}.raw.bam && {samtools} index {bam_dir}/{file}.Aligned.sortedByCoord.bam".format(mapper=configFileDict['bowtie2'], parameters=configFileDict['bowtie_parameters'],dir=FASTQ_PATH,file=file, samtools = configFileDict["samtools"], bam_dir=configFileDict['bam_dir'], REFSEQ=configFileDict['reference_genome']) 
-        
-        if '1' in configFileDict['task_list']: 
-            SLURM_CMD = "{wsbatch} {slurm} -o {log_dir}/{uid}_slurm-%j.out --dependency=afterany:{JID} --wrap=\"{cmd}\"".format(wsbatch = configFileDict["wsbatch"], slurm = configFileDict["slurm_mapping"], log_dir = "{}/log".format(configFileDict['bam_dir']), uid = configFileDict["uid"], cmd = MAP_CMD, JID=configFileDict["TRIM_WAIT"])
-            #print(SLURM_CMD)
-        else: 
-            SLURM_CMD = "{wsbatch} {slurm} -o {log_dir}/{uid}_slurm-%j.out --wrap=\"{cmd}\"".format(wsbatch = configFileDict["wsbatch"], slurm = configFileDict["slurm_mapping"], log_dir = f"{configFileDict['bam_dir']}/log", uid = configFileDict["uid"], cmd = MAP_CMD)
-            #print(SLURM_CMD)
+            MAP_CMD = "{mapper} {parameters} -x {REFSEQ} {reads} | {samtools} view -b -h -o {bam_dir}/{file}.raw.bam && {samtools} sort -O BAM -o {bam_dir}/{file}.Aligned.sortedByCoord.bam {bam_dir}/{file}.raw.bam && rm {bam_dir}/{file}.raw.bam && {samtools} index {bam_dir}/{file}.Aligned.sortedByCoord.bam".format(mapper=configFileDict['bowtie2'], parameters=" ".join([configFileDict['bowtie_parameters'], readGroup]), REFSEQ=configFileDict['reference_genome'], reads=reads, file=file, samtools = configFileDict["samtools"], bam_dir=configFileDict['bam_dir'])
+        if streamTrim:
+            MAP_CMD = f"{trim}{MAP_CMD}"
         
-        if dryRun:
-            print(SLURM_CMD)
-        else:
-            out = subprocess.check_output(SLURM_CMD, shell=True, universal_newlines= True, stderr=subprocess.STDOUT)
-            MAP_JID_LIST.append(catchJID(out))
-            configFileDict['mapping_log_files'].append(getSlurmLog("{}/log".format(configFileDict["bam_dir"]),configFileDict['uid'],out))
+        MAP_JOBS.append((file, MAP_CMD, JID))
     
-    if dryRun:
-        return "dryRun"
-    else:
-        MAP_WAIT = ",".join(MAP_JID_LIST)
-        #del MAP_JID_LIST
+    MAP_WAIT = submitSampleJobs(configFileDict, 'MAP_WAIT', 'mapping_log_files', MAP_JOBS, slurm_mapping, "{}/log".format(bam_dir), dryRun)
+    if not MERGE_JOBS:
         return MAP_WAIT
+    if LANE_JOBS:
+        submitSampleJobs(configFileDict, 'MAP_LANE_WAIT', 'mapping_log_files', LANE_JOBS, slurm_mapping, "{}/log".format(bam_dir), dryRun)
+    if SPLIT_JOBS:
+        submitSampleJobs(configFileDict, 'SPLIT_FASTQ_WAIT', 'mapping_log_files', SPLIT_JOBS, configFileDict["slurm_general"], "{}/log".format(bam_dir), dryRun)
+        submitSampleJobs(configFileDict, 'MAP_CHUNK_WAIT', 'mapping_log_files', [(chunk, CHUNK_CMD, getSampleWait(configFileDict, 'SPLIT_FASTQ_WAIT', file)) for chunk, CHUNK_CMD, file in CHUNK_JOBS], configFileDict["slurm_mapping"], "{}/log".format(bam_dir), dryRun)
+    MERGE_WAIT = submitSampleJobs(configFileDict, 'MAP_MERGE_WAIT', 'mapping_log_files', [(file, MERGE_CMD, getSampleWait(configFileDict, waitKey, *parts)) for file, MERGE_CMD, waitKey, parts in MERGE_JOBS], configFileDict["slurm_general"], "{}/log".format(bam_dir), dryRun)
+    # The next steps wait for the merge of the samples that were mapped in parts
+    configFileDict.setdefault('MAP_WAIT_DICT', {}).update(configFileDict['MAP_MERGE_WAIT_DICT'])
+    return ",".join(JID for JID in [MAP_WAIT, MERGE_WAIT] if JID)
 
 
 def submitMappingSTAR(configFileDict, FASTQ_PREFIX, FASTQ_PATH, dryRun=False):
@@ -125,7 +240,7 @@ def submitMappingSTAR(configFileDict, FASTQ_PREFIX, FASTQ_PATH, dryRun=False):
     Returns:
         [str]: [Returns the slurm Job IDs so that the jobs of the next step can wait until mapping has finished]
     """  
-    MAP_JID_LIST = []
+    MAP_JOBS = []
     configFileDict['mapping_log_files'] = []
     
     pairend = configFileDict['pairend']
@@ -138,38 +253,56 @@ def submitMappingSTAR(configFileDict, FASTQ_PREFIX, FASTQ_PATH, dryRun=False):
     logDir = bamDir + '/log/'
 
     sjdbOverhang = int(readLength)-int(1)
+    parameters = configFileDict['STARoptions']
+    sjdb = "--sjdbGTFfile {annotation} --sjdbOverhang {sjdbOverhang}".format(annotation = annotation, sjdbOverhang = str(sjdbOverhang))
+    group = None
+    if configFileDict.get('star_shared_genome', "0").strip() == "1":
+        # The samples are mapped in groups loading the genome once per allocation in shared memory. The junctions of the annotation cannot be inserted in a shared genome, they must be in the genome index
+        group = getGroupResources(configFileDict, configFileDict['slurm_mapping'])
+        sjdb = ""
+        parameters = removeSTARoptions(parameters, ["runThreadN", "genomeLoad", "limitBAMsortRAM"]) + " --genomeLoad LoadAndKeep --runThreadN {threads} --limitBAMsortRAM {sort_ram}".format(**group)
+        genomeLoad = "{STAR} --genomeDir {STARgenomeDir} --outFileNamePrefix {bamDir}/log/{uid}_slurm-%j.genome. --genomeLoad".format(STAR = STAR, STARgenomeDir = ref_genome, bamDir = bamDir, uid = configFileDict['uid'])
+        group.update(setup = f"{genomeLoad} LoadAndExit", teardown = f"{genomeLoad} Remove")
+    # With star_two_pass, the junctions found by a first pass over all the samples are inserted in the genome of the second pass mapping the samples
+    twoPass = configFileDict.get('star_two_pass', "0").strip() == "1"
+    if twoPass:
+        firstPassParameters = parameters
+        parameters = getSecondPassParameters(configFileDict, parameters)
+        FIRST_PASS_JOBS = []
+    
+    # With split_lanes, STAR maps the lanes of a sample in a single job with one read group per lane
+    splitLanes = configFileDict.get('split_lanes', "0").strip() == "1"
+    if splitLanes:
+        parameters = removeSTARoptions(parameters, ["outSAMattrRGline"])
     
     for sample in FASTQ_PREFIX:                                                        
 
+        sampleParameters = parameters
+        if splitLanes:
+            sampleParameters += " --outSAMattrRGline {}".format(" , ".join("ID:{sample}.{unit} SM:{sample} LB:{sample} PL:ILLUMINA PU:{unit}".format(sample = sample, unit = unit) for unit, R1, R2 in getSampleUnits(configFileDict, sample)))
 
         if pairend == "0" :
             if configFileDict['RNAkit'] == "Colibri":
-                STAR_CMD = "{STAR} {parameters} --outFileNamePrefix {outFileNamePrefix} --genomeDir {STARgenomeDir} --readFilesIn {fastq_dir}/{smp}*_R1_001.fastq.gz; {samtools} sort {outFileNamePrefix}Aligned.out.sam -O BAM -o {outFileNamePrefix}Aligned.sortedByCoord.bam; {samtools} index {outFileNamePrefix}Aligned.sortedByCoord.bam; rm {outFileNamePrefix}Aligned.out.sam".format(STAR = STAR, outFileNamePrefix = f"{bamDir}/{sample}.", STARgenomeDir = configFileDict['reference_genome'], annotation = annotation, sjdbOverhand = str(sjdbOverhang), smp = sample, parameters = configFileDict['STARoptions'], fastq_dir = fastqDir, samtools = configFileDict['samtools'])
+                STAR_CMD = "{STAR} {parameters} --outFileNamePrefix {outFileNamePrefix} --genomeDir {STARgenomeDir} --readFilesIn {R1}; {samtools} sort {outFileNamePrefix}Aligned.out.sam -O BAM -o {outFileNamePrefix}Aligned.sortedByCoord.bam; {samtools} index {outFileNamePrefix}Aligned.sortedByCoord.bam; rm {outFileNamePrefix}Aligned.out.sam".format(STAR = STAR, outFileNamePrefix = f"{bamDir}/{sample}.", STARgenomeDir = configFileDict['reference_genome'], annotation = annotation, sjdb = sjdb, smp = sample, parameters = sampleParameters, R1 = ",".join(getSampleFastq(configFileDict, sample, "R1", fastqDir)), R2 = ",".join(getSampleFastq(configFileDict, sample, "R2", fastqDir)), samtools = configFileDict['samtools'])
             else:    
-                STAR_CMD = "{STAR} {parameters} --outFileNamePrefix {outFileNamePrefix} --genomeDir {STARgenomeDir} --readFilesIn {fastq_dir}/{smp}*_R1_001.fastq.gz --sjdbGTFfile {annotation} --sjdbOverhang {sjdbOverhand}; {samtools} index {outFileNamePrefix}Aligned.sortedByCoord.bam".format(STAR = STAR, outFileNamePrefix = f"{bamDir}/{sample}.", STARgenomeDir = configFileDict['reference_genome'], annotation = annotation, sjdbOverhand = str(sjdbOverhang), smp = sample, parameters = configFileDict['STARoptions'], fastq_dir = fastqDir, samtools = configFileDict['samtools'])
+                STAR_CMD = "{STAR} {parameters} --outFileNamePrefix {outFileNamePrefix} --genomeDir {STARgenomeDir} --readFilesIn {R1} {sjdb}; {samtools} index {outFileNamePrefix}Aligned.sortedByCoord.bam".format(STAR = STAR, outFileNamePrefix = f"{bamDir}/{sample}.", STARgenomeDir = configFileDict['reference_genome'], annotation = annotation, sjdb = sjdb, smp = sample, parameters = sampleParameters, R1 = ",".join(getSampleFastq(configFileDict, sample, "R1", fastqDir)), R2 = ",".join(getSampleFastq(configFileDict, sample, "R2", fastqDir)), samtools = configFileDict['samtools'])
         else:
-            STAR_CMD = "{STAR} {parameters} --outFileNamePrefix {outFileNamePrefix} --genomeDir {STARgenomeDir} --readFilesIn {fastq_dir}/{smp}*_R1_001.fastq.gz {fastq_dir}/{smp}*_R2_001.fastq.gz --sjdbGTFfile {annotation} --sjdbOverhang {sjdbOverhand}; {samtools} index {outFileNamePrefix}Aligned.sortedByCoord.bam".format(STAR = STAR, outFileNamePrefix = f"{bamDir}/{sample}.", STARgenomeDir = configFileDict['reference_genome'], annotation = annotation, sjdbOverhand = str(sjdbOverhang), smp = sample, parameters = configFileDict['STARoptions'], fastq_dir = fastqDir, samtools = configFileDict['samtools'])
+            STAR_CMD = "{STAR} {parameters} --outFileNamePrefix {outFileNamePrefix} --genomeDir {STARgenomeDir} --readFilesIn {R1} {R2} {sjdb}; {samtools} index {outFileNamePrefix}Aligned.sortedByCoord.bam".format(STAR = STAR, outFileNamePrefix = f"{bamDir}/{sample}.", STARgenomeDir = configFileDict['reference_genome'], annotation = annotation, sjdb = sjdb, smp = sample, parameters = sampleParameters, R1 = ",".join(getSampleFastq(configFileDict, sample, "R1", fastqDir)), R2 = ",".join(getSampleFastq(configFileDict, sample, "R2", fastqDir)), samtools = configFileDict['samtools'])
    
         
-        if '1' in configFileDict['task_list']: 
-            SLURM_CMD = "{wsbatch} {slurm} -o {log_dir}/{uid}_slurm-%j.out --dependency=afterany:{JID} --wrap=\"{cmd}\"".format(wsbatch = configFileDict["wsbatch"], slurm = configFileDict["slurm_mapping"], log_dir = "{}/log".format(configFileDict['bam_dir']), uid = configFileDict["uid"], cmd = STAR_CMD, JID=configFileDict["TRIM_WAIT"])
-            #print(SLURM_CMD)
-        else: 
-            SLURM_CMD = "{wsbatch} {slurm} -o {log_dir}/{uid}_slurm-%j.out --wrap=\"{cmd}\"".format(wsbatch = configFileDict["wsbatch"], slurm = configFileDict["slurm_mapping"], log_dir = f"{configFileDict['bam_dir']}/log", uid = configFileDict["uid"], cmd = STAR_CMD)
-            #print(SLURM_CMD)
-        
-        if dryRun:
-            print(SLURM_CMD)
-        else:
-            out = subprocess.check_output(SLURM_CMD, shell=True, universal_newlines= True, stderr=subprocess.STDOUT)
-            MAP_JID_LIST.append(catchJID(out))
-            configFileDict['mapping_log_files'].append(getSlurmLog("{}/log".format(configFileDict["bam_dir"]),configFileDict['uid'],out))
+        JID = getSampleWait(configFileDict, 'TRIM_WAIT', sample) if '1' in configFileDict['task_list'] else ""
+        MAP_JOBS.append((sample, STAR_CMD, JID))
+        if twoPass:
+            reads = " ".join(",".join(getSampleFastq(configFileDict, sample, read, fastqDir)) for read in (["R1"] if pairend == "0" else ["R1", "R2"]))
+            FIRST_PASS_JOBS.append((sample, getFirstPassCMD(configFileDict, sample, firstPassParameters, reads, "" if pairend == "0" and configFileDict['RNAkit'] == "Colibri" else sjdb), JID))
+
+    if twoPass:
+        FIRST_PASS_WAIT = submitSampleJobs(configFileDict, 'STAR_PASS1_WAIT', 'mapping_log_files', FIRST_PASS_JOBS, configFileDict["slurm_mapping"], "{}/log".format(bamDir), dryRun)
+        JUNCTIONS_WAIT = submitSampleJobs(configFileDict, 'STAR_JUNCTIONS_WAIT', 'mapping_log_files', [("junctions", getJunctionMergeCMD(configFileDict, FASTQ_PREFIX), FIRST_PASS_WAIT)], configFileDict["slurm_general"], "{}/log".format(bamDir), dryRun)
+        # Each sample is mapped again as soon as the junctions are merged
+        MAP_JOBS = [(sample, STAR_CMD, getSampleWait(configFileDict, 'STAR_JUNCTIONS_WAIT', "junctions")) for sample, STAR_CMD, JID in MAP_JOBS]
     
-    if dryRun:
-        return "dryRun"
-    else:
-        MAP_WAIT = ",".join(MAP_JID_LIST)
-        return MAP_WAIT
+    return submitSampleJobs(configFileDict, 'MAP_WAIT', 'mapping_log_files', MAP_JOBS, configFileDict["slurm_mapping"], "{}/log".format(configFileDict["bam_dir"]), dryRun, group)
 
 
 
@@ -183,7 +316,7 @@ def submitPCRduplication(configFileDict,BAM_FILES, dryRun=False):
     Returns:
         [str]: [Returns the slurm Job IDs so that the jobs of the next step can wait until mapping has finished]
     """
-    PCR_DUP_JID_LIST = []
+    PCR_DUP_JOBS = []
           
     OUTPUT_DIR = configFileDict['marked_bam_dir']    
     for bam in BAM_FILES: 
@@ -194,25 +327,10 @@ def submitPCRduplication(configFileDict,BAM_FILES, dryRun=False):
         
         PCR_CMD = "{PICARD} MarkDuplicates I={input} O={output} M={metrix}; {samtools} index {output}".format(PICARD=configFileDict['picard'], input=bam, output=OUTPUT_FILE, metrix=METRIX_FILE, samtools = configFileDict['samtools'])
         
-        if '2' in configFileDict['task_list']:
-            SLURM_CMD = "{wsbatch} {slurm} -o {log_dir}/{uid}_slurm-%j.out --dependency=afterany:{JID} --wrap=\"{cmd}\"".format(wsbatch = configFileDict["wsbatch"], slurm = configFileDict["slurm_general"], log_dir = "{}/log".format(OUTPUT_DIR), uid = configFileDict["uid"], cmd = PCR_CMD, JID=configFileDict['MAP_WAIT'])
-            #print(SLURM_CMD)
-        else: 
-            SLURM_CMD = "{wsbatch} {slurm} -o {log_dir}/{uid}_slurm-%j.out --wrap=\"{cmd}\"".format(wsbatch = configFileDict["wsbatch"], slurm = configFileDict["slurm_general"], log_dir = "{}/log".format(OUTPUT_DIR), uid = configFileDict["uid"], cmd = PCR_CMD)
-        
-        if dryRun:
-            print(SLURM_CMD)
-        else:
-            out = subprocess.check_output(SLURM_CMD, shell=True, universal_newlines=True, stderr=subprocess.STDOUT)
-            PCR_DUPLICATION_WAIT = PCR_DUP_JID_LIST.append(catchJID(out))
-            configFileDict['pcr_log_files'].append(getSlurmLog("{}/log".format(configFileDict["marked_bam_dir"]),configFileDict['uid'],out))
+        JID = getSampleWait(configFileDict, 'MAP_WAIT', input) if '2' in configFileDict['task_list'] else ""
+        PCR_DUP_JOBS.append((input, PCR_CMD, JID))
     
-    if dryRun:
-        return "dryRun"
-    else:
-        PCR_DUPLICATION_WAIT = ",".join(PCR_DUP_JID_LIST)
-        del PCR_DUP_JID_LIST 
-        return PCR_DUPLICATION_WAIT
+    return submitSampleJobs(configFileDict, 'PCR_DUPLICATION_WAIT', 'pcr_log_files', PCR_DUP_JOBS, configFileDict["slurm_general"], "{}/log".format(OUTPUT_DIR), dryRun)
 
 def submitFilteringBAM(configFileDict, BAM_FILES, dryRun=False):
     """[Submits jobs for filtering and sorting BAM files]
@@ -224,7 +342,7 @@ def submitFilteringBAM(configFileDict, BAM_FILES, dryRun=False):
     Returns:
         [str]: [Returns the slurm Job IDs so that the jobs of the next step can wait until mapping has finished]
     """
-    BAM_FILTER_JID_LIST = []
+    BAM_FILTER_JOBS = []
     OUTPUT_DIR = configFileDict['filtered_bam_dir']
     
     for bam in BAM_FILES:
@@ -235,25 +353,65 @@ def submitFilteringBAM(configFileDict, BAM_FILES, dryRun=False):
         
     
         
-        if '3' in configFileDict['task_list']: 
-            SLURM_CMD = "{wsbatch} {slurm} -o {log_dir}/{uid}_slurm-%j.out --dependency=afterany:{JID} --wrap=\"{cmd}\"".format(wsbatch = configFileDict["wsbatch"], slurm = configFileDict["slurm_filter_bam"], log_dir = "{}/log".format(OUTPUT_DIR), uid = configFileDict["uid"], cmd = FILTER_CMD, JID=configFileDict['PCR_DUPLICATION_WAIT'])
-            #print(SLURM_CMD)
-        else: 
-            SLURM_CMD = "{wsbatch} {slurm} -o {log_dir}/{uid}_slurm-%j.out --wrap=\"{cmd}\"".format(wsbatch = configFileDict["wsbatch"], slurm = configFileDict["slurm_filter_bam"], log_dir = "{}/log".format(OUTPUT_DIR), uid = configFileDict["uid"], cmd = FILTER_CMD)
-        if dryRun:
-            print(SLURM_CMD)
-        else:
-            out = subprocess.check_output(SLURM_CMD, shell=True, universal_newlines= True, stderr=subprocess.STDOUT)
-            BAM_FILTER_JID_LIST.append(catchJID(out))
-            configFileDict['filtering_log_files'].append(getSlurmLog("{}/log".format(configFileDict["filtered_bam_dir"]),configFileDict['uid'],out))
-    
-    if dryRun:
-        return "dryRun"
-    else:
-        FILTER_BAM_WAIT = ",".join(BAM_FILTER_JID_LIST)
-        del BAM_FILTER_JID_LIST
-        return FILTER_BAM_WAIT
+        JID = getSampleWait(configFileDict, 'PCR_DUPLICATION_WAIT', input_file) if '3' in configFileDict['task_list'] else ""
+        BAM_FILTER_JOBS.append((input_file, FILTER_CMD, JID))
     
+    return submitSampleJobs(configFileDict, 'FILTER_BAM_WAIT', 'filtering_log_files', BAM_FILTER_JOBS, configFileDict["slurm_filter_bam"], "{}/log".format(OUTPUT_DIR), dryRun)
+
+
+def submitFusedMappingBowtie(configFileDict, FASTQ_PREFIX, FASTQ_PATH, dryRun=False):
+    """[Submits jobs for mapping, marking duplicates and filtering reads in a single pipe]
+
+    Args:
+        configFileDict ([dict]): [configuration file dictionary]
+        FASTQ_PREFIX ([lst]): [List containing the FASTQ sample IDs]
+        FASTQ_PATH [str]: Absolute path of the FASTQ files
+    Returns:
+        [str]: [Returns the slurm Job IDs so that the jobs of the next step can wait until filtering has finished]
+    """
+    FUSED_JOBS = []
+    configFileDict['mapping_log_files'] = []
+    keep = configFileDict.get('keep_intermediate_bam', "0").strip() == "1"
+    samtools = configFileDict['samtools']
+    bam_dir = configFileDict['bam_dir']
+    marked_bam_dir = configFileDict['marked_bam_dir']
+    filtered_bam_dir = configFileDict['filtered_bam_dir']
+    # The sort and markdup threads and the sort memory are taken from the resources of the job, as for the streamed mapping
+    threads, mem = getSortResources(configFileDict, configFileDict["slurm_mapping"])
+    streamTrim = configFileDict.get('stream_trimming', "0").strip() == "1"
+    slurm_mapping = setJobCpus(configFileDict["slurm_mapping"], getJobCpus(configFileDict["slurm_mapping"]) + getTrimCores(configFileDict)) if streamTrim else configFileDict["slurm_mapping"]
+
+    for file in FASTQ_PREFIX:
+
+        if configFileDict['pairend'] == "1":
+            reads = "-1 {R1} -2 {R2}".format(R1=",".join(getSampleFastq(configFileDict, file, "R1", FASTQ_PATH)), R2=",".join(getSampleFastq(configFileDict, file, "R2", FASTQ_PATH)))
+        else:
+            reads = "-U {R1}".format(R1=",".join(getSampleFastq(configFileDict, file, "R1", FASTQ_PATH)))
+        if streamTrim:
+            trim, reads = getTrimPipe(configFileDict, getSampleFastq(configFileDict, file, "R1", FASTQ_PATH), getSampleFastq(configFileDict, file, "R2", FASTQ_PATH) if configFileDict['pairend'] == "1" else [])
+
+        sorted_bam = f"{bam_dir}/{file}.Aligned.sortedByCoord.bam"
+        marked_bam = f"{marked_bam_dir}/{file}.sortedByCoord.markdup.bam"
+        filtered_bam = f"{filtered_bam_dir}/{file}.QualTrim_NoDup_NochrM_SortedByCoord.bam"
+
+        # Picard MarkDuplicates reads its input twice and cannot be streamed, duplicates are marked with samtools fixmate/markdup
+        if keep:
+            FUSED_CMD = "{mapper} {parameters} -x {REFSEQ} {reads} | {samtools} fixmate -m -u - - | {samtools} sort -@ {threads} -m {mem} -T {tmp} -O BAM - | tee {sorted_bam} | {samtools} markdup -@ {threads} -f {marked_bam_dir}/{file}.metrix -O BAM - - | tee {marked_bam} | {samtools} view {arguments} - | grep -v 'chrM' | {samtools} view -b -o {filtered_bam} -@ {threads} && {samtools} index {filtered_bam} -@ {threads} && {samtools} index {sorted_bam} && {samtools} index {marked_bam}".format(mapper=configFileDict['bowtie2'], parameters=configFileDict['bowtie_parameters'], REFSEQ=configFileDict['reference_genome'], reads=reads, samtools=samtools, threads=threads, mem=mem, tmp=getSortTmp(configFileDict, file), sorted_bam=sorted_bam, marked_bam_dir=marked_bam_dir, file=file, marked_bam=marked_bam, arguments=configFileDict['PCR_duplicates_removal'], filtered_bam=filtered_bam)
+        else:
+            FUSED_CMD = "{mapper} {parameters} -x {REFSEQ} {reads} | {samtools} fixmate -m -u - - | {samtools} sort -@ {threads} -m {mem} -T {tmp} -u - | {samtools} markdup -@ {threads} -f {marked_bam_dir}/{file}.metrix -u - - | {samtools} view {arguments} - | grep -v 'chrM' | {samtools} view -b -o {filtered_bam} -@ {threads} && {samtools} index {filtered_bam} -@ {threads}".format(mapper=configFileDict['bowtie2'], parameters=configFileDict['bowtie_parameters'], REFSEQ=configFileDict['reference_genome'], reads=reads, samtools=samtools, threads=threads, mem=mem, tmp=getSortTmp(configFileDict, file), marked_bam_dir=marked_bam_dir, file=file, arguments=configFileDict['PCR_duplicates_removal'], filtered_bam=filtered_bam)
+
+        # A failure of any command of the pipe fails the job, instead of leaving a truncated filtered BAM file
+        FUSED_CMD = f"{trim}{FUSED_CMD}" if streamTrim else f"set -o pipefail; {FUSED_CMD}"
+
+        JID = getSampleWait(configFileDict, 'TRIM_WAIT', file) if '1' in configFileDict['task_list'] else ""
+        FUSED_JOBS.append((file, FUSED_CMD, JID))
+
+    FUSED_WAIT = submitSampleJobs(configFileDict, 'MAP_WAIT', 'mapping_log_files', FUSED_JOBS, slurm_mapping, "{}/log".format(bam_dir), dryRun)
+    # The duplicate marking and filtering steps of each sample are done by the same job
+    for waitKey in ['PCR_DUPLICATION_WAIT', 'FILTER_BAM_WAIT']:
+        configFileDict[f"{waitKey}_DICT"] = dict(configFileDict.get('MAP_WAIT_DICT', {}))
+    return FUSED_WAIT
+
 
  
 def submitBAM2BW(configFileDict, BAM_FILES, dryRun=False):
@@ -266,7 +424,7 @@ def submitBAM2BW(configFileDict, BAM_FILES, dryRun=False):
     Returns:
         [str]: [Returns the slurm Job IDs so that the jobs of the next step can wait until mapping has finished]
     """
-    BW_JID_LIST = []
+    BW_JOBS = []
     OUTPUT_DIR = configFileDict['bw_dir']
     for bam in BAM_FILES:
         input_file = os.path.basename(bam).split(".")[0]
@@ -275,26 +433,14 @@ def submitBAM2BW(configFileDict, BAM_FILES, dryRun=False):
         BAM2BW_CMD = "{bamcoverage} {arguments} --bam {input} -o {output}".format(bamcoverage=configFileDict['bamCoverage'], arguments=configFileDict['bam2bw'], input=bam, output=OUTPUT_FILE)
         
         if '4' in configFileDict['task_list']:
-            SLURM_CMD = "{wsbatch} {slurm} -o {log_dir}/{uid}_slurm-%j.out --dependency=afterany:{JID} --wrap=\"{cmd}\"".format(wsbatch = configFileDict["wsbatch"], slurm = configFileDict["slurm_general"], log_dir = "{}/log".format(OUTPUT_DIR), uid = configFileDict["uid"], cmd = BAM2BW_CMD, JID=configFileDict['FILTER_BAM_WAIT'])
-            #print(SLURM_CMD)
+            JID = getSampleWait(configFileDict, 'FILTER_BAM_WAIT', input_file)
         elif configFileDict['technology'] == "RNAseq" and '2' in configFileDict['task_list']:
-            SLURM_CMD = "{wsbatch} {slurm} -o {log_dir}/{uid}_slurm-%j.out --dependency=afterany:{JID} --wrap=\"{cmd}\"".format(wsbatch = configFileDict["wsbatch"], slurm = configFileDict["slurm_general"], log_dir = "{}/log".format(OUTPUT_DIR), uid = configFileDict["uid"], cmd = BAM2BW_CMD, JID=configFileDict['MAP_WAIT'])
-        else:
-            SLURM_CMD = "{wsbatch} {slurm} -o {log_dir}/{uid}_slurm-%j.out --wrap=\"{cmd}\"".format(wsbatch = configFileDict["wsbatch"], slurm = configFileDict["slurm_general"], log_dir = "{}/log".format(OUTPUT_DIR), uid = configFileDict["uid"], cmd = BAM2BW_CMD)
-        
-        if dryRun: 
-            print(SLURM_CMD)
+            JID = getSampleWait(configFileDict, 'MAP_WAIT', input_file)
         else:
-            out = subprocess.check_output(SLURM_CMD, shell=True, universal_newlines= True, stderr=subprocess.STDOUT)
-            BW_JID_LIST.append(catchJID(out))
-            configFileDict['bw_log_files'].append(getSlurmLog("{}/log".format(configFileDict["bw_dir"]),configFileDict['uid'],out))
+            JID = ""
+        BW_JOBS.append((input_file, BAM2BW_CMD, JID))
             
-    if dryRun:
-        return "dryRun"
-    else:    
-        BAM2BW_WAIT = ",".join(BW_JID_LIST)
-        del BW_JID_LIST
-        return BAM2BW_WAIT
+    return submitSampleJobs(configFileDict, 'BAM2BW_WAIT', 'bw_log_files', BW_JOBS, configFileDict["slurm_general"], "{}/log".format(OUTPUT_DIR), dryRun)
 
 def submitMergingBW(configFileDict, BW_FILES,dryRun=False):
     """[Submits jobs for merging of bw files into groups]
@@ -309,30 +455,24 @@ def submitMergingBW(configFileDict, BW_FILES,dryRun=False):
     BW_JID_LIST = []
     OUTPUT_DIR = configFileDict['bw_dir']
     
-    groups = configFileDict.get("groups")
-    groupDico = createGroups(groups, BW_FILES)
+    groupDico = getGroupFiles(configFileDict, BW_FILES)
     
     genomeSizeFile = configFileDict['genomeFileSize']
+    SLURM_CMDS = []
     for group,files in groupDico.items():
         output1 = f"{OUTPUT_DIR}/{group}.merged.bdg"
         output2 = f"{OUTPUT_DIR}/{group}.merged.sorted.bdg"
         output3 = f"{OUTPUT_DIR}/{group}.merged.bw"
         cmd = "{bwm} {files} {output1}; LC_COLLATE=C sort -k1,1 -k2,2n {output1} > {output2}; {bdgTobw} {output2} {genomeFileSize} {output3}; rm {output1} {output2}".format(bwm = configFileDict['bigWigMerge'], files = " ".join(files), output1 = output1, output2= output2, output3=output3, genomeFileSize = genomeSizeFile, bdgTobw = configFileDict['bedGraphToBigWig'])
-        SLURM_CMD = "{wsbatch} {slurm} -o {log_dir}/{uid}_slurm-%j.out --dependency=afterany:{JID} --wrap=\"{cmd}\"".format(wsbatch = configFileDict["wsbatch"], slurm = configFileDict["slurm_general"], log_dir = "{}/log".format(OUTPUT_DIR), uid = configFileDict["uid"], cmd = cmd, JID=configFileDict['BAM2BW_WAIT'])
-        
-        if dryRun:
-            print(SLURM_CMD)
-        else: 
-            out = subprocess.check_output(SLURM_CMD, shell=True, universal_newlines= True, stderr=subprocess.STDOUT)
-            BW_JID_LIST.append(catchJID(out))
-            configFileDict['bw_log_files'].append(getSlurmLog("{}/log".format(configFileDict["bw_dir"]),configFileDict['uid'],out))
+        SLURM_CMDS.append("{wsbatch} {slurm} -o {log_dir}/{uid}_slurm-%j.out --dependency=afterany:{JID} --wrap=\"{cmd}\"".format(wsbatch = configFileDict["wsbatch"], slurm = configFileDict["slurm_general"], log_dir = "{}/log".format(OUTPUT_DIR), uid = configFileDict["uid"], cmd = cmd, JID=configFileDict['BAM2BW_WAIT']))
+    
+    for out in submitJobs(configFileDict, SLURM_CMDS):
+        BW_JID_LIST.append(catchJID(out))
+        configFileDict['bw_log_files'].append(getSlurmLog("{}/log".format(configFileDict["bw_dir"]),configFileDict['uid'],out))
       
-    if dryRun:
-        return "dryRun"
-    else:    
-        BAM2BW_WAIT = ",".join(BW_JID_LIST)
-        del BW_JID_LIST
-        return BAM2BW_WAIT  
+    BAM2BW_WAIT = ",".join(BW_JID_LIST)
+    del BW_JID_LIST
+    return BAM2BW_WAIT  
     
 
         
@@ -346,7 +486,7 @@ def submitBAM2BED(configFileDict, BAM_FILES, dryRun=False):
     Returns:
         [str]: [Returns the slurm Job IDs so that the jobs of the next step can wait until mapping has finished]
     """
-    BAM2BED_JID_LIST = []
+    BAM2BED_JOBS = []
     OUTPUT_DIR = configFileDict['bed_dir']
     for bam in BAM_FILES:
         input_file = os.path.basename(bam).split(".")[0]
@@ -354,26 +494,10 @@ def submitBAM2BED(configFileDict, BAM_FILES, dryRun=False):
     
         BAM2BED_CMD = "source {bam2bed} {bedtools} {input} {output}".format(bedtools=configFileDict['bedtools'],bam2bed=configFileDict['bam2bed_script'],input=bam, output=OUTPUT_FILE)
         
-        if '4' in configFileDict['task_list']: 
-            SLURM_CMD = "{wsbatch} {slurm} -o {log_dir}/{uid}_slurm-%j.out --dependency=afterany:{JID} --wrap=\"{cmd}\"".format(wsbatch = configFileDict["wsbatch"], slurm = configFileDict["slurm_general"], log_dir = "{}/log".format(OUTPUT_DIR), uid = configFileDict["uid"], cmd = BAM2BED_CMD, JID=configFileDict['FILTER_BAM_WAIT'])
-            #print(SLURM_CMD)
-        else: 
-            SLURM_CMD = "{wsbatch} {slurm} -o {log_dir}/{uid}_slurm-%j.out --wrap=\"{cmd}\"".format(wsbatch = configFileDict["wsbatch"], slurm = configFileDict["slurm_general"], log_dir = "{}/log".format(OUTPUT_DIR), uid = configFileDict["uid"], cmd = BAM2BED_CMD)
-            #print(SLURM_CMD)
-        
-        if dryRun:
-            print(SLURM_CMD)
-        else:
-            out = subprocess.check_output(SLURM_CMD, shell=True, universal_newlines= True, stderr=subprocess.STDOUT)
-            BAM2BED_JID_LIST.append(catchJID(out))
-            configFileDict['bam2bed_log_files'].append(getSlurmLog("{}/log".format(configFileDict["bed_dir"]),configFileDict['uid'],out))
+        JID = getSampleWait(configFileDict, 'FILTER_BAM_WAIT', input_file) if '4' in configFileDict['task_list'] else ""
+        BAM2BED_JOBS.append((input_file, BAM2BED_CMD, JID))
             
-    if dryRun:
-        return "dryRun"
-    else:   
-        BAM2BED_WAIT = ",".join(BAM2BED_JID_LIST)
-        del BAM2BED_JID_LIST
-        return BAM2BED_WAIT
+    return submitSampleJobs(configFileDict, 'BAM2BED_WAIT', 'bam2bed_log_files', BAM2BED_JOBS, configFileDict["slurm_general"], "{}/log".format(OUTPUT_DIR), dryRun)
 
 def submitExtendReads(configFileDict,BED_FILES, dryRun=False):
     """[Submits jobs for removal of PCR duplicated reads]
@@ -385,7 +509,7 @@ def submitExtendReads(configFileDict,BED_FILES, dryRun=False):
     Returns:
         [str]: [Returns the slurm Job IDs so that the jobs of the next step can wait until mapping has finished]
     """
-    EXTENDBED_JID_LIST = []
+    EXTENDBED_JOBS = []
     OUTPUT_DIR = configFileDict['extended_bed_dir']
     for bam in BED_FILES:
         input_file = os.path.basename(bam).split(".")[0]
@@ -393,24 +517,10 @@ def submitExtendReads(configFileDict,BED_FILES, dryRun=False):
         
         EXTENDBED_CMD = "source {BIN} {input} {extension} {genomeFileExtension} {output} {bedClip}".format(BIN=configFileDict['extendReadsScript'], extension=configFileDict['extend_reads'], input=bam, genomeFileExtension=configFileDict['genomeFileSize'], output=OUTPUT_FILE, bedClip = configFileDict['bedClip'])
         
-        if '4' in configFileDict['task_list']: 
-            SLURM_CMD = "{wsbatch} {slurm} -o {log_dir}/{uid}_slurm-%j.out --dependency=afterany:{JID} --wrap=\"{cmd}\"".format(wsbatch = configFileDict["wsbatch"], slurm = configFileDict["slurm_general"], log_dir = "{}/log".format(OUTPUT_DIR), uid = configFileDict["uid"], cmd = EXTENDBED_CMD, JID=configFileDict['BAM2BED_WAIT'])
-        else: 
-            SLURM_CMD = "{wsbatch} {slurm} -o {log_dir}/{uid}_slurm-%j.out --wrap=\"{cmd}\"".format(wsbatch = configFileDict["wsbatch"], slurm = configFileDict["slurm_general"], log_dir = "{}/log".format(OUTPUT_DIR), uid = configFileDict["uid"], cmd = EXTENDBED_CMD)
-        
-        if dryRun:
-            print(SLURM_CMD)
-        else:
-            out = subprocess.check_output(SLURM_CMD, shell=True, universal_newlines= True, stderr=subprocess.STDOUT)
-            EXTENDBED_JID_LIST.append(catchJID(out))
-            configFileDict['extend_log_files'].append(getSlurmLog("{}/log".format(configFileDict["extended_bed_dir"]),configFileDict['uid'],out))
+        JID = getSampleWait(configFileDict, 'BAM2BED_WAIT', input_file) if '6' in configFileDict['task_list'] else ""
+        EXTENDBED_JOBS.append((input_file, EXTENDBED_CMD, JID))
     
-    if dryRun:
-        return "dryRun"
-    else:
-        EXT_BED_WAIT = ",".join(EXTENDBED_JID_LIST)
-        del EXTENDBED_JID_LIST
-        return EXT_BED_WAIT
+    return submitSampleJobs(configFileDict, 'EXT_BED_WAIT', 'extend_log_files', EXTENDBED_JOBS, configFileDict["slurm_general"], "{}/log".format(OUTPUT_DIR), dryRun)
 
 
 def submitPeakCalling(configFileDict,BAM_FILES, dryRun=False):
@@ -423,7 +533,7 @@ def submitPeakCalling(configFileDict,BAM_FILES, dryRun=False):
     Returns:
         [str]: [Returns the slurm Job IDs so that the jobs of the next step can wait until mapping has finished]
     """
-    PEAK_CALLING_JID_LIST = []
+    PEAK_CALLING_JOBS = []
     OUTPUT_DIR = configFileDict['peaks_dir']
     
     for bam in BAM_FILES:
@@ -436,24 +546,11 @@ def submitPeakCalling(configFileDict,BAM_FILES, dryRun=False):
         
         CMD = PEAKCALL_CMD + " && " + SIGNAL_TRACK_ATAC_CMD
         
-        if '4' in configFileDict['task_list']: 
-            SLURM_CMD = "{wsbatch} {slurm} -o {log_dir}/{uid}_slurm-%j.out --dependency=afterany:{JID} --wrap=\"{cmd}\"".format(wsbatch = configFileDict["wsbatch"], slurm = configFileDict["slurm_peakCalling"], log_dir = "{}/log".format(OUTPUT_DIR), uid = configFileDict["uid"], cmd = CMD, JID=configFileDict['FILTER_BAM_WAIT'])
-        else: 
-            SLURM_CMD = "{wsbatch} {slurm} -o {log_dir}/{uid}_slurm-%j.out --wrap=\"{cmd}\"".format(wsbatch = configFileDict["wsbatch"], slurm = configFileDict["slurm_general"], log_dir = "{}/log".format(OUTPUT_DIR), uid = configFileDict["uid"], cmd = CMD)
-        
-        if dryRun:
-            print(SLURM_CMD)
-        else:
-            out = subprocess.check_output(SLURM_CMD, shell=True, universal_newlines= True, stderr=subprocess.STDOUT)
-            PEAK_CALLING_JID_LIST.append(catchJID(out))
-            configFileDict['peak_log_files'].append(getSlurmLog("{}/log".format(configFileDict["peaks_dir"]),configFileDict['uid'],out))
-            
-    if dryRun:
-        return "dryRun"
-    else:
-        PEAK_CALLING_WAIT = ",".join(PEAK_CALLING_JID_LIST)
-        del PEAK_CALLING_JID_LIST
-        return PEAK_CALLING_WAIT
+        JID = getSampleWait(configFileDict, 'FILTER_BAM_WAIT', input_file) if '4' in configFileDict['task_list'] else ""
+        PEAK_CALLING_JOBS.append((input_file, CMD, JID))
+    
+    SLURM = configFileDict["slurm_peakCalling"] if '4' in configFileDict['task_list'] else configFileDict["slurm_general"]
+    return submitSampleJobs(configFileDict, 'PEAK_CALLING_WAIT', 'peak_log_files', PEAK_CALLING_JOBS, SLURM, "{}/log".format(OUTPUT_DIR), dryRun)
 
 
 def submitChIPseqPeakCalling(configFileDict,BAM_FILES, dryRun=False):
@@ -466,7 +563,7 @@ def submitChIPseqPeakCalling(configFileDict,BAM_FILES, dryRun=False):
     Returns:
         [str]: [Returns the slurm Job IDs so that the jobs of the next step can wait until mapping has finished]
     """
-    PEAK_CALLING_JID_LIST = []
+    PEAK_CALLING_JOBS = []
     OUTPUT_DIR = configFileDict['peaks_dir']
     
     for file in BAM_FILES:
@@ -485,26 +582,11 @@ def submitChIPseqPeakCalling(configFileDict,BAM_FILES, dryRun=False):
         
         
         #print(PEAKCALL_CMD)
-        if '4' in configFileDict['task_list']: 
-            SLURM_CMD = "{wsbatch} {slurm} -o {log_dir}/{uid}_slurm-%j.out --dependency=afterany:{JID} --wrap=\"{cmd}\"".format(wsbatch = configFileDict["wsbatch"], slurm = configFileDict["slurm_peakCalling"], log_dir = "{}/log".format(OUTPUT_DIR), uid = configFileDict["uid"], cmd = CMD, JID=configFileDict['FILTER_BAM_WAIT'])
-        else: 
-            SLURM_CMD = "{wsbatch} {slurm} -o {log_dir}/{uid}_slurm-%j.out --wrap=\"{cmd}\"".format(wsbatch = configFileDict["wsbatch"], slurm = configFileDict["slurm_general"], log_dir = "{}/log".format(OUTPUT_DIR), uid = configFileDict["uid"], cmd = CMD)
-        
-        if dryRun:
-            print(SLURM_CMD)
-        else:
-            out = subprocess.check_output(SLURM_CMD, shell=True, universal_newlines= True, stderr=subprocess.STDOUT)
-            PEAK_CALLING_JID_LIST.append(catchJID(out))
-            configFileDict['peak_log_files'].append(getSlurmLog("{}/log".format(configFileDict["peaks_dir"]),configFileDict['uid'],out))
+        JID = getSampleWait(configFileDict, 'FILTER_BAM_WAIT', input_file, os.path.basename(inputs).split(".")[0]) if '4' in configFileDict['task_list'] else ""
+        PEAK_CALLING_JOBS.append((input_file, CMD, JID))
     
-    if dryRun:
-        return "dryRun"
-    else:    
-        PEAK_CALLING_WAIT = ",".join(PEAK_CALLING_JID_LIST)
-        del PEAK_CALLING_JID_LIST
-        return PEAK_CALLING_WAIT
-
-
+    SLURM = configFileDict["slurm_peakCalling"] if '4' in configFileDict['task_list'] else configFileDict["slurm_general"]
+    return submitSampleJobs(configFileDict, 'PEAK_CALLING_WAIT', 'peak_log_files', PEAK_CALLING_JOBS, SLURM, "{}/log".format(OUTPUT_DIR), dryRun)
 
 def submitPeak2Counts_DEPRECATED(configFileDict,NARROWPEAK_FILES,EXTENDED_BED_FILES, dryRun=False):
     """[Submits jobs peak2Counts DEPRECATED]
@@ -542,7 +624,7 @@ def submitPeak2Counts_DEPRECATED(configFileDict,NARROWPEAK_FILES,EXTENDED_BED_FI
     if dryRun:
         print(SLURM_CMD)
     else:
-        out = subprocess.check_output(SLURM_CMD, shell=True, universal_newlines= True, stderr=subprocess.STDOUT)
+        out = submitJob(configFileDict, SLURM_CMD)
         PEAK_CALLING_JID_LIST = catchJID(out)
         configFileDict['peak2Count_log_files'].append(getSlurmLog("{}/log".format(configFileDict["peakCounts_dir"]),configFileDict['uid'],out))
     
@@ -588,6 +670,10 @@ def submitPeak2Counts(configFileDict,NARROWPEAK_FILES,BAM_FILES, dryRun=False):
     COMBINECOUNTS2BED_CMD = "python3 {combineCounts} --file-list {input_dir}/*.counts.txt --outputFile {input_dir}/AllSamples.chrALL.bed && /srv/beegfs/scratch/shares/brauns_lab/Tools/htslib-1.16/bgzip {input_dir}/AllSamples.chrALL.bed".format(combineCounts = configFileDict['combineCountScript'], input_dir = OUTPUT_DIR)
     
     CMDs = PEAK2COUNT_CMD + " && " + ";".join(peak_cmd) + " && " + COMBINECOUNTS2BED_CMD
+    if configFileDict.get('incremental') == "1":
+        # Only the new samples and the peaks that changed in the consensus peak set are counted. The counts of the other peaks are taken from the previous AllSamples.chrALL.bed.gz
+        UPDATECOUNTS2BED_CMD = "python3 {updatePeakCounts} --gtf-file {peakGTF} --bam-files {bamFiles} --previous-bed {input_dir}/AllSamples.chrALL.bed.gz --featureCounts {featurecounts} --featureCounts-options='{quantOptions}' --output-dir {input_dir} && /srv/beegfs/scratch/shares/brauns_lab/Tools/htslib-1.16/bgzip -f {input_dir}/AllSamples.chrALL.bed".format(updatePeakCounts = configFileDict['updatePeakCountsScript'], peakGTF = GTF_FILE, bamFiles = " ".join(BAM_FILES), input_dir = OUTPUT_DIR, featurecounts = configFileDict['featureCounts'], quantOptions = configFileDict['quantOptions'])
+        CMDs = PEAK2COUNT_CMD + " && " + UPDATECOUNTS2BED_CMD
     wait_condition = ""
      
     if '8' in configFileDict["task_list"]: 
@@ -599,79 +685,67 @@ def submitPeak2Counts(configFileDict,NARROWPEAK_FILES,BAM_FILES, dryRun=False):
         SLURM_CMD = "{wsbatch} {slurm} -o {log_dir}/{uid}_slurm-%j.out --dependency=afterany:{JID} --wrap=\"{cmd}\"".format(wsbatch = configFileDict["wsbatch"], slurm = configFileDict["slurm_filter_bam"], log_dir = "{}/log".format(OUTPUT_DIR), uid = configFileDict["uid"], cmd = CMDs, JID=wait_condition)
     #print(SLURM_CMD)
     
-    if dryRun:
-        print(SLURM_CMD)
-    else:
-        out = subprocess.check_output(SLURM_CMD, shell=True, universal_newlines= True, stderr=subprocess.STDOUT)
-        PEAK_CALLING_JID_LIST = catchJID(out)
-        configFileDict['peak2Count_log_files'].append(getSlurmLog("{}/log".format(configFileDict["peakCounts_dir"]),configFileDict['uid'],out))
+    out = submitJob(configFileDict, SLURM_CMD)
+    PEAK_CALLING_JID_LIST = catchJID(out)
+    configFileDict['peak2Count_log_files'].append(getSlurmLog("{}/log".format(configFileDict["peakCounts_dir"]),configFileDict['uid'],out))
     
-    if dryRun:
-        return "dryRun"
-    else:
-        PEAK_CALLING_WAIT = PEAK_CALLING_JID_LIST
-        del PEAK_CALLING_JID_LIST
-        return PEAK_CALLING_WAIT
-
-def submitJobCheck(configFileDict, log_key, wait_key, dryRun=False):
-    log_files = configFileDict[log_key]
-    for file in log_files: 
-        cmd = "python3 {jobCheck} -w -log {file}".format(jobCheck=configFileDict['jobCheck'], file=file)
-        SLURM_CMD = "{wsbatch} --dependency=afterany:{JID} -o {raw_log}/slurm-%j.out --wrap=\"{cmd}\"".format(wsbatch=configFileDict['wsbatch'], cmd=cmd, JID=wait_key, raw_log = configFileDict['raw_log'])
-        if dryRun:
-            print(SLURM_CMD)
-        else:
-            out = subprocess.check_output(SLURM_CMD, shell=True, universal_newlines=True, stderr=subprocess.STDOUT)
+    PEAK_CALLING_WAIT = PEAK_CALLING_JID_LIST
+    del PEAK_CALLING_JID_LIST
+    return PEAK_CALLING_WAIT
 
 def submitJobCheck2(configFileDict, logFiles, wait_key, dryRun=False):
-    cmd = []
-    for file in logFiles:
-        cmd.append("python3 {jobCheck} -w -log {file}".format(jobCheck=configFileDict['jobCheck'], file=file))
-    
-    cmd = "; ".join(cmd)
-    
+    if getExecutor(configFileDict).writesJobSummary or not logFiles:
+        # The local executor already appended the job summary to the log files. Without log files all the results were cached
+        return wait_key
+    # A single job queries sacct once for all the jobs of the run and writes their status in one json file read by the report
+    logList = "{raw_log}/{uid}_log_files.txt".format(raw_log = configFileDict['raw_log'], uid = configFileDict['uid'])
+    configFileDict['job_status_file'] = "{raw_log}/{uid}_job_status.json".format(raw_log = configFileDict['raw_log'], uid = configFileDict['uid'])
+    cmd = "python3 {jobCheck} -s {statusFile} -ll {logList}".format(jobCheck=configFileDict['jobCheck'], statusFile=configFileDict['job_status_file'], logList=logList)
+    # The resources used by the jobs are added to the history used to size the jobs of the next runs
+    jobResources = "{raw_log}/{uid}_job_resources.json".format(raw_log = configFileDict['raw_log'], uid = configFileDict['uid'])
+    if configFileDict.get('job_resources') and configFileDict.get('resource_history', "").strip():
+        cmd += " -hist {historyFile} -jr {jobResources}".format(historyFile = configFileDict['resource_history'].strip(), jobResources = jobResources)
+    # The jobs of the run are recorded in the run database read by braunLP.py stats
+    jobTelemetry = "{raw_log}/{uid}_job_telemetry.json".format(raw_log = configFileDict['raw_log'], uid = configFileDict['uid'])
+    if configFileDict.get('run_db', "").strip():
+        cmd += " -db {runDB} -jt {jobTelemetry}".format(runDB = configFileDict['run_db'].strip(), jobTelemetry = jobTelemetry)
+    
+    if not dryRun:
+        with open(logList, "w") as g:
+            g.write("\n".join(logFiles) + "\n")
+        if configFileDict.get('job_resources'):
+            dict2File(configFileDict['job_resources'], jobResources)
+        # Also read by braunLP.py monitor
+        dict2File({'run': getRunInfo(configFileDict), 'jobs': configFileDict.get('job_telemetry', {})}, jobTelemetry)
+    if useRetry(configFileDict):
+        # The jobs resubmitted by the supervisor replace their failed job in the log files checked by jobCheck.py, so jobCheck.py waits for the supervisor
+        configFileDict['retry_files'] = [logList, jobResources, jobTelemetry] + (["{}/configFileDict.json".format(configFileDict['report_dir'])] if configFileDict.get('report_dir') else [])
+        writeRetryJobs(configFileDict, configFileDict['retry_files'])
+        wait_key = "{},{}".format(wait_key, submitRetrySupervisor(configFileDict, submitJob))
+
     SLURM_CMD = "{wsbatch} --dependency=afterany:{JID} -o {raw_log}/slurm-%j.out --wrap=\"{cmd}\"".format(wsbatch=configFileDict['wsbatch'], cmd=cmd, JID=wait_key, raw_log = configFileDict['raw_log'])
-    if dryRun:
-        print(SLURM_CMD)
-    else:
-        out = subprocess.check_output(SLURM_CMD, shell=True, universal_newlines=True, stderr=subprocess.STDOUT)
-        JOBCHECK_WAIT = catchJID(out)
-        return JOBCHECK_WAIT
+    out = submitJob(configFileDict, SLURM_CMD)
+    JOBCHECK_WAIT = catchJID(out)
+    return JOBCHECK_WAIT
 
 def submitATACseqQC(configFileDict, BAM_FILES, dryRun=False):
-    ATACQC_JID_LIST = []
+    ATACQC_JOBS = []
     OUTPUT_DIR = configFileDict['bamQC_dir']
     for bam in BAM_FILES:
         input_file = os.path.basename(bam).split(".")[0]
         
         ATACQC_CMD = "Rscript {BIN} {input} {output_dir}".format(BIN=configFileDict['ATACseqQC'],input = bam,output_dir = OUTPUT_DIR) 
         
-        if '4' in configFileDict['task_list']:
-            SLURM_CMD = "{wsbatch} {slurm} -o {log_dir}/{uid}_slurm-%j.out --dependency=afterany:{JID} --wrap=\"{cmd}\"".format(wsbatch = configFileDict["wsbatch"], slurm = configFileDict["slurm_general"], log_dir = "{}/log".format(OUTPUT_DIR), uid = configFileDict["uid"], cmd = ATACQC_CMD, JID=configFileDict['FILTER_BAM_WAIT'])
-            #print(SLURM_CMD)
-        else:
-            SLURM_CMD = "{wsbatch} {slurm} -o {log_dir}/{uid}_slurm-%j.out --wrap=\"{cmd}\"".format(wsbatch = configFileDict["wsbatch"], slurm = configFileDict["slurm_general"], log_dir = "{}/log".format(OUTPUT_DIR), uid = configFileDict["uid"], cmd = ATACQC_CMD)
-            #print(SLURM_CMD)
-        
-        if dryRun:
-            print(SLURM_CMD)
-        else:
-            out = subprocess.check_output(SLURM_CMD, shell=True, universal_newlines= True, stderr=subprocess.STDOUT)
-            ATACQC_JID_LIST.append(catchJID(out))
-            configFileDict['atacQC_log_files'].append(getSlurmLog("{}/log".format(configFileDict["bamQC_dir"]),configFileDict['uid'],out))
+        JID = getSampleWait(configFileDict, 'FILTER_BAM_WAIT', input_file) if '4' in configFileDict['task_list'] else ""
+        ATACQC_JOBS.append((input_file, ATACQC_CMD, JID))
         
-    if dryRun: 
-        return "dryRun"
-    else:
-        ATACQC_WAIT = ",".join(ATACQC_JID_LIST)
-        del ATACQC_JID_LIST
-        return ATACQC_WAIT
+    return submitSampleJobs(configFileDict, 'ATACQC_WAIT', 'atacQC_log_files', ATACQC_JOBS, configFileDict["slurm_general"], "{}/log".format(OUTPUT_DIR), dryRun)
 
 
 
 
 def submitBamQC(configFileDict, BAM_FILES, dryRun=False):
-    BAMQC_JID_LIST = []
+    BAMQC_JOBS = []
     OUTPUT_DIR = configFileDict['bamQC_dir']
     for bam in BAM_FILES:
         input_file = os.path.basename(bam).split(".")[0]
@@ -679,35 +753,20 @@ def submitBamQC(configFileDict, BAM_FILES, dryRun=False):
         output_file = f"{OUTPUT_DIR}/{input_file}_bamQC_stats.csv"
         BAMQC_CMD = "Rscript {BIN} {input} {output_dir}".format(BIN=configFileDict['ATACbamQC'],input = bam,output_dir = output_file) 
         
-        if '4' in configFileDict['task_list']:
-            SLURM_CMD = "{wsbatch} {slurm} -o {log_dir}/{uid}_slurm-%j.out --dependency=afterany:{JID} --wrap=\"{cmd}\"".format(wsbatch = configFileDict["wsbatch"], slurm = configFileDict["slurm_general"], log_dir = "{}/log".format(OUTPUT_DIR), uid = configFileDict["uid"], cmd = BAMQC_CMD, JID=configFileDict['FILTER_BAM_WAIT'])
-
-        else:
-            SLURM_CMD = "{wsbatch} {slurm} -o {log_dir}/{uid}_slurm-%j.out --wrap=\"{cmd}\"".format(wsbatch = configFileDict["wsbatch"], slurm = configFileDict["slurm_general"], log_dir = "{}/log".format(OUTPUT_DIR), uid = configFileDict["uid"], cmd = BAMQC_CMD)
-
-        if dryRun:
-            print(SLURM_CMD)
-        else:
-            out = subprocess.check_output(SLURM_CMD, shell=True, universal_newlines= True, stderr=subprocess.STDOUT)
-            BAMQC_JID_LIST.append(catchJID(out))
-            configFileDict['bamQC_log_files'].append(getSlurmLog("{}/log".format(configFileDict["bamQC_dir"]),configFileDict['uid'],out))
+        JID = getSampleWait(configFileDict, 'FILTER_BAM_WAIT', input_file) if '4' in configFileDict['task_list'] else ""
+        BAMQC_JOBS.append((input_file, BAMQC_CMD, JID))
     
+    BAMQC_WAIT = submitSampleJobs(configFileDict, 'BAMQC_WAIT', 'bamQC_log_files', BAMQC_JOBS, configFileDict["slurm_general"], "{}/log".format(OUTPUT_DIR), dryRun)
     combineCSV_cmd = "awk 'NR==1 || FNR>1 {{print}}' {outputDir}/*_bamQC_stats.csv > {outputDir}/Allsamples_bamQC_stats.csv".format(outputDir = OUTPUT_DIR)
 
-    BAMQC_WAIT = ",".join(BAMQC_JID_LIST)
     SLURM_CMD = "{wsbatch} {slurm} -o {log_dir}/{uid}_slurm-%j.out --dependency=afterany:{JID} --wrap=\"{cmd}\"".format(wsbatch = configFileDict["wsbatch"], slurm = configFileDict["slurm_general"], log_dir = "{}/log".format(OUTPUT_DIR), uid = configFileDict["uid"], cmd = combineCSV_cmd, JID=BAMQC_WAIT)
     
-    if dryRun:
-        print(SLURM_CMD)
-        return "dryRun"
-    else:
-        out = subprocess.check_output(SLURM_CMD, shell=True, universal_newlines= True, stderr=subprocess.STDOUT)
-        BAMQC_WAIT += "," + catchJID(out)
-        del BAMQC_JID_LIST
-        return BAMQC_WAIT
+    out = submitJob(configFileDict, SLURM_CMD)
+    BAMQC_WAIT += "," + catchJID(out)
+    return BAMQC_WAIT
 
 def submitSamtoolsBamQC(configFileDict, BAM_FILES, dryRun=False):
-    BAMQC_JID_LIST = []
+    BAMQC_JOBS = []
     OUTPUT_DIR = configFileDict['bamQC_dir']
     for bam in BAM_FILES:
         sampleID = os.path.basename(bam).split(".")[0]
@@ -731,67 +790,37 @@ def submitSamtoolsBamQC(configFileDict, BAM_FILES, dryRun=False):
         outputFile = f"{OUTPUT_DIR}/{prefix}_bamStats"
         BAMQC_CMD = "{samtools} stats {bam} > {outputFile}".format(samtools = configFileDict['samtools'], bam = bam, outputFile = outputFile, plotBam = configFileDict['plotBam'], input_file = prefix)
         
-        if '4' in configFileDict['task_list']:
-            SLURM_CMD = "{wsbatch} {slurm} -o {log_dir}/{uid}_slurm-%j.out --dependency=afterany:{JID} --wrap=\"{cmd}\"".format(wsbatch = configFileDict["wsbatch"], slurm = configFileDict["slurm_general"], log_dir = "{}/log".format(OUTPUT_DIR), uid = configFileDict["uid"], cmd = BAMQC_CMD, JID=configFileDict['FILTER_BAM_WAIT'])
-
-        else:
-            SLURM_CMD = "{wsbatch} {slurm} -o {log_dir}/{uid}_slurm-%j.out --wrap=\"{cmd}\"".format(wsbatch = configFileDict["wsbatch"], slurm = configFileDict["slurm_general"], log_dir = "{}/log".format(OUTPUT_DIR), uid = configFileDict["uid"], cmd = BAMQC_CMD)
-
-        if dryRun:
-            print(SLURM_CMD)
-        else:
-            out = subprocess.check_output(SLURM_CMD, shell=True, universal_newlines= True, stderr=subprocess.STDOUT)
-            BAMQC_JID_LIST.append(catchJID(out))
-            configFileDict['bamQC_log_files'].append(getSlurmLog("{}/log".format(configFileDict["bamQC_dir"]),configFileDict['uid'],out))
+        JID = getSampleWait(configFileDict, 'FILTER_BAM_WAIT', sampleID) if '4' in configFileDict['task_list'] else ""
+        BAMQC_JOBS.append((sampleID, BAMQC_CMD, JID))
     
-      
-    BAMQC_WAIT = ",".join(BAMQC_JID_LIST)
+    BAMQC_WAIT = submitSampleJobs(configFileDict, 'BAMQC_WAIT', 'bamQC_log_files', BAMQC_JOBS, configFileDict["slurm_general"], "{}/log".format(OUTPUT_DIR), dryRun)
     ## COMBINE ALL bamStats files together 
     COMBINE_CMD = "python3 {bamStatCombineScript} -f {outputDIR}/*_bamStats -out {outputDIR}/AllSamples_samtoolsStats.csv".format(bamStatCombineScript = configFileDict['combineBamStatScript'], outputDIR = OUTPUT_DIR)
     SLURM_CMD = "{wsbatch} {slurm} -o {log_dir}/{uid}_slurm-%j.out --dependency=afterany:{JID} --wrap=\"{cmd}\"".format(wsbatch = configFileDict["wsbatch"], slurm = configFileDict["slurm_general"], log_dir = "{}/log".format(OUTPUT_DIR), uid = configFileDict["uid"], cmd = COMBINE_CMD, JID=BAMQC_WAIT)
     
-    if dryRun:
-        print(SLURM_CMD)
-        return "dryRun"
-    else:
-        out = subprocess.check_output(SLURM_CMD, shell=True, universal_newlines= True, stderr=subprocess.STDOUT)
-        BAMQC_WAIT = BAMQC_WAIT + "," + catchJID(out)
-        del BAMQC_JID_LIST
-        return BAMQC_WAIT 
+    out = submitJob(configFileDict, SLURM_CMD)
+    BAMQC_WAIT = BAMQC_WAIT + "," + catchJID(out)
+    return BAMQC_WAIT 
 
 def submitFastQC(configFileDict, dryRun=False):
-    FASTQC_JID_LIST = []
+    FASTQC_JOBS = []
     OUTPUT_DIR = configFileDict['fastQC_dir']
-    if '1' in configFileDict['task_list']: 
+    # With stream_trimming the trimmed reads are never written, only the raw fastq files are checked
+    trimmed = '1' in configFileDict['task_list'] and configFileDict.get('stream_trimming', "0").strip() != "1"
+    if trimmed: 
         DIRECTORIES = [configFileDict['fastq_dir'], configFileDict['trimmed_fastq_dir']]
     else:
         DIRECTORIES = [configFileDict['fastq_dir']]
     
     for DIR in DIRECTORIES:
-        fastq_files = glob.glob(f"{DIR}/*fastq.gz")
+        fastq_files = [fastq for sample in configFileDict['sample_prefix'] for read in ["R1", "R2"] for fastq in getSampleFastq(configFileDict, sample, read, DIR)]
         for fastq in fastq_files:
         
             FASTQC_CMD = "{fastqc} -o {output_dir} {fastq}".format(fastqc = configFileDict['FastQC'], output_dir = OUTPUT_DIR, fastq = fastq)
-            if '1' in configFileDict['task_list']:
-                SLURM_CMD = "{wsbatch} {slurm} -o {log_dir}/{uid}_slurm-%j.out --dependency=afterany:{JID} --wrap=\"{cmd}\"".format(wsbatch = configFileDict['wsbatch'], slurm = configFileDict['slurm_general'], log_dir = "{}/log".format(OUTPUT_DIR), uid = configFileDict['uid'],JID = configFileDict['TRIM_WAIT'], cmd = FASTQC_CMD)
-                #print(SLURM_CMD)
-            else: 
-                SLURM_CMD = "{wsbatch} {slurm} -o {log_dir}/{uid}_slurm-%j.out --wrap=\"{cmd}\"".format(wsbatch = configFileDict['wsbatch'], slurm = configFileDict['slurm_general'], log_dir = "{}/log".format(OUTPUT_DIR), uid = configFileDict['uid'], cmd = FASTQC_CMD)
-                #print(SLURM_CMD)
-            
-            if dryRun:
-                print(SLURM_CMD)
-            else:
-                out = subprocess.check_output(SLURM_CMD, shell=True, universal_newlines= True, stderr=subprocess.STDOUT)
-                FASTQC_JID_LIST.append(catchJID(out))
-                configFileDict['fastqQC_log_files'].append(getSlurmLog("{}/log".format(configFileDict["fastQC_dir"]),configFileDict['uid'],out))
+            JID = getSampleWait(configFileDict, 'TRIM_WAIT', getFastqSample(fastq)) if trimmed else ""
+            FASTQC_JOBS.append((os.path.basename(fastq), FASTQC_CMD, JID))
     
-    if dryRun:
-        return "dryRun"
-    else:
-        FASTQC_WAIT = ",".join(FASTQC_JID_LIST)
-        del FASTQC_JID_LIST
-        return FASTQC_WAIT
+    return submitSampleJobs(configFileDict, 'FASTQC_WAIT', 'fastqQC_log_files', FASTQC_JOBS, configFileDict["slurm_general"], "{}/log".format(OUTPUT_DIR), dryRun)
 
 def submitMultiQC(configFileDict, dryRun=False):
     MFASTQC_JID_LIST = []
@@ -801,21 +830,17 @@ def submitMultiQC(configFileDict, dryRun=False):
     SLURM_CMD = "{wsbatch} {slurm} -o {log_dir}/{uid}_slurm-%j.out --dependency=afterany:{JID} --wrap=\"{cmd}\"".format(wsbatch = configFileDict['wsbatch'], slurm = configFileDict['slurm_general'], log_dir = "{}/log".format(OUTPUT_DIR), uid = configFileDict['uid'],JID = configFileDict['FASTQC_WAIT'], cmd = cmd)
     #print(SLURM_CMD)
     
-    if dryRun:
-        print(SLURM_CMD)
-        return "dryRun"
-    else:
-        out = subprocess.check_output(SLURM_CMD, shell=True, universal_newlines= True, stderr=subprocess.STDOUT)
-        MFASTQC_JID_LIST.append(catchJID(out))
-                
-        configFileDict['multiqc_log_files'].append(getSlurmLog("{}/log".format(configFileDict["fastQC_dir"]),configFileDict['uid'],out))
-        
-        MFASTQC_WAIT = ",".join(MFASTQC_JID_LIST)
-        del MFASTQC_JID_LIST
-        return MFASTQC_WAIT
+    out = submitJob(configFileDict, SLURM_CMD)
+    MFASTQC_JID_LIST.append(catchJID(out))
+            
+    configFileDict['multiqc_log_files'].append(getSlurmLog("{}/log".format(configFileDict["fastQC_dir"]),configFileDict['uid'],out))
+    
+    MFASTQC_WAIT = ",".join(MFASTQC_JID_LIST)
+    del MFASTQC_JID_LIST
+    return MFASTQC_WAIT
 
 def submitQTLtoolsExonQuantification(configFileDict, BAM_FILES, dryRun=False):
-    QUANT_JID_LIST = []
+    QUANT_JOBS = []
     OUTPUT_DIR = configFileDict['quantification_dir']
     
     
@@ -827,28 +852,14 @@ def submitQTLtoolsExonQuantification(configFileDict, BAM_FILES, dryRun=False):
         
         QUAN_CMD = "{qtltools} quan --gtf {annotation} --bam {bam} --out-prefix {outputPrefix} --sample {smp} {quantOptions}".format(qtltools = configFileDict['QTLtools'], annotation = configFileDict['annotation'], bam = bam, outputPrefix = outputFile, smp = sampleName, quantOptions = configFileDict['quantOptions'])
         
-        if '2' in configFileDict['task_list'] : 
-           SLURM_CMD = "{wsbatch} {slurm} -o {log_dir}/{uid}_slurm-%j.out --dependency=afterany:{JID} --wrap=\"{cmd}\"".format(wsbatch = configFileDict['wsbatch'], slurm = configFileDict['slurm_general'], log_dir = "{}/log".format(OUTPUT_DIR), uid = configFileDict['uid'],JID = configFileDict['MAP_WAIT'], cmd = QUAN_CMD)
-        else: 
-            SLURM_CMD = "{wsbatch} {slurm} -o {log_dir}/{uid}_slurm-%j.out --wrap=\"{cmd}\"".format(wsbatch = configFileDict['wsbatch'], slurm = configFileDict['slurm_general'], log_dir = "{}/log".format(OUTPUT_DIR), uid = configFileDict['uid'],JID = configFileDict['MAP_WAIT'])
-        
-        if dryRun:
-            print(SLURM_CMD)
-        else:
-            out = subprocess.check_output(SLURM_CMD, shell=True, universal_newlines= True, stderr=subprocess.STDOUT)
-            QUANT_JID_LIST.append(catchJID(out))    
-            configFileDict['quant_log_files'].append(getSlurmLog("{}/log".format(configFileDict["quantification_dir"]),configFileDict['uid'],out))
+        JID = getSampleWait(configFileDict, 'MAP_WAIT', sampleName) if '2' in configFileDict['task_list'] else ""
+        QUANT_JOBS.append((sampleName, QUAN_CMD, JID))
     
-    if dryRun:
-        return "dryRun"   
-    else:
-        QUANT_WAIT = ",".join(QUANT_JID_LIST)
-        del QUANT_JID_LIST
-        return QUANT_WAIT
+    return submitSampleJobs(configFileDict, 'QUANT_WAIT', 'quant_log_files', QUANT_JOBS, configFileDict["slurm_general"], "{}/log".format(OUTPUT_DIR), dryRun)
 
 
 def submitFeatureCountsGeneQuantification(configFileDict, BAM_FILES, dryRun=False):
-    QUANT_JID_LIST = []
+    QUANT_JOBS = []
     OUTPUT_DIR = configFileDict['quantification_dir']
     
     
@@ -858,28 +869,16 @@ def submitFeatureCountsGeneQuantification(configFileDict, BAM_FILES, dryRun=Fals
         
         QUAN_CMD = "{bin} {quantOptions} -a {GTF} -o {outputFile}.raw.gene.count.txt {bamFile}".format(bin = configFileDict['featureCounts'], GTF = configFileDict['annotation'], outputFile = outputFile, bamFile = bam, quantOptions = configFileDict['quantOptions'])
         
-        if '2' in configFileDict['task_list'] : 
-            SLURM_CMD = "{wsbatch} {slurm} -o {log_dir}/{uid}_slurm-%j.out --dependency=afterany:{JID} --wrap=\"{cmd}\"".format(wsbatch = configFileDict['wsbatch'], slurm = configFileDict['slurm_general'], log_dir = "{}/log".format(OUTPUT_DIR), uid = configFileDict['uid'],JID = configFileDict['MAP_WAIT'], cmd = QUAN_CMD)
-        else: 
-            SLURM_CMD = "{wsbatch} {slurm} -o {log_dir}/{uid}_slurm-%j.out --wrap=\"{cmd}\"".format(wsbatch = configFileDict['wsbatch'], slurm = configFileDict['slurm_general'], log_dir = "{}/log".format(OUTPUT_DIR), uid = configFileDict['uid'], cmd = QUAN_CMD)
-        
-        if dryRun:
-            print(SLURM_CMD)
-        else:    
-            out = subprocess.check_output(SLURM_CMD, shell=True, universal_newlines= True, stderr=subprocess.STDOUT)
-            QUANT_JID_LIST.append(catchJID(out))
-            configFileDict['quant_log_files'].append(getSlurmLog("{}/log".format(configFileDict["quantification_dir"]),configFileDict['uid'],out))
+        JID = getSampleWait(configFileDict, 'MAP_WAIT', sampleName) if '2' in configFileDict['task_list'] else ""
+        QUANT_JOBS.append((sampleName, QUAN_CMD, JID))
+    
+    QUANT_WAIT = submitSampleJobs(configFileDict, 'QUANT_WAIT', 'quant_log_files', QUANT_JOBS, configFileDict["slurm_general"], "{}/log".format(OUTPUT_DIR), dryRun)
        
     ### SUBMIT COMBINE QUANTIFICATIONS TO MULTI-SAMPLE BED FILE
     COMBINEQUAN = "python3 {combineQuan} --file-list {outputDir}/*.txt --outputFile {outputDir}/Allsamples.chrALL.raw.gene.count.bed --gtf-file {gtfFile}".format(combineQuan = configFileDict['combineQuanScript'], outputDir = OUTPUT_DIR, gtfFile = configFileDict['annotation'])
     
-    slurm_cmd = "{wsbatch} {slurm} -o {log_dir}/{uid}_slurm-%j.out --dependency=afterany:{JID} --wrap=\"{cmd}\"".format(wsbatch = configFileDict['wsbatch'], slurm = configFileDict['slurm_general'], log_dir = "{}/log".format(OUTPUT_DIR), uid = configFileDict['uid'],JID = ",".join(QUANT_JID_LIST), cmd = COMBINEQUAN) 
+    slurm_cmd = "{wsbatch} {slurm} -o {log_dir}/{uid}_slurm-%j.out --dependency=afterany:{JID} --wrap=\"{cmd}\"".format(wsbatch = configFileDict['wsbatch'], slurm = configFileDict['slurm_general'], log_dir = "{}/log".format(OUTPUT_DIR), uid = configFileDict['uid'],JID = QUANT_WAIT, cmd = COMBINEQUAN) 
     
-    if dryRun:    
-        return "dryRun"
-    else:
-        out = subprocess.check_output(slurm_cmd, shell=True, universal_newlines= True, stderr=subprocess.STDOUT)
-        QUANT_JID_LIST.append(catchJID(out))
-        QUANT_WAIT = ",".join(QUANT_JID_LIST)
-        del QUANT_JID_LIST
-        return QUANT_WAIT
+    out = submitJob(configFileDict, slurm_cmd)
+    QUANT_WAIT += "," + catchJID(out)
+    return QUANT_WAIT
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+
+import argparse
+import itertools
+import subprocess
+
+
+def openReads(files):
+    """[Streams the decompressed reads of gzipped fastq files, one after the other, through gzip so that nothing is decompressed to disk]"""
+    return subprocess.Popen(["gzip", "-dc"] + files, stdout=subprocess.PIPE)
+
+def openChunk(fileName, compress):
+    return subprocess.Popen(f"{compress} > {fileName}", shell=True, stdin=subprocess.PIPE)
+
+def splitFastq(R1, R2, prefix, nChunks, block=10000, compress="gzip -1"):
+    """[Splits the reads of a sample into chunks with the same number of reads. Blocks of reads are dealt to the chunks in turn, the same way for R1 and R2 so that the mates of a pair stay in the same chunk]
+
+    Args:
+        R1 ([lst]): [R1 fastq files of the sample]
+        R2 ([lst]): [R2 fastq files of the sample, empty for single end reads]
+        prefix ([str]): [Prefix of the chunks, {prefix}.chunk{i}.R1.fastq.gz]
+        nChunks ([int]): [Number of chunks]
+        block ([int]): [Number of reads dealt at once to a chunk]
+        compress ([str]): [Command compressing a chunk from its standard input]
+
+    Returns:
+        [int]: [Number of reads (pairs) split]
+    """
+    reads = [openReads(files) for files in [R1, R2] if files]
+    chunks = [[openChunk(f"{prefix}.chunk{i}.{read}.fastq.gz", compress) for read in ["R1", "R2"][:len(reads)]] for i in range(nChunks)]
+    nReads = 0
+    for chunk in itertools.cycle(chunks):
+        lines = [list(itertools.islice(stream.stdout, 4 * block)) for stream in reads]
+        if len(set(len(mate) for mate in lines)) != 1:
+            raise ValueError("R1 and R2 do not have the same number of reads")
+        if not lines[0]:
+            break
+        for process, mate in zip(chunk, lines):
+            process.stdin.write(b"".join(mate))
+        nReads += len(lines[0]) // 4
+
+    failed = [stream.args for stream in reads if stream.wait() != 0]
+    for process in itertools.chain(*chunks):
+        process.stdin.close()
+        if process.wait() != 0:
+            failed.append(process.args)
+    if failed:
+        raise RuntimeError("Failed: {}".format(", ".join(str(args) for args in failed)))
+    return nReads
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Splits the fastq files of a sample into chunks mapped by independent jobs")
+    parser.add_argument('-1', dest='R1', type=str, nargs="+", required=True, help='R1 fastq files (gzipped) of the sample, in lane order')
+    parser.add_argument('-2', dest='R2', type=str, nargs="+", default=[], help='R2 fastq files (gzipped) of the sample, in the same order as R1')
+    parser.add_argument('-n', '--chunks', dest='chunks', type=int, required=True, help='Number of chunks')
+    parser.add_argument('-o', '--prefix', dest='prefix', type=str, required=True, help='Prefix of the chunks, {prefix}.chunk{i}.R1.fastq.gz')
+    parser.add_argument('-block', dest='block', type=int, default=10000, help='Number of reads dealt at once to a chunk. Default: 10000')
+    args = parser.parse_args()
+
+    nReads = splitFastq(args.R1, args.R2, args.prefix, args.chunks, args.block)
+    print(f"{nReads} reads split in {args.chunks} chunks")
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+
+import os.path
+import gzip
+import subprocess
+import argparse
+# ===========================================================================================================
+
+
+DESC_COMMENT = "Script to update a multisample peak count bed file with new samples"
+SCRIPT_NAME = "updatePeakCounts.py"
+# ===========================================================================================================
+
+"""
+#===============================================================================
+Script to update a multisample peak count bed file (AllSamples.chrALL.bed.gz) after
+new samples were added to a project. The samples already in the bed file keep their
+counts for the peaks of the new consensus peak set that did not change. Their BAM
+files are only counted again on the peaks that changed. The new samples are counted
+on all the peaks and appended as new columns.
+#===============================================================================
+"""
+
+
+def readGTF(gtf):
+    """[Reads the peaks of the consensus peak set in the gtf file created by counts2gtf.sh]
+
+    Returns:
+        [lst]: [(chr, start, end) of the peaks, start is 1-based as in featureCounts output]
+    """
+    peaks = []
+    with open(gtf, "rt") as f:
+        for line in (line.rstrip().split("\t") for line in f):
+            peaks.append((line[0], int(line[3]), int(line[4])))
+    return peaks
+
+def writeGTF(gtf, peaks, outputGTF):
+    """[Writes the lines of the gtf file corresponding to the given peaks]"""
+    peaks = set(peaks)
+    with open(gtf, "rt") as f, open(outputGTF, "w") as g:
+        for line in f:
+            fields = line.split("\t")
+            if (fields[0], int(fields[3]), int(fields[4])) in peaks:
+                g.write(line)
+
+def readPeakCountsBed(bed):
+    """[Reads a multisample peak count bed file created by combinePeakCounts.py]
+
+    Returns:
+        [tuple]: [list of samples and dictionary with the counts of each peak]
+    """
+    counts = {}
+    with gzip.open(bed, "rt") as f:
+        samples = f.readline().rstrip().split("\t")[6:]
+        for line in (line.rstrip().split("\t") for line in f):
+            counts[(line[0], int(line[1]) + 1, int(line[2]))] = line[6:]
+    return samples, counts
+
+def countReads(featureCounts, options, gtf, bam, outputFile):
+    """[Counts the reads of a BAM file in the peaks of a gtf file using featureCounts]
+
+    Returns:
+        [dict]: [counts of each peak]
+    """
+    cmd = "{featurecounts} {options} -a {gtf} -o {outputFile} {bam} -t exon -g gene_id".format(featurecounts = featureCounts, options = options, gtf = gtf, outputFile = outputFile, bam = bam)
+    subprocess.check_call(cmd, shell=True)
+    counts = {}
+    with open(outputFile, "rt") as f:
+        for line in (line.rstrip().split("\t") for line in f):
+            if line[0].startswith("#") or line[0] == "Geneid":
+                continue
+            counts[(line[1], int(line[2]), int(line[3]))] = line[6]
+    return counts
+
+def updatePeakCounts(gtf, bamFiles, previousBed, featureCounts, options, outputDir):
+    peaks = readGTF(gtf)
+    if os.path.exists(previousBed):
+        print(f"  * Reading [{previousBed}]")
+        old_samples, old_counts = readPeakCountsBed(previousBed)
+    else:
+        old_samples, old_counts = [], {}
+
+    bams = {os.path.basename(bam).split(".")[0]: bam for bam in bamFiles}
+    new_samples = [sample for sample in bams if sample not in old_samples]
+    changed = [peak for peak in peaks if peak not in old_counts]
+    print(f"  * {len(peaks) - len(changed)} unchanged peaks, {len(changed)} new or changed peaks, {len(new_samples)} new samples")
+
+    counts = {}
+    if old_samples and changed:
+        missing = [sample for sample in old_samples if sample not in bams]
+        if missing:
+            raise Exception("The BAM files of {} are needed to count the reads in the changed peaks".format(", ".join(missing)))
+        changedGTF = f"{outputDir}/changed_peaks.gtf"
+        writeGTF(gtf, changed, changedGTF)
+        for sample in old_samples:
+            print(f"  * Counting [{sample}] on the changed peaks")
+            counts[sample] = countReads(featureCounts, options, changedGTF, bams[sample], f"{outputDir}/{sample}.changed.counts.txt")
+    for sample in new_samples:
+        print(f"  * Counting [{sample}] on all peaks")
+        counts[sample] = countReads(featureCounts, options, gtf, bams[sample], f"{outputDir}/{sample}.counts.txt")
+
+    print("  * Combining all data into multisample bed file")
+    samples = old_samples + new_samples
+    with open(f"{outputDir}/AllSamples.chrALL.bed", "w") as g:
+        g.write("#chr\tstart\tend\tid\tinfo\tstrand\t" + "\t".join(samples) + "\n")
+        for peak in peaks:
+            chrom, start, end = peak
+            values = []
+            for i, sample in enumerate(samples):
+                if sample in old_samples and peak in old_counts:
+                    values.append(old_counts[peak][i])
+                else:
+                    values.append(counts[sample][peak])
+            id = f"{chrom}_{start}_{end}"
+            info = f"L={end-start};T=peaks;R={chrom}:{start}-{end}"
+            g.write(chrom + "\t" + str(start - 1) + "\t" + str(end) + "\t" + id + "\t" + info + "\t+\t" + "\t".join(values) + "\n")
+
+
+parser = argparse.ArgumentParser(description='Update a multisample peak count bed file with new samples.')
+parser.add_argument('-gtf', '--gtf-file', dest='gtf', required=True, type=str, help='gtf file of the new consensus peak set')
+parser.add_argument('-b', '--bam-files', dest='bams', required=True, type=str, nargs="+", help='BAM files of all the samples, already counted or not')
+parser.add_argument('-prev', '--previous-bed', dest='previousBed', required=True, type=str, help='Multisample peak count bed file of the previous run (AllSamples.chrALL.bed.gz)')
+parser.add_argument('-fc', '--featureCounts', dest='featureCounts', required=True, type=str, help='Path to featureCounts')
+parser.add_argument('-opt', '--featureCounts-options', dest='options', default="", type=str, help='featureCounts options')
+parser.add_argument('-od', '--output-dir', dest='outputDir', required=True, type=str, help='Output directory')
+
+####################
+#    CHECK ARGS    #
+####################
+
+if __name__ == "__main__":
+    #Get command line args
+    args = parser.parse_args()
+    updatePeakCounts(args.gtf, args.bams, args.previousBed, args.featureCounts, args.options, args.outputDir)
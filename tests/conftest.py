@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The pipeline modules are imported the way braunLP.py puts them on the path
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+for directory in ["pipeline_tools", "utils", "scripts", "mapping", ""]:
+    sys.path.insert(0, os.path.abspath(os.path.join(SRC, directory)))
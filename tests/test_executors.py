@@ -0,0 +1,100 @@
+import json
+
+import pytest
+
+from executors import LocalExecutor, PlanExecutor, parseSlurmCMD, getTimeLimit
+from jobCheck import check_exitCodes
+
+
+WSBATCH = "wsbatch --time=12:00:00 --mem=10G -c 4 -o /data/bam/log/UID_slurm-%j.out"
+
+
+def test_parseSlurmCMD_reads_the_options_and_the_command():
+    job = parseSlurmCMD(f"{WSBATCH} --dependency=afterok:1:2 --wrap=\"samtools index S1.bam\"")
+    assert job['cmd'] == "samtools index S1.bam"
+    assert job['log'] == "/data/bam/log/UID_slurm-%j.out"
+    assert (job['cpus'], job['mem'], job['time']) == (4, 10240, 43200)
+    assert job['conditions'] == [["afterok", ["1", "2"]]]
+    assert job['dependency'] == ["1", "2"]
+
+def test_parseSlurmCMD_repeated_condition_types_are_not_job_ids():
+    job = parseSlurmCMD(f"{WSBATCH} --dependency=afterany:34,afterany:35 --wrap=\"true\"")
+    assert job['conditions'] == [["afterany", ["34"]], ["afterany", ["35"]]]
+    assert job['dependency'] == ["34", "35"]
+
+def test_parseSlurmCMD_keeps_the_type_of_each_condition():
+    job = parseSlurmCMD(f"{WSBATCH} --dependency=afterok:3,4,afterany:2,singleton --wrap=\"true\"")
+    assert job['conditions'] == [["afterok", ["3", "4"]], ["afterany", ["2"]]]
+    assert job['dependency'] == ["3", "4", "2"]
+
+@pytest.mark.parametrize("time, seconds", [
+    ("30", 1800),
+    ("10:30", 630),
+    ("02:00:10", 7210),
+    ("1-12", 129600),
+    ("1-12:30", 131400),
+    ("2-00:00:05", 172805),
+])
+def test_getTimeLimit(time, seconds):
+    assert getTimeLimit(time) == seconds
+
+def test_getPlan_follows_the_dependencies_of_the_jobs(tmp_path, capsys):
+    executor = PlanExecutor({'raw_dir': str(tmp_path)})
+    bam, bed = tmp_path / "S1.bam", tmp_path / "S1.bed"
+    executor.submit(f"wsbatch --time=01:00:00 -c 2 --wrap=\"samtools sort -o {bam} S1.sam\"")
+    executor.submit(f"wsbatch --time=02:00:00 --dependency=afterok:1 --wrap=\"bedtools bamtobed -i {bam} > {bed}\"")
+    executor.submit(f"wsbatch --time=00:30:00 --dependency=afterany:1,afterany:2 --wrap=\"wc -l {bed}\"")
+    executor.describe("2", sample="S1", step="bam2bed")
+
+    plan = executor.getPlan()
+    jobs = {job['jid']: job for job in plan['jobs']}
+    assert jobs['2']['inputs'] == [str(bam)] and jobs['2']['outputs'] == [str(bed)]
+    assert jobs['2']['sample'] == "S1" and jobs['2']['step'] == "bam2bed"
+    assert jobs['3']['conditions'] == [["afterany", ["1"]], ["afterany", ["2"]]]
+    assert plan['summary']['critical_path'] == ["1", "2", "3"]
+    assert plan['summary']['critical_path_hours'] == 3.5
+    assert plan['summary']['core_hours'] == 4.5
+
+def test_writePartialPlan_only_writes_a_plan_not_written_yet(tmp_path, capsys):
+    executor = PlanExecutor({})
+    executor.writePartialPlan(str(tmp_path / "empty.json"))
+    assert not (tmp_path / "empty.json").exists()
+
+    executor.submit("wsbatch --time=10 --wrap=\"true\"")
+    executor.writePartialPlan(str(tmp_path / "plan.json"), str(tmp_path / "plan.dot"))
+    assert json.load(open(tmp_path / "plan.json"))['summary']['jobs'] == 1
+    assert (tmp_path / "plan.dot").exists()
+
+    executor.writePartialPlan(str(tmp_path / "again.json"))
+    assert not (tmp_path / "again.json").exists()
+
+def test_LocalExecutor_runs_the_jobs_in_order_within_the_budget(tmp_path):
+    executor = LocalExecutor(4, 64000)
+    times = tmp_path / "times"
+
+    def job(name, cpus, dependency=""):
+        cmd = f"echo {name} start {cpus} $(date +%s.%N) >> {times}; sleep 0.2; echo {name} end {cpus} $(date +%s.%N) >> {times}"
+        out = executor.submit(f"wsbatch -c {cpus} --mem=1G -o {tmp_path}/UID_slurm-%j.out {dependency} --wrap=\"{cmd}\"")
+        return out.split()[-1]
+
+    first = [job(f"first{i}", 2) for i in range(3)]
+    second = job("second", 2, f"--dependency=afterok:{first[0]}:{first[1]}")
+    third = job("third", 3, f"--dependency=afterany:{second}")
+    failed = executor.submit(f"wsbatch -c 1 --wrap=\"exit 1\"").split()[-1]
+    cancelled = job("cancelled", 1, f"--dependency=afterok:{failed}")
+    executor.wait()
+
+    events = {}
+    running = used = 0
+    for line in sorted(open(times), key=lambda line: float(line.split()[3])):
+        name, event, cpus, time = line.split()
+        events[(name, event)] = float(time)
+        running += int(cpus) if event == "start" else -int(cpus)
+        used = max(used, running)
+    assert used <= 4
+    assert events[("second", "start")] >= max(events[("first0", "end")], events[("first1", "end")])
+    assert events[("third", "start")] >= events[("second", "end")]
+    assert ("cancelled", "start") not in events
+    assert [executor.jobs[jid]['state'] for jid in first + [second, third, failed, cancelled]] == ["COMPLETED"] * 5 + ["FAILED", "CANCELLED"]
+    # The job summary is written for the report
+    assert check_exitCodes(str(tmp_path / f"UID_slurm-{second}.out"))
@@ -0,0 +1,19 @@
+from executors import writeJobSummary
+from jobCheck import check_exitCodes
+
+
+def test_check_exitCodes_reads_the_status_file_first(tmp_path):
+    logFile = str(tmp_path / "test_slurm-12.out")
+    writeJobSummary(logFile, "12", "FAILED", 1)
+    assert not check_exitCodes(logFile)
+    assert check_exitCodes(logFile, {logFile: {'Success': True}})
+
+def test_check_exitCodes_reads_the_job_summary_of_the_log_file(tmp_path):
+    logFile = tmp_path / "test_slurm-13.out"
+    assert not check_exitCodes(str(logFile))
+    logFile.write_text("")
+    assert not check_exitCodes(str(logFile))
+    logFile.write_text("still running\n")
+    assert not check_exitCodes(str(logFile))
+    writeJobSummary(str(logFile), "13", "COMPLETED", 0)
+    assert check_exitCodes(str(logFile))
@@ -0,0 +1,36 @@
+import pytest
+
+from resourceModel import HISTORY_COLUMNS, predict, tuneResources
+
+SLURM = "--mem=10G --time=12:00:00 -c 8"
+
+
+def writeHistory(path, rows):
+    path.write_text("\t".join(HISTORY_COLUMNS) + "\n" + "".join("\t".join(str(value) for value in row) + "\n" for row in rows))
+    return str(path)
+
+
+def test_predict_shifts_the_line_by_its_largest_underestimation():
+    assert predict([(1, 2), (2, 4), (3, 6)], 4) == 8
+    assert predict([(1, 1), (2, 3), (3, 2)], 4) == 4
+    # A resource never decreases with the input size
+    assert predict([(1, 3), (2, 2), (3, 1)], 10) == 3
+    assert predict([(5, 2), (5, 4)], 100) == 4
+
+def test_tuneResources_needs_resource_min_jobs(tmp_path):
+    history = writeHistory(tmp_path / "history.tsv", [["MAP_WAIT:bowtie2", 1e9, 2048, 1200, 1.5, "2024-01-01"]] * 4 + [["TRIM_WAIT:cutadapt", 1e9, 2048, 1200, 1.5, "2024-01-01"]] * 5)
+    configFileDict = {'resource_history': history, 'resource_min_jobs': "5"}
+    assert tuneResources(configFileDict, "MAP_WAIT:bowtie2", SLURM, 1e9) == SLURM
+    assert tuneResources({'resource_history': str(tmp_path / "missing.tsv")}, "MAP_WAIT:bowtie2", SLURM, 1e9) == SLURM
+    assert tuneResources(configFileDict, "TRIM_WAIT:cutadapt", SLURM, 1e9) == "--mem=3G --time=00:24:00 -c 2"
+
+@pytest.mark.parametrize("used, slurm, tuned", [
+    ((2048, 1200, 1.5), SLURM, "--mem=3G --time=00:24:00 -c 2"),
+    ((2048, 1200, 1.5), "--mem=2G -t 20 --cpus-per-task=1", "--mem=2G -t 20 --cpus-per-task=1"),
+    ((20000, 100000, 10), SLURM, SLURM),
+    ((20000, 1200, 10), SLURM, "--mem=10G --time=00:24:00 -c 8"),
+    ((2048, 100000, 1.5), "--mem=10G -t 60 -c 8", "--mem=3G -t 60 -c 2"),
+])
+def test_tuneResources_only_lowers_the_requests(tmp_path, used, slurm, tuned):
+    history = writeHistory(tmp_path / "history.tsv", [["MAP_WAIT:bowtie2", 1e9, *used, "2024-01-01"]] * 5)
+    assert tuneResources({'resource_history': history}, "MAP_WAIT:bowtie2", slurm, 1e9) == tuned
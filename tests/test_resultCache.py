@@ -0,0 +1,44 @@
+import os
+
+from resultCache import getUncachedJobs, isCached, readRecord, runCached, writeRecord
+
+
+def runJob(tmp_path):
+    inputFile, outputFile = tmp_path / "S1.bam", tmp_path / "S1.bed"
+    inputFile.write_text("reads\n")
+    cmd = f"cat {inputFile} > {outputFile}"
+    recordFile = str(tmp_path / "S1.BAM2BED_WAIT.cache.json")
+    writeRecord(recordFile, {'cmd': cmd})
+    assert runCached(recordFile) == 0
+    return cmd, recordFile, inputFile, outputFile
+
+
+def test_cache_hit_with_unchanged_files(tmp_path):
+    cmd, recordFile, inputFile, outputFile = runJob(tmp_path)
+    record = readRecord(recordFile)
+    assert list(record['done']['inputs']) == [str(inputFile)]
+    assert list(record['done']['outputs']) == [str(outputFile)]
+    assert isCached(record, cmd)
+    assert not isCached(record, cmd + " ")
+
+def test_cache_miss_when_an_input_changes(tmp_path):
+    cmd, recordFile, inputFile, outputFile = runJob(tmp_path)
+    inputFile.write_text("more reads\n")
+    assert not isCached(readRecord(recordFile), cmd)
+
+def test_cache_miss_when_an_output_changes(tmp_path):
+    cmd, recordFile, inputFile, outputFile = runJob(tmp_path)
+    stat = os.stat(outputFile)
+    os.utime(outputFile, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert not isCached(readRecord(recordFile), cmd)
+    outputFile.unlink()
+    assert not isCached(readRecord(recordFile), cmd)
+
+def test_getUncachedJobs_skips_the_cached_and_processed_jobs(tmp_path, capsys):
+    cmd, recordFile, inputFile, outputFile = runJob(tmp_path)
+    configFileDict = {'sample_prefix': ["A", "A.1", "S1"], 'processed_samples': ["A.1"]}
+    JOBS = [("A", "true", ""), ("A.S1_L001_001", "true", ""), ("A.1", "true", ""), ("A.1.chunk0", "true", ""), ("S1", cmd, ""), ("S1", cmd, "12")]
+
+    # A cached job waiting for other jobs is submitted, its inputs may still change
+    assert getUncachedJobs(configFileDict, 'BAM2BED_WAIT', JOBS, str(tmp_path), dryRun=True) == [("A", "true", ""), ("A.S1_L001_001", "true", ""), ("S1", cmd, "12")]
+    assert configFileDict['BAM2BED_WAIT_DICT'] == {'A.1': "", 'A.1.chunk0': "", 'S1': ""}
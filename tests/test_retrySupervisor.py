@@ -0,0 +1,58 @@
+import json
+import subprocess
+
+import pytest
+
+import retrySupervisor
+from retrySupervisor import escalate, isFinished, replaceJID, superviseRun
+
+SETTINGS = {'retry_max_attempts': "2", 'retry_mem_factor': "2", 'retry_time_factor': "2", 'retry_max_mem': "", 'retry_max_time': "", 'retry_interval': "0"}
+
+
+@pytest.mark.parametrize("SLURM_CMD, state, settings, escalated", [
+    ("wsbatch --mem=10G --time=01:00:00 --wrap=\"sort --mem=10G\"", "OUT_OF_MEMORY", {}, "wsbatch --mem=20G --time=01:00:00 --wrap=\"sort --mem=10G\""),
+    ("wsbatch --mem=10G --time=01:00:00 --wrap=\"true\"", "OUT_OF_MEMORY", {'retry_max_mem': "16G"}, "wsbatch --mem=16G --time=01:00:00 --wrap=\"true\""),
+    ("wsbatch --mem=16G --wrap=\"true\"", "OUT_OF_MEMORY", {'retry_max_mem': "16G"}, None),
+    ("wsbatch --mem=10G --time=12:00:00 --wrap=\"true\"", "TIMEOUT", {}, "wsbatch --mem=10G --time=1-00:00:00 --wrap=\"true\""),
+    ("wsbatch --mem=10G --time=12:00:00 --wrap=\"true\"", "TIMEOUT", {'retry_max_time': "18:00:00"}, "wsbatch --mem=10G --time=18:00:00 --wrap=\"true\""),
+    ("wsbatch -t 90 --mem=10G --wrap=\"true\"", "TIMEOUT", {}, "wsbatch -t 03:00:00 --mem=10G --wrap=\"true\""),
+    ("wsbatch -t 1-00:00:00 --wrap=\"true\"", "TIMEOUT", {'retry_max_time': "1-00:00:00"}, None),
+    ("wsbatch --mem=10G --wrap=\"true\"", "TIMEOUT", {}, None),
+])
+def test_escalate(SLURM_CMD, state, settings, escalated):
+    assert escalate(SLURM_CMD, state, dict(SETTINGS, **settings)) == escalated
+
+def test_replaceJID_only_replaces_the_job_id():
+    assert replaceJID("wsbatch --dependency=afterok:1:12 --wrap=\"cat /data/1\"", "1", "30") == "wsbatch --dependency=afterok:30:12 --wrap=\"cat /data/1\""
+    assert replaceJID("wsbatch --dependency=afterok:12,1,afterany:1 --wrap=\"true\"", "1", "30") == "wsbatch --dependency=afterok:12,30,afterany:30 --wrap=\"true\""
+    assert replaceJID("wsbatch --dependency=aftercorr:21 --wrap=\"true\"", "1", "30") == "wsbatch --dependency=aftercorr:21 --wrap=\"true\""
+
+def test_isFinished_on_array_tasks():
+    assert isFinished("5", {'5_0': ("COMPLETED", ""), '5_1': ("RUNNING", "")}) is None
+    assert isFinished("5", {'5_0': ("COMPLETED", ""), '5_1': ("COMPLETED", "")}) == "COMPLETED"
+    assert isFinished("5", {'5_0': ("OUT_OF_MEMORY", ""), '5_1': ("COMPLETED", "")}) == "OUT_OF_MEMORY"
+    assert isFinished("5", {'50_0': ("COMPLETED", "")}) is None
+    assert isFinished("6", {'6': ("PENDING", "")}) is None
+    assert isFinished("6", {'6': ("FAILED", "")}) == "FAILED"
+
+def test_superviseRun_resubmits_and_moves_the_waiting_jobs(tmp_path, monkeypatch, capsys):
+    logList = tmp_path / "log_files.txt"
+    logList.write_text("/data/test_slurm-10.out\n/data/test_slurm-11.out\n")
+    jobs = {
+        '10': {'cmd': "wsbatch --mem=10G -o /data/test_slurm-%j.out --wrap=\"map\"", 'managed': True, 'retry': True, 'shared': False, 'attempt': 1},
+        '11': {'cmd': "wsbatch --dependency=afterok:10 --wrap=\"filter\"", 'managed': True, 'retry': False, 'shared': False, 'attempt': 1},
+    }
+    retryFile = tmp_path / "retry_jobs.json"
+    retryFile.write_text(json.dumps({'uid': "test", 'settings': SETTINGS, 'files': [str(logList)], 'jobs': jobs}))
+
+    polls = iter([{'10': ("OUT_OF_MEMORY", ""), '11': ("PENDING", "")}, {'11': ("PENDING", ""), '20': ("RUNNING", "")}, {'11': ("COMPLETED", ""), '20': ("COMPLETED", "")}])
+    submitted, commands = [], []
+    monkeypatch.setattr(retrySupervisor, "pollJobs", lambda JIDs: next(polls))
+    monkeypatch.setattr(subprocess, "check_output", lambda cmd, **kwargs: submitted.append(cmd) or "Submitted batch job 20\n")
+    monkeypatch.setattr(subprocess, "run", lambda cmd, **kwargs: commands.append(cmd))
+
+    assert superviseRun(str(retryFile), str(tmp_path / "retries.tsv")) == 1
+    assert submitted == ["wsbatch --mem=20G -o /data/test_slurm-%j.out --wrap=\"map\""]
+    assert commands == ["scontrol update JobId=11 Dependency=afterok:20"]
+    assert logList.read_text() == "/data/test_slurm-20.out\n/data/test_slurm-11.out\n"
+    assert (tmp_path / "retries.tsv").read_text().splitlines()[1].split("\t")[1:] == ["10", "OUT_OF_MEMORY", "--mem=10G", "20", "--mem=20G", "2"]
@@ -0,0 +1,75 @@
+import pytest
+
+from run_STAR_2pass import getLimitSjdbInsertNsj, mergeJunctions, readChromosomes, runJunctionMerge
+
+
+# chr10 comes before chr2 in the genome, the SJ.out.tab files follow the order of chrName.txt
+SAMPLE1 = [
+    "chr1\t100\t200\t1\t1\t0\t2\t0\t20",
+    "chr1\t300\t400\t2\t2\t1\t5\t1\t30",
+    "chr10\t50\t80\t1\t1\t0\t4\t2\t15",
+    "chr2\t10\t90\t1\t1\t0\t1\t0\t12",
+]
+SAMPLE2 = [
+    "chr1\t100\t200\t1\t1\t0\t2\t1\t25",
+    "chr1\t150\t250\t1\t1\t0\t1\t0\t10",
+    "chr10\t50\t80\t1\t1\t0\t0\t3\t40",
+    "chr2\t10\t90\t1\t1\t0\t1\t0\t8",
+]
+
+
+@pytest.fixture
+def firstPass(tmp_path):
+    genome = tmp_path / "genome"
+    genome.mkdir()
+    (genome / "chrName.txt").write_text("chr1\nchr10\nchr2\n")
+    files = []
+    for name, junctions in [("S1", SAMPLE1), ("S2", SAMPLE2)]:
+        (tmp_path / f"{name}.SJ.out.tab").write_text("".join(f"{junction}\n" for junction in junctions))
+        files.append(str(tmp_path / f"{name}.SJ.out.tab"))
+    return genome, files
+
+
+def test_mergeJunctions_sums_the_reads_of_the_samples(firstPass):
+    genome, files = firstPass
+    merged = ["\t".join(junction) for junction in mergeJunctions(files, readChromosomes(str(genome)))]
+    assert merged == [
+        "chr1\t100\t200\t1\t1\t0\t4\t1\t25",
+        "chr1\t150\t250\t1\t1\t0\t1\t0\t10",
+        "chr1\t300\t400\t2\t2\t1\t5\t1\t30",
+        "chr10\t50\t80\t1\t1\t0\t4\t5\t40",
+        "chr2\t10\t90\t1\t1\t0\t2\t0\t12",
+    ]
+
+def test_mergeJunctions_rejects_unsorted_files(firstPass, tmp_path):
+    genome, files = firstPass
+    (tmp_path / "S3.SJ.out.tab").write_text("".join(f"{junction}\n" for junction in reversed(SAMPLE1)))
+    with pytest.raises(ValueError, match="not sorted"):
+        list(mergeJunctions(files + [str(tmp_path / "S3.SJ.out.tab")], readChromosomes(str(genome))))
+
+@pytest.mark.parametrize("nJunctions, limit", [
+    (0, 1000000),
+    (999999, 1000000),
+    (1000000, 1100000),
+    (1234567, 1300000),
+    (19999999, 20000000),
+])
+def test_getLimitSjdbInsertNsj(nJunctions, limit):
+    assert getLimitSjdbInsertNsj(nJunctions) == limit
+
+def test_runJunctionMerge_writes_the_second_pass_files(firstPass, tmp_path):
+    genome, files = firstPass
+    (tmp_path / "sjdbList.out.tab").write_text("chr1\t300\t400\t+\n" * 1200000)
+    prefix = str(tmp_path / "out" / "run_")
+    (tmp_path / "out").mkdir()
+
+    counts = runJunctionMerge(files, str(genome), prefix, minUnique=2, sjdbLists=[str(tmp_path / "sjdbList.out.tab"), str(tmp_path / "missing.tab")])
+    # The annotated junction and the ones with less than 2 unique reads are not inserted
+    assert counts == {'merged': 5, 'filtered': 3, 'annotated': 1200000, 'limitSjdbInsertNsj': 1300000}
+    assert (tmp_path / "out" / "run_filtered.tab").read_text().splitlines() == [
+        "chr1\t100\t200\t1\t1\t0\t4\t1\t25",
+        "chr10\t50\t80\t1\t1\t0\t4\t5\t40",
+        "chr2\t10\t90\t1\t1\t0\t2\t0\t12",
+    ]
+    assert len((tmp_path / "out" / "run_merged.tab").read_text().splitlines()) == 5
+    assert (tmp_path / "out" / "run_parameters.txt").read_text() == f"sjdbFileChrStartEnd {prefix}filtered.tab\nlimitSjdbInsertNsj 1300000\n"
@@ -0,0 +1,59 @@
+from preflight import checkFastqPairs
+from sampleManifest import buildManifest, getProcessedSamples, getSampleFastq, getSampleUnits
+
+
+def makeRun(tmp_path, names):
+    fastq = tmp_path / "fastq"
+    fastq.mkdir()
+    for name in names:
+        (fastq / name).write_bytes(b"")
+    configFileDict = {'filtered_bam_dir': str(tmp_path / "filtered_bam"), 'peaks_dir': str(tmp_path / "peaks")}
+    buildManifest(configFileDict, str(fastq))
+    return configFileDict
+
+
+def test_processed_samples_need_filtered_bam_and_peaks(tmp_path):
+    configFileDict = makeRun(tmp_path, [f"{sample}_S1_L001_R1_001.fastq.gz" for sample in ["S1", "S2", "S3", "Input_ctrl"]])
+    (tmp_path / "filtered_bam").mkdir()
+    for sample in ["S1", "S2", "Input_ctrl"]:
+        (tmp_path / "filtered_bam" / f"{sample}.QualTrim_NoDup_NochrM_SortedByCoord.bam").write_bytes(b"")
+    (tmp_path / "peaks" / "S1.MACS").mkdir(parents=True)
+    (tmp_path / "peaks" / "S1.MACS" / "S1_peaks.narrowPeak").write_bytes(b"")
+
+    # S2 has no peaks yet and S3 no BAM file, the Input samples have no peaks
+    assert getProcessedSamples(configFileDict) == ["Input_ctrl", "S1"]
+
+def test_no_processed_samples_without_filtered_bam_dir(tmp_path):
+    configFileDict = makeRun(tmp_path, ["S1_S1_L001_R1_001.fastq.gz"])
+    del configFileDict['filtered_bam_dir']
+    assert getProcessedSamples(configFileDict) == []
+
+def test_groups_are_searched_in_the_sample_ids(tmp_path):
+    fastq = tmp_path / "fastq"
+    fastq.mkdir()
+    for name in ["WT_rep1_S1_L001_R1_001.fastq.gz", "KO_rep1_S2_L001_R1_001.fastq.gz", "KO_rep1_S2_L002_R1_001.fastq.gz"]:
+        (fastq / name).write_bytes(b"")
+    configFileDict = {'groups': "WT|KO|S2"}
+    manifest = buildManifest(configFileDict, str(fastq))
+
+    # S2 is only the sample number of the KO_rep1 fastq files
+    assert manifest['groups'] == {'WT': ["WT_rep1"], 'KO': ["KO_rep1"], 'S2': []}
+    assert manifest['samples']['KO_rep1']['groups'] == ["KO"]
+
+def test_sample_sequenced_on_two_flowcells(tmp_path):
+    names = [f"A_{unit}_{read}_001.fastq.gz" for unit in ["S1_L001", "S1_L002", "S5_L001"] for read in ["R1", "R2"]]
+    configFileDict = makeRun(tmp_path, names)
+    manifest = configFileDict['sample_manifest']
+
+    assert sorted(manifest['samples']['A']['lanes']) == ["S1_L001", "S1_L002", "S5_L001"]
+    assert [unit for unit, R1, R2 in getSampleUnits(configFileDict, "A")] == ["S1_L001_001", "S5_L001_001", "S1_L002_001"]
+    assert [path.split("/")[-1] for path in getSampleFastq(configFileDict, "A", "R2")] == ["A_S1_L001_R2_001.fastq.gz", "A_S5_L001_R2_001.fastq.gz", "A_S1_L002_R2_001.fastq.gz"]
+    assert checkFastqPairs(manifest, True) == []
+
+def test_preflight_flags_colliding_and_missing_fastq_files(tmp_path):
+    configFileDict = makeRun(tmp_path, ["A_S1_L001_R1_001.fastq.gz", "A_S1_L001_R1_002.fastq.gz", "A_S1_L001_R2_001.fastq.gz", "A_S1_L001_R2_002.fastq.gz", "A_S5_L001_R1_001.fastq.gz"])
+    assert checkFastqPairs(configFileDict['sample_manifest'], True) == [
+        ("ERROR", "A: several R1 fastq files for lane S1_L001: A_S1_L001_R1_001.fastq.gz, A_S1_L001_R1_002.fastq.gz"),
+        ("ERROR", "A: several R2 fastq files for lane S1_L001: A_S1_L001_R2_001.fastq.gz, A_S1_L001_R2_002.fastq.gz"),
+        ("ERROR", f"A: no R2 fastq file for lane S5_L001 in {tmp_path}/fastq"),
+    ]
@@ -0,0 +1,57 @@
+import os
+
+import pytest
+
+import scratchStaging
+from scratchStaging import copyVerified, runStaged
+
+
+@pytest.fixture
+def dirs(tmp_path):
+    shared, scratch = tmp_path / "shared", tmp_path / "scratch"
+    shared.mkdir()
+    scratch.mkdir()
+    (shared / "S1.bam").write_text("reads\n")
+    (shared / "S1.bam.bai").write_text("index\n")
+    return shared, scratch
+
+def badChecksum(path):
+    return "0" * 32
+
+
+def test_copyVerified(tmp_path):
+    (tmp_path / "source").write_bytes(os.urandom(1000))
+    copyVerified(str(tmp_path / "source"), str(tmp_path / "destination"))
+    assert (tmp_path / "destination").read_bytes() == (tmp_path / "source").read_bytes()
+    assert not (tmp_path / "destination.staging").exists()
+
+def test_copyVerified_checksum_mismatch(tmp_path, monkeypatch):
+    monkeypatch.setattr(scratchStaging, "md5sum", badChecksum)
+    (tmp_path / "source").write_text("reads\n")
+    with pytest.raises(IOError, match="checksum"):
+        copyVerified(str(tmp_path / "source"), str(tmp_path / "destination"))
+    assert sorted(os.listdir(tmp_path)) == ["source"]
+
+def test_runStaged_rewrites_the_paths_and_copies_back_the_outputs(dirs, capsys):
+    shared, scratch = dirs
+    reference = shared / "genome.fa"
+    reference.write_text(">chr1\n")
+    cmd = f"cat {shared}/S1.bam > {shared}/S1.bed && ls {shared}/S1.bam.bai && echo {shared}/S1.bam {reference} > {shared}/paths.txt"
+
+    assert runStaged(cmd, str(scratch), [str(reference)]) == 0
+    assert (shared / "S1.bed").read_text() == "reads\n"
+    # The inputs and outputs were read and written in the scratch directory, the excluded reference stayed on the shared filesystem
+    staged, excluded = (shared / "paths.txt").read_text().split()
+    assert staged.startswith(f"{scratch}/braunLP_") and staged.endswith("/S1.bam")
+    assert excluded == str(reference)
+    assert os.listdir(scratch) == []
+
+def test_runStaged_keeps_the_scratch_copy_on_checksum_mismatch(dirs, monkeypatch, capsys):
+    shared, scratch = dirs
+    monkeypatch.setattr(scratchStaging, "md5sum", badChecksum)
+
+    assert runStaged(f"cat {shared}/S1.bam > {shared}/S1.bed", str(scratch), []) == 1
+    assert not (shared / "S1.bed").exists()
+    [workDir] = os.listdir(scratch)
+    assert [name for root, dirs, files in os.walk(scratch / workDir) for name in files if name == "S1.bed"] == ["S1.bed"]
+    assert f"outputs are kept in {scratch / workDir}" in capsys.readouterr().out
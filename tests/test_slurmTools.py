@@ -0,0 +1,61 @@
+import pytest
+
+import executors
+from executors import LocalExecutor, PlanExecutor
+from slurmTools import catchJID, getArrayDependency, submitInLanes
+
+
+def getConcurrency(timesFile):
+    """[Returns the largest number of jobs running at the same time from the start and end times they wrote]"""
+    events = []
+    for line in open(timesFile):
+        event, time = line.split()
+        events.append((float(time), 1 if event == "start" else -1))
+    running = maximum = 0
+    for time, change in sorted(events):
+        running += change
+        maximum = max(maximum, running)
+    return maximum
+
+def useExecutor(monkeypatch, executor):
+    monkeypatch.setattr(executors, "EXECUTOR", executor)
+    return executor
+
+
+def test_io_steps_share_the_io_budget(tmp_path, monkeypatch):
+    executor = useExecutor(monkeypatch, LocalExecutor(8, 64000))
+    configFileDict = {'wsbatch': "wsbatch", 'uid': "test", 'executor': "local", 'max_concurrent_io': "2", 'io_steps': "filter_bam bam2bed"}
+    cmd = f"echo start $(date +%s.%N) >> {tmp_path}/times; sleep 0.3; echo end $(date +%s.%N) >> {tmp_path}/times"
+    JOBS = [(cmd, "-c 1", "") for i in range(3)]
+
+    FILTER = [catchJID(out) for out in submitInLanes(configFileDict, 'FILTER_BAM_WAIT', JOBS, str(tmp_path))]
+    BED = [catchJID(out) for out in submitInLanes(configFileDict, 'BAM2BED_WAIT', JOBS, str(tmp_path))]
+    executor.wait()
+
+    # The jobs of the second step take the slots freed by the first one
+    assert [executor.jobs[jid]['dependency'] for jid in FILTER + BED] == [[], [], [FILTER[0]], [FILTER[1]], [FILTER[2]], [BED[0]]]
+    assert all(job['state'] == "COMPLETED" for job in executor.jobs.values())
+    assert getConcurrency(tmp_path / "times") <= 2
+
+def test_step_limit_and_io_budget(tmp_path, monkeypatch, capsys):
+    executor = useExecutor(monkeypatch, PlanExecutor({}))
+    configFileDict = {'wsbatch': "wsbatch", 'uid': "test", 'dry_run': "1", 'max_concurrent_io': "3", 'max_concurrent_trim': "1"}
+    OUTS = submitInLanes(configFileDict, 'TRIM_WAIT', [("true", "-c 1", "5") for i in range(3)], str(tmp_path))
+
+    # Each trimming job waits for the previous one (max_concurrent_trim) and takes its own slot of the I/O budget
+    assert [executor.jobs[catchJID(out)]['conditions'] for out in OUTS] == [
+        [["afterany", ["5"]]],
+        [["afterany", ["5"]], ["afterany", ["1"]]],
+        [["afterany", ["5"]], ["afterany", ["2"]]],
+    ]
+    assert configFileDict['io_slots'] == ["1", "2", "3"]
+
+@pytest.mark.parametrize("autoRetry, chained, other", [
+    ("0", "--dependency=afterany:7_0,7_1,7_2", "--dependency=afterany:3,4"),
+    ("1", "--dependency=aftercorr:7 --kill-on-invalid-dep=no", "--dependency=afterok:3,4 --kill-on-invalid-dep=no"),
+])
+def test_getArrayDependency_uses_the_dependency_type_of_the_single_jobs(autoRetry, chained, other):
+    configFileDict = {'auto_retry': autoRetry}
+    assert getArrayDependency(configFileDict, [(f"S{i}", "true", f"7_{i}") for i in range(3)]) == chained
+    assert getArrayDependency(configFileDict, [("S0", "true", "3,4"), ("S1", "true", "4"), ("S2", "true", "")]) == other
+    assert getArrayDependency(configFileDict, [("S0", "true", ""), ("S1", "true", "")]) == ""
@@ -0,0 +1,78 @@
+import gzip
+import os
+import stat
+
+import pytest
+
+from updatePeakCounts import readPeakCountsBed, updatePeakCounts
+
+# featureCounts stand-in: counts 7 reads on each peak of the gtf file (-a) and writes them in the featureCounts format (-o)
+FEATURECOUNTS = """#!/usr/bin/env python3
+import sys
+args = sys.argv[1:]
+gtf, output = args[args.index("-a") + 1], args[args.index("-o") + 1]
+with open(gtf) as f, open(output, "w") as g:
+    g.write("# Program:featureCounts\\nGeneid\\tChr\\tStart\\tEnd\\tStrand\\tLength\\tsample\\n")
+    for line in f:
+        fields = line.split("\\t")
+        g.write("\\t".join([fields[0] + "_" + fields[3], fields[0], fields[3], fields[4], "+", "1", "7"]) + "\\n")
+"""
+
+
+def writeGTF(path, peaks):
+    with open(path, "w") as g:
+        for chrom, start, end in peaks:
+            g.write(f"{chrom}\tpeaks\texon\t{start}\t{end}\t.\t+\t.\tgene_id \"{chrom}_{start}_{end}\";\n")
+
+def writeBed(path, samples, counts):
+    with gzip.open(path, "wt") as g:
+        g.write("#chr\tstart\tend\tid\tinfo\tstrand\t" + "\t".join(samples) + "\n")
+        for (chrom, start, end), values in counts.items():
+            g.write(f"{chrom}\t{start - 1}\t{end}\t{chrom}_{start}_{end}\tinfo\t+\t" + "\t".join(values) + "\n")
+
+def readOutput(outputDir):
+    path = f"{outputDir}/AllSamples.chrALL.bed"
+    with open(path, "rb") as f, gzip.open(path + ".gz", "wb") as g:
+        g.write(f.read())
+    return readPeakCountsBed(path + ".gz")
+
+def fakeFeatureCounts(tmp_path):
+    path = tmp_path / "featureCounts"
+    path.write_text(FEATURECOUNTS)
+    path.chmod(path.stat().st_mode | stat.S_IEXEC)
+    return str(path)
+
+
+def test_unchanged_peaks_keep_their_counts_in_gtf_order(tmp_path):
+    gtf = tmp_path / "peaks.gtf"
+    writeGTF(gtf, [("chr1", 101, 200), ("chr2", 11, 50)])
+    writeBed(tmp_path / "previous.bed.gz", ["A", "B"], {("chr2", 11, 50): ["5", "6"], ("chr1", 101, 200): ["1", "2"]})
+
+    updatePeakCounts(str(gtf), ["/data/A.QualTrim_NoDup_NochrM_SortedByCoord.bam", "/data/B.QualTrim_NoDup_NochrM_SortedByCoord.bam"], str(tmp_path / "previous.bed.gz"), "false", "", str(tmp_path))
+
+    samples, counts = readOutput(tmp_path)
+    assert samples == ["A", "B"]
+    assert list(counts) == [("chr1", 101, 200), ("chr2", 11, 50)]
+    assert counts == {("chr1", 101, 200): ["1", "2"], ("chr2", 11, 50): ["5", "6"]}
+
+def test_new_samples_and_changed_peaks_are_counted(tmp_path):
+    gtf = tmp_path / "peaks.gtf"
+    writeGTF(gtf, [("chr1", 101, 200), ("chr1", 301, 400)])
+    writeBed(tmp_path / "previous.bed.gz", ["A"], {("chr1", 101, 200): ["3"], ("chr1", 301, 350): ["4"]})
+
+    updatePeakCounts(str(gtf), ["/data/A.bam", "/data/C.bam"], str(tmp_path / "previous.bed.gz"), fakeFeatureCounts(tmp_path), "", str(tmp_path))
+
+    samples, counts = readOutput(tmp_path)
+    assert samples == ["A", "C"]
+    # A keeps its count on the unchanged peak and is counted again on the changed one, C is counted on all the peaks
+    assert counts == {("chr1", 101, 200): ["3", "7"], ("chr1", 301, 400): ["7", "7"]}
+    assert os.path.exists(tmp_path / "A.changed.counts.txt")
+    assert not os.path.exists(tmp_path / "A.counts.txt")
+
+def test_changed_peaks_need_the_bam_files_of_the_previous_samples(tmp_path):
+    gtf = tmp_path / "peaks.gtf"
+    writeGTF(gtf, [("chr1", 101, 250)])
+    writeBed(tmp_path / "previous.bed.gz", ["A"], {("chr1", 101, 200): ["3"]})
+
+    with pytest.raises(Exception, match="The BAM files of A"):
+        updatePeakCounts(str(gtf), ["/data/C.bam"], str(tmp_path / "previous.bed.gz"), fakeFeatureCounts(tmp_path), "", str(tmp_path))